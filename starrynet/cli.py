@@ -163,8 +163,8 @@ class CLI(Cmd):
         "list the LLA of a node at a certain time"
         arg, args, line = self.parseline(line)
         rest = line.split(' ')
-        LLA = self.sn.get_position(int(rest[0]), int(rest[1]))
-        output("The LLA is: " + str(LLA))
+        LLA = self.sn.get_position(int(rest[0]), float(rest[1]))
+        output("The LLA is: " + ",".join("%f" % v for v in LLA) + "\n")
 
     def do_get_IP(self, line):
         "list the IP of a node"
@@ -0,0 +1,123 @@
+#encoding: utf-8
+"""
+Content-addressed cache of the Observer artifacts. A run is keyed by the
+hash of everything the artifacts depend on (constellation, GSes, duration,
+resolution, link parameters and the source of the modules producing them),
+so an unchanged experiment copies its timeline instead of recomputing it.
+Entries are directories named by the key; the least recently used ones are
+evicted once the cache grows beyond its size cap.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import sgp4
+
+from starrynet.sn_propagator import *
+from starrynet.sn_timeline import *
+
+# modules whose code determines the artifacts
+ARTIFACT_SOURCES = ['sn_observer.py', 'sn_propagator.py', 'sn_timeline.py']
+# seconds after which an unfinished store (.tmp<pid> entry) is removed
+CACHE_STALE_TMP = 24 * 3600
+
+
+def sn_artifact_files(path):
+    return [
+        sn_timeline_path(path),
+        sn_position_path(path),
+        sn_events_path(path),
+        sn_events_index_path(path)
+    ]
+
+
+def sn_file_digest(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def sn_code_version():
+    digest = hashlib.sha256(sgp4.__version__.encode())
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in ARTIFACT_SOURCES:
+        with open(os.path.join(directory, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def sn_artifact_key(params):
+    # params: JSON-serializable description of the run
+    text = json.dumps([params, sn_code_version()], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def sn_cache_size(cache_dir):
+    size = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            size += os.path.getsize(os.path.join(root, name))
+    return size
+
+
+def sn_cache_fetch(cache_dir, key, path):
+    # Copies a cached run into path, returns False on a miss.
+    entry = os.path.join(cache_dir, key)
+    files = sn_artifact_files(path)
+    if not all(
+            os.path.exists(os.path.join(entry, os.path.basename(file)))
+            for file in files):
+        return False
+    for file in files:
+        # copies rather than links: a later run may rewrite them in place
+        shutil.copyfile(os.path.join(entry, os.path.basename(file)), file)
+    # the directory mtime is the LRU clock
+    os.utime(entry, None)
+    return True
+
+
+def sn_cache_store(cache_dir, key, path, size_cap):
+    # Adds the artifacts of path, then evicts the least recently used
+    # entries until the cache fits in size_cap bytes. Artifacts larger
+    # than size_cap are not stored. Returns whether they were.
+    files = sn_artifact_files(path)
+    size = sum(os.path.getsize(file) for file in files)
+    if size > size_cap:
+        print("Not caching the run: its " + str(size) +
+              " bytes exceed the cache size cap of " + str(size_cap) + ".")
+        return False
+    entry = os.path.join(cache_dir, key)
+    tmp = entry + ".tmp" + str(os.getpid())
+    os.makedirs(tmp, exist_ok=True)
+    for file in files:
+        shutil.copyfile(file, os.path.join(tmp, os.path.basename(file)))
+    if os.path.exists(entry):
+        shutil.rmtree(entry)
+    os.rename(tmp, entry)
+    os.utime(entry, None)
+    sn_cache_evict(cache_dir, size_cap)
+    return True
+
+
+def sn_cache_evict(cache_dir, size_cap, stale_after=CACHE_STALE_TMP):
+    # The .tmp<pid> directories of stores in progress (in this or another
+    # process) are left alone, unless untouched for stale_after seconds.
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if not os.path.isdir(entry):
+            continue
+        if ".tmp" not in name:
+            entries.append(entry)
+        elif time.time() - os.path.getmtime(entry) > stale_after:
+            print("Removing the stale cache store " + name)
+            shutil.rmtree(entry, ignore_errors=True)
+    sizes = {entry: sn_cache_size(entry) for entry in entries}
+    total = sum(sizes.values())
+    for entry in sorted(entries, key=os.path.getmtime):
+        if total <= size_cap:
+            break
+        print("Evicting cached run " + os.path.basename(entry))
+        shutil.rmtree(entry)
+        total -= sizes[entry]
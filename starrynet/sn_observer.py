@@ -1,15 +1,95 @@
 #encoding: utf-8
+from concurrent.futures import ProcessPoolExecutor
 import math
-from sgp4.api import Satrec, WGS84
-from skyfield.api import load, wgs84, EarthSatellite
-from datetime import datetime
+import multiprocessing
 import numpy as np
 import os
+import threading
 
+from starrynet.sn_cache import *
+from starrynet.sn_propagator import *
+from starrynet.sn_timeline import *
 from starrynet.sn_utils import *
 
 _ = inf = 999999  # inf
 
+LIGHT_SPEED_RATIO = 17.31 / 29.5 * 299792.458  # km/s, delay = dist / c
+# Upper bound of time x GS x satellite cells computed at once, which keeps
+# the GSL kernel of a chunk within a few hundred MB.
+CHUNK_CELLS = 1 << 24
+# Smallest incremental window (timesteps): a window must cover the
+# samples the handovers at its end are interpolated from.
+MIN_WINDOW = 8
+
+
+# GS-to-satellite links for all timesteps. sat_cbf/sat_lla: (time, sat, 3).
+# Returns (time, GS, antenna_num) satellite indexes (-1 for no link) and the
+# corresponding delays in ms.
+def sn_gsl_delays(sat_cbf, sat_lla, fac_cbf, fac_ll, bound_dis, alpha,
+                  antenna_num):
+    duration, sat_num = sat_cbf.shape[0], sat_cbf.shape[1]
+    fac_num = len(fac_ll)
+    gsl_sat = np.full((duration, fac_num, antenna_num), -1, dtype=np.int64)
+    gsl_delay = np.zeros((duration, fac_num, antenna_num))
+    if fac_num == 0 or antenna_num <= 0:
+        return gsl_sat, gsl_delay
+    fac_cbf = np.asarray(fac_cbf, dtype=np.float64)
+    fac_lat = np.array([float(ll[0]) for ll in fac_ll])
+    # (time, GS, sat)
+    dx = sat_cbf[:, None, :, 0] - fac_cbf[None, :, None, 0]
+    dy = sat_cbf[:, None, :, 1] - fac_cbf[None, :, None, 1]
+    dz = sat_cbf[:, None, :, 2] - fac_cbf[None, :, None, 2]
+    dist = np.sqrt(np.square(dx) + np.square(dy) + np.square(dz))
+    del dx, dy, dz
+    sat_lat = sat_lla[:, None, :, 0]
+    access = (sat_lat >= (fac_lat - alpha)[None, :, None]) & (
+        sat_lat <= (fac_lat + alpha)[None, :, None]) & (dist < bound_dis)
+    dist = np.where(access, dist, np.inf)
+    if antenna_num < sat_num:
+        nearest = np.argpartition(dist, antenna_num - 1,
+                                  axis=2)[:, :, :antenna_num]
+    else:
+        nearest = np.broadcast_to(np.arange(sat_num),
+                                  (duration, fac_num, sat_num))
+    nearest_dist = np.take_along_axis(dist, nearest, axis=2)
+    width = nearest.shape[2]
+    linked = np.isfinite(nearest_dist)
+    gsl_sat[:, :, :width] = np.where(linked, nearest, -1)
+    gsl_delay[:, :, :width] = np.where(
+        linked, nearest_dist / LIGHT_SPEED_RATIO * 1000, 0)  # ms
+    return gsl_sat, gsl_delay
+
+
+# +Grid ISL delays in ms as (time, sat, 2): column 0 is the intra-orbit
+# link to the next slot, column 1 the inter-orbit link to the next orbit.
+def sn_isl_delays(sat_cbf, num_orbits, num_sats_per_orbit):
+    duration = sat_cbf.shape[0]
+    grid = sat_cbf.reshape(duration, num_orbits, num_sats_per_orbit, 3)
+    isl_delay = np.empty((duration, num_orbits * num_sats_per_orbit, 2))
+    for col, axis in ((0, 2), (1, 1)):
+        d = grid - np.roll(grid, -1, axis=axis)
+        isl_delay[:, :, col] = (np.sqrt(
+            np.square(d[..., 0]) + np.square(d[..., 1]) +
+            np.square(d[..., 2])) / LIGHT_SPEED_RATIO * 1000).reshape(
+                duration, -1)  # ms
+    return isl_delay
+
+
+# Dense (sat_num + fac_num)^2 delay matrix of one timestep.
+def sn_delay_matrix(gsl_sat, gsl_delay, isl_delay, fac_num, sat_num,
+                    num_orbits, num_sats_per_orbit):
+    delay_matrix = np.zeros((fac_num + sat_num, fac_num + sat_num))
+    sats = np.arange(sat_num)
+    down, right = sn_isl_peers(num_orbits, num_sats_per_orbit)
+    delay_matrix[sats, down] = isl_delay[:, 0]
+    delay_matrix[down, sats] = isl_delay[:, 0]
+    delay_matrix[sats, right] = isl_delay[:, 1]
+    delay_matrix[right, sats] = isl_delay[:, 1]
+    fac, slot = np.nonzero(gsl_sat >= 0)
+    delay_matrix[sat_num + fac, gsl_sat[fac, slot]] = gsl_delay[fac, slot]
+    delay_matrix[gsl_sat[fac, slot], sat_num + fac] = gsl_delay[fac, slot]
+    return delay_matrix
+
 # To calculate the connection between satellites and GSes in time_in
 # fac_num: number of GSes
 
@@ -20,7 +100,11 @@ class Observer():
                  satellite_altitude, orbit_number, sat_number,
                  orbit_start_long, orbit_spacing, duration, resolution,
                  antenna_number, GS_lat_long, antenna_inclination,
-                 intra_routing, hello_interval, AS):
+                 intra_routing, hello_interval, AS, topology_layout='sparse',
+                 sat_bandwidth=5, sat_ground_bandwidth=5, sat_loss=1,
+                 sat_ground_loss=1, workers=1, cache_dir='', cache_size=0,
+                 tle_file='', propagator='sgp4', cycle=0, epsilon=0,
+                 lookahead=0):
         self.file_path = file_path
         self.configuration_file_path = configuration_file_path
         self.inclination = inclination
@@ -37,83 +121,170 @@ class Observer():
         self.intra_routing = intra_routing
         self.hello_interval = hello_interval
         self.AS = AS
+        self.topology_layout = topology_layout
+        self.sat_bandwidth = sat_bandwidth
+        self.sat_ground_bandwidth = sat_ground_bandwidth
+        self.sat_loss = sat_loss
+        self.sat_ground_loss = sat_ground_loss
+        # precompute processes, 0 for one per CPU
+        self.workers = workers if workers > 0 else os.cpu_count()
+        # artifact cache, disabled when cache_size (bytes) is 0
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        # constellation from a TLE catalog instead of a Walker shell
+        self.tle_file = tle_file
+        # 'sgp4', or 'j2' for the analytic circular orbits of a Walker shell
+        self.propagator = propagator
+        if self.tle_file and self.propagator != 'sgp4':
+            print("TLE constellations are propagated with SGP4.")
+            self.propagator = 'sgp4'
+        # orbital period (s) used to reuse the ISL delays, 0 to disable
+        self.cycle = cycle
+        # adaptive timeline: delay change (ms) that stores a new keyframe,
+        # GSL handovers placed to the second. 0 samples uniformly.
+        self.epsilon = epsilon
+        # incremental mode: seconds of topology generated ahead of the
+        # emulation clock, 0 to precompute the whole duration
+        self.lookahead = lookahead
+        self.window = None
 
+    # Fills the timesteps first + 1 ... first + duration of the timeline
+    # created by calculate_delay.
     def access_P_L_shortest(self, sat_cbf, fac_cbf, fac_num, sat_num,
                             num_orbits, num_sats_per_orbit, duration, fac_ll,
-                            sat_lla, bound_dis, alpha, antenna_num, path):
-        delay_matrix = np.zeros((fac_num + sat_num, fac_num + sat_num))
-        for cur_time in range(duration):
-            for i in range(0, fac_num):
-                access_list = {}
-                fac_lat = float(fac_ll[i][0])  # latitude
-                up_lat = fac_lat + alpha  # bound
-                down_lat = fac_lat - alpha
-                x2 = fac_cbf[i][0]
-                y2 = fac_cbf[i][1]
-                z2 = fac_cbf[i][2]
-                for j in range(0, sat_num):
-                    if sat_lla[cur_time][j][0] >= down_lat and sat_lla[
-                            cur_time][j][0] <= up_lat:
-                        x1 = sat_cbf[cur_time][j][0]  # in km
-                        y1 = sat_cbf[cur_time][j][1]
-                        z1 = sat_cbf[cur_time][j][2]
-                        dist = math.sqrt(
-                            np.square(x1 - x2) + np.square(y1 - y2) +
-                            np.square(z1 - z2))
-                        if dist < bound_dis:
-                            # [satellite index，distance]
-                            access_list.update({j: dist})
-                if len(access_list) > antenna_num:
-                    sorted_access_list = dict(
-                        sorted(access_list.items(), key=lambda item: item[1]))
-                    cnt = 0
-                    for key, value in sorted_access_list.items():
-                        cnt = cnt + 1
-                        if cnt > antenna_num:
-                            break
-                        delay_time = value / (17.31 / 29.5 *
-                                              299792.458) * 1000  # ms
-                        delay_matrix[sat_num + i][key] = delay_time
-                        delay_matrix[key][sat_num + i] = delay_time
-                elif len(access_list) != 0:
-                    for key, value in access_list.items():
-                        delay_time = value / (17.31 / 29.5 *
-                                              299792.458) * 1000  # ms
-                        delay_matrix[sat_num + i][key] = delay_time
-                        delay_matrix[key][sat_num + i] = delay_time
-            for i in range(num_orbits):
-                for j in range(num_sats_per_orbit):
-                    num_sat1 = i * num_sats_per_orbit + j
-                    x1 = sat_cbf[cur_time][num_sat1][0]  # km
-                    y1 = sat_cbf[cur_time][num_sat1][1]
-                    z1 = sat_cbf[cur_time][num_sat1][2]
-                    num_sat2 = i * num_sats_per_orbit + (
-                        j + 1) % num_sats_per_orbit
-                    x2 = sat_cbf[cur_time][num_sat2][0]  # km
-                    y2 = sat_cbf[cur_time][num_sat2][1]
-                    z2 = sat_cbf[cur_time][num_sat2][2]
-                    num_sat3 = ((i + 1) % num_orbits) * num_sats_per_orbit + j
-                    x3 = sat_cbf[cur_time][num_sat3][0]  # km
-                    y3 = sat_cbf[cur_time][num_sat3][1]
-                    z3 = sat_cbf[cur_time][num_sat3][2]
-                    delay1 = math.sqrt(
-                        np.square(x1 - x2) + np.square(y1 - y2) +
-                        np.square(z1 - z2)) / (17.31 / 29.5 *
-                                               299792.458) * 1000  # ms
-                    delay2 = math.sqrt(
-                        np.square(x1 - x3) + np.square(y1 - y3) +
-                        np.square(z1 - z3)) / (17.31 / 29.5 *
-                                               299792.458) * 1000  # ms
-                    delay_matrix[num_sat1][num_sat2] = delay1
-                    delay_matrix[num_sat2][num_sat1] = delay1
-                    delay_matrix[num_sat1][num_sat3] = delay2
-                    delay_matrix[num_sat3][num_sat1] = delay2
-            np.savetxt(path + "/delay/" + str(cur_time + 1) + ".txt",
-                       delay_matrix,
-                       fmt='%.2f',
-                       delimiter=',')
-            for i in range(len(delay_matrix)):
-                delay_matrix[i, ...] = 0
+                            sat_lla, bound_dis, alpha, antenna_num, path,
+                            first=0):
+        sat_cbf = np.asarray(sat_cbf, dtype=np.float64)
+        sat_lla = np.asarray(sat_lla, dtype=np.float64)
+        gsl_sat, gsl_delay = sn_gsl_delays(sat_cbf, sat_lla, fac_cbf, fac_ll,
+                                           bound_dis, alpha, antenna_num)
+        timeline = Timeline(sn_timeline_path(path), 'r+')
+        if timeline.layout == LAYOUT_DENSE:
+            isl_delay = sn_isl_delays(sat_cbf, num_orbits,
+                                      num_sats_per_orbit)
+            for cur_time in range(duration):
+                delay_matrix = sn_delay_matrix(gsl_sat[cur_time],
+                                               gsl_delay[cur_time],
+                                               isl_delay[cur_time], fac_num,
+                                               sat_num, num_orbits,
+                                               num_sats_per_orbit)
+                sn_store_delay(timeline.matrices, first + cur_time + 1,
+                               delay_matrix)
+            timeline.matrices.flush()
+        else:
+            # ISLs only up to the end of the first orbital cycle
+            isl_rows = min(max(timeline.isl_period - first, 0), duration)
+            isl_delay = []
+            if isl_rows:
+                isl_delay = sn_isl_delays(sat_cbf[:isl_rows], num_orbits,
+                                          num_sats_per_orbit)
+            for cur_time in range(duration):
+                sn_store_links(
+                    timeline, first + cur_time + 1, gsl_sat[cur_time],
+                    gsl_delay[cur_time],
+                    isl_delay[cur_time] if cur_time < len(isl_delay) else None)
+            timeline.records.flush()
+            timeline.isl_block.flush()
+        del timeline
+
+    def compute_chunk(self, path, first, last, fac_cbf, bound_dis, alpha):
+        # Propagates the samples first ... last - 1 and writes their slices
+        # of the position and delay stores. Runs in a worker process, so the
+        # satellites are rebuilt there (Satrec objects can not be pickled).
+        if self.propagator == 'j2':
+            sat_teme, sat_cbf, sat_lla = sn_j2_propagate(
+                self.inclination, self.satellite_altitude, self.orbit_number,
+                self.sat_number, self.orbit_start_long, self.orbit_spacing,
+                last - first, self.resolution, first)
+        else:
+            satrecs, start = self.satrecs()
+            # (time, sat, 3) arrays, Cartesian coordinates come straight
+            # from SGP4
+            sat_teme, sat_cbf, sat_lla = sn_propagate(
+                satrecs, last - first, self.resolution, first, start)
+        sn_store_positions(path, first, sat_cbf)
+        self.access_P_L_shortest(sat_cbf, fac_cbf, len(self.GS_lat_long),
+                                 self.sat_number * self.orbit_number,
+                                 self.orbit_number, self.sat_number,
+                                 last - first, self.GS_lat_long, sat_lla,
+                                 bound_dis, alpha, self.antenna_number, path,
+                                 first)
+
+    def satrecs(self):
+        # satellites (index = orbit * sat_number + slot) and emulation start
+        if self.tle_file:
+            return sn_tle_satrecs(self.tle_file, self.inclination,
+                                  self.satellite_altitude, self.orbit_number,
+                                  self.sat_number)
+        return sn_walker_satrecs(
+            self.inclination, self.satellite_altitude, self.orbit_number,
+            self.sat_number, self.orbit_start_long,
+            self.orbit_spacing), EMULATION_START
+
+    def isl_period(self):
+        # Timesteps after which the ISL geometry of a circular Walker shell
+        # repeats (it only depends on the orbital phase, not on the Earth
+        # rotation), 0 to store the ISLs of every timestep.
+        if self.cycle <= 0 or self.tle_file or self.topology_layout != 'sparse':
+            return 0
+        if self.cycle % self.resolution != 0:
+            print("Cycle " + str(self.cycle) + " s is not a multiple of the " +
+                  str(self.resolution) + " s resolution, ISLs are not reused.")
+            return 0
+        period = self.cycle // self.resolution
+        if period >= self.duration:
+            return 0
+        slip = abs(self.cycle - sn_walker_period(self.inclination,
+                                                 self.satellite_altitude))
+        if slip > self.resolution:
+            print("ISLs are reused every " + str(self.cycle) + " s, %.1f s " %
+                  slip + "off the nodal period of the shell per cycle.")
+        return period
+
+    def time_chunks(self, first=0, last=None):
+        # [first, last) sample ranges, at least one per worker
+        if last is None:
+            last = self.duration
+        cells = self.orbit_number * self.sat_number * max(
+            len(self.GS_lat_long), 1)
+        size = min(math.ceil((last - first) / self.workers),
+                   max(CHUNK_CELLS // cells, 1))
+        return [(start, min(start + size, last))
+                for start in range(first, last, size)]
+
+    def compute_range(self, path, first, last, fac_cbf, bound_dis, alpha):
+        # Every chunk writes its own slice of the stores, the boundaries are
+        # stitched by the diff of the timeline that follows.
+        chunks = self.time_chunks(first, last)
+        if self.workers == 1 or len(chunks) == 1:
+            for start, end in chunks:
+                self.compute_chunk(path, start, end, fac_cbf, bound_dis,
+                                   alpha)
+            return
+        # spawned, as the incremental windows are computed from a thread
+        with ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [
+                executor.submit(self.compute_chunk, path, start, end,
+                                fac_cbf, bound_dis, alpha)
+                for start, end in chunks
+            ]
+            for future in futures:
+                future.result()
+
+    def window_size(self):
+        # timesteps per incremental window, 0 to precompute everything
+        if self.lookahead <= 0:
+            return 0
+        size = max(math.ceil(self.lookahead / self.resolution), MIN_WINDOW)
+        return size if size < self.duration else 0
+
+    def __getstate__(self):
+        # chunk workers get the parameters, not the running window
+        state = self.__dict__.copy()
+        state['window'] = None
+        return state
 
     def to_cbf(self, lat_long,
                length):  # the xyz coordinate system. length: number of nodes
@@ -147,179 +318,186 @@ class Observer():
         return bound_distance
 
     def matrix_to_change(self, duration, orbit_number, sat_number, path,
-                         GS_lat_long):
-        no_fac = len(GS_lat_long)
-        no_geo = 0
-        duration = duration - 1
-        no_leo = orbit_number * sat_number
-
-        topo_duration = [[[0 for i in range(no_leo + no_geo + no_fac)]
-                          for i in range(no_leo + no_geo + no_fac)]
-                         for k in range(duration)]
-        for time in range(1, duration + 1):
-            topo_path = path + '/delay/' + str(time) + ".txt"
-            adjacency_matrix = sn_get_param(topo_path)
-            for i in range(len(adjacency_matrix)):
-                for j in range(len(adjacency_matrix[i])):
-                    if float(adjacency_matrix[i][j]) > 0:
-                        adjacency_matrix[i][j] = 1
-                    else:
-                        adjacency_matrix[i][j] = 0
-            topo_duration[time - 1] = adjacency_matrix
-
-        changetime = []
-        Duration = []
-        for i in range(duration - 1):
-            l1 = topo_duration[i]
-            l2 = topo_duration[i + 1]
-            if l1 == l2:
-                continue
+                         GS_lat_long, handover=None):
+        # Stream over consecutive timesteps, holding only two link masks, and
+        # log every ISL and GSL change with the parameters it is set up with.
+        # handover, (fac_cbf, bound_dis, alpha), places each GSL change at
+        # the second it happens between the two samples.
+        timeline = Timeline(sn_timeline_path(path))
+        events = TopologyEventWriter(path, self.resolution)
+        positions = self.handover_positions(path, handover)
+        # time started from 1
+        self.diff_timesteps(timeline, events, 2, duration,
+                            timeline.link_mask(1), positions, handover)
+        events.close(self.duration)
+
+    def handover_positions(self, path, handover):
+        # positions the handovers are bisected on, None to keep them on the
+        # sampling grid
+        if handover is None or self.resolution <= 1:
+            return None
+        return PositionStore(sn_position_path(path))
+
+    def diff_timesteps(self, timeline, events, first, last, pre_mask,
+                       positions, handover):
+        # Logs the changes of timesteps first ... last - 1 against pre_mask,
+        # the link mask of timestep first - 1. Returns the last link mask.
+        sat_num = self.orbit_number * self.sat_number
+        for time in range(first, last):
+            if timeline.keyframe(time) == timeline.keyframe(time - 1):
+                continue  # same record, same links
+            now_mask = timeline.link_mask(time)
+            changed = np.nonzero(pre_mask ^ now_mask)[0]
+            if len(changed) != 0:
+                a, b = timeline.mask_links(changed)
+                delay = timeline.link_delays(time)[changed]
+                removed = pre_mask[changed]
+                second = np.full(len(changed), time * self.resolution)
+                if positions is not None:
+                    for k in np.nonzero(b >= sat_num)[0].tolist():
+                        second[k] = self.handover_second(
+                            positions, b[k] - sat_num, a[k], time,
+                            not removed[k], *handover)
+                for at in np.unique(second).tolist():
+                    keep = second == at
+                    events.write(
+                        time,
+                        self.link_events(a, b, delay, removed & keep,
+                                         sat_num),
+                        self.link_events(a, b, delay, ~removed & keep,
+                                         sat_num), at)
+            pre_mask = now_mask
+        return pre_mask
+
+    def handover_second(self, positions, fac, sat, time_index, linked,
+                        fac_cbf, bound_dis, alpha):
+        # First second after timestep time_index - 1 at which GS fac is
+        # (linked) or is no longer linked to satellite sat, by bisection on
+        # positions interpolated between the samples of the two timesteps.
+        lo, hi = 0, self.resolution
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            ecef = positions.ecef_at(time_index - 2 + mid / self.resolution)
+            gsl_sat, _ = sn_gsl_delays(ecef[None],
+                                       sn_ecef_to_lla(ecef)[None],
+                                       fac_cbf[fac:fac + 1],
+                                       self.GS_lat_long[fac:fac + 1],
+                                       bound_dis, alpha, self.antenna_number)
+            if (sat in gsl_sat[0, 0]) == linked:
+                hi = mid
             else:
-                changetime.append(i)
-        pretime = 0
-        for item in changetime:
-            Duration.append(item - pretime)
-            pretime = item
-        Duration.append(60)
-
-        topo_leo_change_path = path + "/Topo_leo_change.txt"
-        f = open(topo_leo_change_path, "w")
-        cnt = 1
-        for i in range(duration - 1):
-            pre_lines = topo_duration[i]
-            now_lines = topo_duration[i + 1]
-            if pre_lines == now_lines:
+                lo = mid
+        return (time_index - 1) * self.resolution + hi
+
+    def link_events(self, a, b, delay, keep, sat_num):
+        # (node_a, node_b, delay, bw, loss), 1-based, by node_b then node_a
+        events = []
+        for k in np.lexsort((a, b)):
+            if not keep[k]:
                 continue
+            if b[k] >= sat_num:
+                bw, loss = self.sat_ground_bandwidth, self.sat_ground_loss
             else:
-                f.write("time " + str(i + 2) + ":\n")  # time started from 1
-                f.write('duration ' + str(Duration[cnt]) + ":\n")
-                cnt += 1
-                f.write("del:\n")
-                for j in range(no_fac):
-                    prelines = pre_lines[no_geo + no_leo + j]
-                    nowlines = now_lines[no_geo + no_leo + j]
-                    for k in range(no_geo + no_leo + no_fac):
-                        if prelines[k] == 1 and nowlines[k] == 0:
-                            f.write(
-                                str(k + 1) + "-" + str(no_leo + j + 1) +
-                                "\n")  # index
-                f.write("add:\n")
-                for j in range(no_fac):
-                    prelines = pre_lines[no_geo + no_leo + j]
-                    nowlines = now_lines[no_geo + no_leo + j]
-                    for k in range(no_geo + no_leo + no_fac):
-                        if prelines[k] == 0 and nowlines[k] == 1:
-                            f.write(
-                                str(k + 1) + "-" + str(no_leo + j + 1) +
-                                "\n")  # index
-        f.write("time " + str(self.duration) + ":\n")  #
-        f.write("end of the emulation! \n")  #
-        f.close()
-        cnt = 1
+                bw, loss = self.sat_bandwidth, self.sat_loss
+            events.append((a[k] + 1, b[k] + 1, delay[k], bw, loss))
+        return events
 
     def calculate_delay(self):
         path = self.configuration_file_path + "/" + self.file_path
-        sat_cbf = [
-        ]  # first dimension: time. second dimension: node. third dimension: xyz
-        sat_lla = [
-        ]  # first dimension: time. second dimension: node. third dimension: lla
         fac_cbf = []  # first dimension: node. second dimension: xyz
 
-        if os.path.exists(path + '/delay') == True:
-            osstr = "rm -f " + path + "/delay/*"
-            os.system(osstr)
-        else:
+        if os.path.exists(path) == False:
             os.system("mkdir " + path)
-            os.system("mkdir " + path + "/delay")
         if os.path.exists(path + '/position') == True:
-            osstr = "rm -f " + path + "/position/*"
+            osstr = "rm -rf " + path + "/position"
             os.system(osstr)
-        else:
-            os.system("mkdir " + path + "/position")
+        key = None
+        if self.cache_size > 0:
+            key = sn_artifact_key(self.artifact_params())
+            if sn_cache_fetch(self.cache_dir, key, path):
+                print("Timeline " + key[:12] + " loaded from " +
+                      self.cache_dir)
+                return
+        if os.path.exists(sn_timeline_path(path)) == True:
+            os.remove(sn_timeline_path(path))
 
-        ts = load.timescale()
-        since = datetime(1949, 12, 31, 0, 0, 0)
-        start = datetime(2020, 1, 1, 0, 0, 0)
-        epoch = (start - since).days
         inclination = self.inclination * 2 * np.pi / 360
-        GM = 3.9860044e14
-        R = 6371393
-        altitude = self.satellite_altitude * 1000
-        mean_motion = np.sqrt(GM / (R + altitude)**3) * 60
-        num_of_orbit = self.orbit_number
-        sat_per_orbit = self.sat_number
-        num_of_sat = num_of_orbit * sat_per_orbit
-        F = 18
         bound_dis = self.calculate_bound(
             self.antenna_inclination, self.satellite_altitude) * 29.5 / 17.31
 
-        duration = self.duration  # second
-        result = [[] for i in range(duration)]  # LLA result
-        lla_per_sec = [[] for i in range(duration)]  # LLA result
-
-        for i in range(num_of_orbit):  # range(num_of_orbit)
-            if self.orbit_spacing > 0:
-                raan = self.orbit_start_long + i * (self.orbit_spacing * np.pi / 180)
-            else:
-                raan = i / num_of_orbit * 2 * np.pi
-            for j in range(sat_per_orbit):  # range(sat_per_orbit)
-                mean_anomaly = (j * 360 / sat_per_orbit + i * 360 * F /
-                                num_of_sat) % 360 * 2 * np.pi / 360
-                satrec = Satrec()
-                satrec.sgp4init(
-                    WGS84,  # gravity model
-                    'i',  # 'a' = old AFSPC mode, 'i' = improved mode
-                    i * sat_per_orbit + j,  # satnum: Satellite number
-                    epoch,  # epoch: days since 1949 December 31 00:00 UT
-                    2.8098e-05,  # bstar: drag coefficient (/earth radii)
-                    6.969196665e-13,  # ndot: ballistic coefficient (revs/day)
-                    0.0,  # nddot: second derivative of mean motion (revs/day^3)
-                    0.001,  # ecco: eccentricity
-                    0.0,  # argpo: argument of perigee (radians)
-                    inclination,  # inclo: inclination (radians)
-                    mean_anomaly,  # mo: mean anomaly (radians)
-                    mean_motion,  # no_kozai: mean motion (radians/minute)
-                    raan,  # nodeo: right ascension of ascending node (radians)
-                )
-                sat = EarthSatellite.from_satrec(satrec, ts)
-                cur = datetime(2022, 1, 1, 1, 0, 0)
-                t_ts = ts.utc(*cur.timetuple()[:5],
-                              range(0,duration*self.resolution,self.resolution))  # [:4]:minute，[:5]:second
-                geocentric = sat.at(t_ts)
-                subpoint = wgs84.subpoint(geocentric)
-                # list: [subpoint.latitude.degrees] [subpoint.longitude.degrees] [subpoint.elevation.km]
-                for t in range(duration):
-                    lla = '%f,%f,%f\n' % (subpoint.latitude.degrees[t],
-                                          subpoint.longitude.degrees[t],
-                                          subpoint.elevation.km[t])
-                    result[t].append(lla)
-                    lla = []
-                    lla.append(subpoint.latitude.degrees[t])
-                    lla.append(subpoint.longitude.degrees[t])
-                    lla.append(subpoint.elevation.km[t])
-                    lla_per_sec[t].append(lla)
-
-        for t in range(duration):
-            file = path + '/position/' + '%d.txt' % t
-            with open(file, 'w') as fw:
-                fw.writelines(result[t])
-            cbf_per_sec = self.to_cbf(lla_per_sec[t], num_of_sat)
-            sat_cbf.append(cbf_per_sec)
-            sat_lla.append(lla_per_sec[t])
+        if self.topology_layout == 'dense':
+            sn_create_timeline(sn_timeline_path(path),
+                               len(self.GS_lat_long) + self.sat_number *
+                               self.orbit_number, self.duration,
+                               self.resolution)
+        else:
+            sn_create_sparse_timeline(sn_timeline_path(path),
+                                      self.orbit_number, self.sat_number,
+                                      len(self.GS_lat_long),
+                                      self.antenna_number, self.duration,
+                                      self.resolution, self.isl_period())
+        sn_create_positions(path, self.duration,
+                            self.sat_number * self.orbit_number)
 
         if len(self.GS_lat_long) != 0:
-            fac_cbf = self.to_cbf(self.GS_lat_long, len(self.GS_lat_long))
+            fac_cbf = sn_geodetic_to_ecef(self.GS_lat_long)
 
         alpha = np.degrees(
             np.arccos(6371 / (6371 + self.satellite_altitude) *
                       np.cos(np.radians(inclination)))) - inclination
-        self.access_P_L_shortest(sat_cbf, fac_cbf, len(self.GS_lat_long),
-                                 self.sat_number * self.orbit_number,
-                                 self.orbit_number, self.sat_number,
-                                 self.duration, self.GS_lat_long, sat_lla,
-                                 bound_dis, alpha, self.antenna_number, path)
+        if self.propagator == 'j2':
+            error = sn_j2_error(self.inclination, self.satellite_altitude,
+                                self.orbit_number, self.sat_number,
+                                self.orbit_start_long, self.orbit_spacing,
+                                self.duration, self.resolution)
+            print("J2 propagator: at most %.1f km (%.3f ms) from SGP4." %
+                  (error, error / LIGHT_SPEED_RATIO * 1000))
+        window = self.window_size()
+        if window:
+            # the first window now, the next ones in the background
+            self.window = sn_Topology_Window_Thread(self, path, fac_cbf,
+                                                    bound_dis, alpha, window)
+            self.window.fill()
+            self.window.start()
+            return
+        self.compute_range(path, 0, self.duration, fac_cbf, bound_dis, alpha)
+        handover = None
+        if self.epsilon > 0:
+            keyframes = sn_compact_timeline(sn_timeline_path(path),
+                                            self.epsilon)
+            print("Adaptive timeline: " + str(keyframes) + " of " +
+                  str(self.duration) + " timesteps stored.")
+            handover = (fac_cbf, bound_dis, alpha)
         self.matrix_to_change(self.duration, self.orbit_number,
-                              self.sat_number, path, self.GS_lat_long)
+                              self.sat_number, path, self.GS_lat_long,
+                              handover)
+        if key is not None:
+            sn_cache_store(self.cache_dir, key, path, self.cache_size)
+
+    def artifact_params(self):
+        # everything the timeline, positions and event log depend on
+        return {
+            'inclination': self.inclination,
+            'satellite_altitude': self.satellite_altitude,
+            'orbit_number': self.orbit_number,
+            'sat_number': self.sat_number,
+            'orbit_start_long': self.orbit_start_long,
+            'orbit_spacing': self.orbit_spacing,
+            'duration': self.duration,
+            'resolution': self.resolution,
+            'antenna_number': self.antenna_number,
+            'GS_lat_long': [[float(v) for v in ll] for ll in self.GS_lat_long],
+            'antenna_inclination': self.antenna_inclination,
+            'topology_layout': self.topology_layout,
+            'tle': sn_file_digest(self.tle_file) if self.tle_file else '',
+            'propagator': self.propagator,
+            'isl_period': self.isl_period(),
+            'epsilon': self.epsilon,
+            'link': [
+                self.sat_bandwidth, self.sat_ground_bandwidth, self.sat_loss,
+                self.sat_ground_loss
+            ]
+        }
 
     def compute_conf(self, sat_node_number, interval, num1, num2, ID, Q,
                      num_backbone, matrix):
@@ -432,14 +610,15 @@ class Observer():
         Q.append(" }")
         return True
 
-    def print_conf(self, sat_node_number, fac_node_number, ID, Q, remote_ftp):
+    def print_conf(self, sat_node_number, fac_node_number, ID, Q, uploads):
         filename = self.file_path + "/conf/bird-" + \
             str(sat_node_number) + "-" + str(fac_node_number) + "/B%d.conf" % ID
         fout = open(self.configuration_file_path + "/" + filename, 'w+')
         for item in Q:
             fout.write(str(item) + "\n")
         fout.close()
-        remote_ftp.put(self.configuration_file_path + "/" + filename, filename)
+        uploads.append((self.configuration_file_path + "/" + filename,
+                        filename))
 
     def generate_conf(self, remote_ssh, remote_ftp):
         if self.intra_routing != "OSPF" and self.intra_routing != "ospf":
@@ -466,10 +645,13 @@ class Observer():
                 remote_ssh, "mkdir ~/" + self.file_path + "/conf/bird-" +
                 str(self.orbit_number * self.sat_number) + "-" +
                 str(len(self.GS_lat_long)))
-        path = self.configuration_file_path + "/" + self.file_path + "/delay/1.txt"
-        matrix = sn_get_param(path)
+        timeline = Timeline(
+            sn_timeline_path(self.configuration_file_path + "/" +
+                             self.file_path))
+        matrix = timeline.link_dict(1)
         num_backbone = self.orbit_number * self.sat_number + len(
             self.GS_lat_long)
+        uploads = []  # configuration files, sent together at the end
         error = True
         for i in range(len(self.AS)):
             if len(self.AS[i]) != 1:
@@ -480,7 +662,7 @@ class Observer():
                         self.hello_interval, self.AS[i][0], self.AS[i][1], ID,
                         Q, num_backbone, matrix)
                     self.print_conf(self.orbit_number * self.sat_number,
-                                    len(self.GS_lat_long), ID, Q, remote_ftp)
+                                    len(self.GS_lat_long), ID, Q, uploads)
             else:  # one node in one AS
                 ID = self.AS[i][0]
                 Q = []
@@ -527,6 +709,137 @@ class Observer():
                 Q.append("    };")
                 Q.append(" }")
                 self.print_conf(self.orbit_number * self.sat_number,
-                                len(self.GS_lat_long), ID, Q, remote_ftp)
-
+                                len(self.GS_lat_long), ID, Q, uploads)
+        sn_remote_put_all(remote_ssh, remote_ftp, uploads)
         return error
+
+
+# A thread designed for generating the topology incrementally: it keeps the
+# stores filled window timesteps ahead of the emulation clock, logs the
+# changes as they are generated and discards the windows already emulated.
+class sn_Topology_Window_Thread(threading.Thread):
+
+    def __init__(self, observer, path, fac_cbf, bound_dis, alpha, window):
+        threading.Thread.__init__(self, daemon=True)
+        self.observer = observer
+        self.path = path
+        self.fac_cbf = fac_cbf
+        self.bound_dis = bound_dis
+        self.alpha = alpha
+        self.window = window
+        self.handover = None
+        if observer.epsilon > 0:
+            # keyframes need the whole timeline, handovers do not
+            print("Incremental topology: delays are stored every timestep.")
+            self.handover = (fac_cbf, bound_dis, alpha)
+        self.timeline = Timeline(sn_timeline_path(path))
+        self.positions = observer.handover_positions(path, self.handover)
+        self.events = TopologyEventWriter(path, observer.resolution)
+        self.pre_mask = None
+        self.generated = 0  # samples computed
+        self.diffed = 1  # last timestep logged
+        self.discarded = 0  # samples discarded
+        self.published = 0  # change-sets readable by change_sets
+        self.clock = 1  # timestep being emulated
+        self.done = False
+        self.condition = threading.Condition()
+
+    def fill(self):
+        # Computes the next window and logs the timesteps whose handovers
+        # only need positions already computed.
+        duration = self.observer.duration
+        first = self.generated
+        last = min(first + self.window, duration)
+        self.observer.compute_range(self.path, first, last, self.fac_cbf,
+                                    self.bound_dis, self.alpha)
+        if self.pre_mask is None:
+            self.pre_mask = self.timeline.link_mask(1)
+        end = duration if last == duration else last - 1
+        self.pre_mask = self.observer.diff_timesteps(
+            self.timeline, self.events, self.diffed + 1, end, self.pre_mask,
+            self.positions, self.handover)
+        self.events.flush()
+        with self.condition:
+            self.generated = last
+            self.diffed = max(self.diffed, end - 1)
+            self.published = len(self.events.index)
+            self.condition.notify_all()
+
+    def discard(self, clock):
+        # whole windows before the one being emulated, keeping the samples
+        # the next handovers are interpolated from
+        end = min(clock - 1, self.diffed - MIN_WINDOW)
+        end = end // self.window * self.window
+        if end <= self.discarded:
+            return
+        # readers raise from now on instead of reading the dropped records
+        with self.condition:
+            self.discarded = end
+        # from the start, as only whole pages are freed
+        self.timeline.discard(0, end)
+        sn_discard_positions(self.path, 0, end)
+
+    def run(self):
+        try:
+            while self.generated < self.observer.duration:
+                with self.condition:
+                    while self.generated >= self.clock - 1 + self.window:
+                        self.condition.wait()
+                    clock = self.clock
+                self.discard(clock)
+                self.fill()
+            self.events.close(self.observer.duration)
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def require(self, first, last):
+        # Waits until timesteps first ... last are generated, the readers of
+        # the timeline must not see the zeros of a missing or dropped record.
+        with self.condition:
+            if first <= self.discarded:
+                raise ValueError("Timestep " + str(first) +
+                                 " was already discarded (incremental "
+                                 "topology keeps timesteps after " +
+                                 str(self.discarded) + ").")
+            while self.generated < last and not self.done:
+                self.condition.wait()
+            if self.generated < last:
+                raise ValueError("Timestep " + str(last) +
+                                 " was not generated (" +
+                                 str(self.generated) + " computed).")
+
+    def advance(self, time_index):
+        # the emulation reached timestep time_index
+        with self.condition:
+            if time_index > self.clock:
+                self.clock = time_index
+                self.condition.notify_all()
+
+    def change_sets(self):
+        # (time, second, events) as TopologyEvents.change_sets, plus
+        # (None, second, None) when no change is generated before second
+        # yet. Blocks only when the emulation has caught up with it.
+        row = 0
+        frontier = 0
+        while True:
+            with self.condition:
+                while (row >= self.published and not self.done
+                       and self.diffed * self.observer.resolution
+                       <= frontier):
+                    self.condition.wait()
+                if row >= self.published:
+                    if self.done:
+                        return
+                    frontier = self.diffed * self.observer.resolution
+                    change = None
+                else:
+                    change = self.events.index[row]
+            if change is None:
+                yield None, frontier, None
+                continue
+            time_index, offset, count, _, second = change
+            yield time_index, second, sn_read_events(
+                sn_events_path(self.path), offset, count)
+            row += 1
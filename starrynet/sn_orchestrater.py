@@ -2,14 +2,420 @@ import os
 import threading
 import sys
 from time import sleep
+import time
+import json
+import re
+import socket
+import socketserver
+import ipaddress
+import hmac
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import numpy
 import subprocess
+from collections import defaultdict
 
 """
 Used in the remote machine for link updating, initializing links, damaging and recovering links and other functionalities。
 author: Yangtao Deng (dengyt21@mails.tsinghua.edu.cn) and Zeqi Lai (zeqilai@tsinghua.edu.cn) 
 """
 
+# pyroute2 0.9 and later (tools/requirements.txt): netem rate in bytes/s,
+# and NetNS is a netlink socket opened in the namespace, where older
+# releases fork a helper process per NetNS.
+PYROUTE2_MIN_VERSION = (0, 9)
+
+
+def sn_pyroute2_supported(version):
+    numbers = tuple(int(v) for v in re.findall(r"\d+", version)[:2])
+    return numbers >= PYROUTE2_MIN_VERSION
+
+
+try:
+    import pyroute2
+    from pyroute2 import IPRoute, NetNS
+except ImportError:
+    NetNS = None  # links handled with nsenter, ip and tc
+else:
+    if not sn_pyroute2_supported(getattr(pyroute2, '__version__', '0')):
+        print("pyroute2 " + str(getattr(pyroute2, '__version__', '')) +
+              " is older than 0.9, links handled with nsenter, ip and tc.")
+        NetNS = None
+
+# "bridge": one docker network per link, "veth": veth pairs created
+# directly in the container namespaces
+sn_link_backend = "bridge"
+
+TC_H_ROOT = 0xFFFFFFFF
+TC_NETEM_HANDLE = 0x10000  # 1:, the netem qdisc of every link interface
+
+
+class sn_Link_Engine():
+    # Link control inside the network namespace of each container, found
+    # once from the container PID: rtnetlink sockets opened in that
+    # namespace (pyroute2), or nsenter with ip/tc without pyroute2. No
+    # docker exec per link operation.
+
+    def __init__(self):
+        self.pids = {}
+        self.sockets = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, container_ids):
+        # PIDs of the containers not seen yet, with one docker inspect
+        with self.lock:
+            missing = [str(c) for c in container_ids if str(c) not in self.pids]
+        if len(missing) == 0:
+            return
+        # "<full id> <pid>" lines, matched by id as a container that is
+        # gone has no line; docker ps gives short id prefixes
+        with os.popen("docker inspect -f '{{.Id}} {{.State.Pid}}' " +
+                      " ".join(missing)) as f:
+            pids = dict(line.split() for line in f if line.strip())
+        with self.lock:
+            for container_id in missing:
+                for full_id, pid in pids.items():
+                    if full_id.startswith(container_id):
+                        self.pids[container_id] = int(pid)
+                        break
+
+    def pid(self, container_id):
+        self.resolve([container_id])
+        pid = self.pids.get(str(container_id))
+        if pid is None:
+            raise LookupError("no container " + str(container_id))
+        return pid
+
+    def netns(self, container_id):
+        return "/proc/" + str(self.pid(container_id)) + "/ns/net"
+
+    def socket(self, container_id):
+        # (rtnetlink socket, its lock), None without pyroute2
+        if NetNS is None:
+            return None, None
+        with self.lock:
+            ipr = self.sockets.get(str(container_id))
+        if ipr is None:
+            created = NetNS(self.netns(container_id), flags=0)
+            with self.lock:
+                ipr = self.sockets.setdefault(str(container_id), created)
+                self.locks.setdefault(str(container_id), threading.Lock())
+            if ipr is not created:
+                created.close()
+        return ipr, self.locks[str(container_id)]
+
+    def nsenter(self, container_id, cmd):
+        # output lines of cmd, raises when it fails
+        result = subprocess.run(
+            ["nsenter", "--net=" + self.netns(container_id), "sh", "-c", cmd],
+            capture_output=True,
+            text=True)
+        if result.returncode != 0:
+            raise RuntimeError(
+                str(container_id) + ": " + cmd + " failed: " +
+                result.stderr.strip())
+        return result.stdout.splitlines(True)
+
+    def attach(self, container_id, address, name, delay=None, loss=0,
+               bw=None):
+        # The interface docker created for address is renamed to name,
+        # brought up and given its netem qdisc (delay ms, loss %, bw Gbps).
+        ipr, lock = self.socket(container_id)
+        if ipr is None:
+            cmd = ("set -- $(ip -o addr show to " + address + "); " +
+                   "dev=${2%%@*}; ip link set dev $dev down && " +
+                   "ip link set dev $dev name " + name + " && " +
+                   "ip link set dev " + name + " up")
+            if delay is not None:
+                cmd += " && tc qdisc add dev " + name + self.netem_args(
+                    delay, loss, bw)
+            self.nsenter(container_id, cmd)
+            return
+        with lock:
+            index = ipr.get_addr(address=address)[0]['index']
+            ipr.link('set', index=index, state='down')
+            ipr.link('set', index=index, ifname=name)
+            ipr.link('set', index=index, state='up')
+            if delay is not None:
+                ipr.tc('add', 'netem', index,
+                       **self.netem_params(delay, loss, bw))
+
+    def veth(self, container_a, name_a, address_a, container_b, name_b,
+             address_b, delay, loss=0, bw=None):
+        # veth pair with its ends created in both container namespaces,
+        # named, addressed (/24) and given their netem qdisc.
+        self.resolve([container_a, container_b])
+        pid_a = self.pid(container_a)
+        pid_b = self.pid(container_b)
+        if NetNS is None:
+            if os.system("ip link add " + name_a + " netns " + str(pid_a) +
+                         " type veth peer name " + name_b + " netns " +
+                         str(pid_b)) != 0:
+                raise RuntimeError("creating veth pair " + name_a + " - " +
+                                   name_b + " failed")
+            for container_id, name, address in ((container_a, name_a,
+                                                 address_a),
+                                                (container_b, name_b,
+                                                 address_b)):
+                self.nsenter(
+                    container_id, "ip addr add " + address + "/24 dev " +
+                    name + " && ip link set dev " + name + " up && " +
+                    "tc qdisc add dev " + name +
+                    self.netem_args(delay, loss, bw))
+            return
+        with IPRoute() as host:
+            host.link('add',
+                      ifname=name_a,
+                      kind='veth',
+                      net_ns_pid=pid_a,
+                      peer={
+                          'ifname': name_b,
+                          'net_ns_pid': pid_b
+                      })
+        for container_id, name, address in ((container_a, name_a, address_a),
+                                            (container_b, name_b, address_b)):
+            ipr, lock = self.socket(container_id)
+            with lock:
+                index = ipr.link_lookup(ifname=name)[0]
+                ipr.addr('add', index=index, address=address, prefixlen=24)
+                ipr.link('set', index=index, state='up')
+                ipr.tc('add', 'netem', index,
+                       **self.netem_params(delay, loss, bw))
+
+    def delete(self, container_id, name):
+        ipr, lock = self.socket(container_id)
+        if ipr is None:
+            self.nsenter(container_id, "ip link del dev " + name)
+            return
+        with lock:
+            ipr.link('del', index=ipr.link_lookup(ifname=name)[0])
+
+    def netem_args(self, delay=None, loss=None, bw=None):
+        # same handle as netem_params, whichever path added the qdisc
+        args = " root handle 1: netem"
+        if delay is not None:
+            args += " delay " + str(delay) + "ms"
+        if loss is not None:
+            args += " loss " + str(loss) + "%"
+        if bw is not None:
+            args += " rate " + str(bw) + "Gbit"
+        return args
+
+    def netem_params(self, delay=None, loss=None, bw=None):
+        # pyroute2 netem: delay in us, loss in %, rate as the u32 bytes/s of
+        # TCA_NETEM_RATE (its rate strings only take integer numbers).
+        params = {'handle': TC_NETEM_HANDLE, 'parent': TC_H_ROOT}
+        if delay is not None:
+            params['delay'] = int(round(float(delay) * 1000))
+        if loss is not None:
+            params['loss'] = float(loss)
+        if bw is not None:
+            params['rate'] = min(int(float(bw) * 1e9 / 8), 0xFFFFFFFF)
+        return params
+
+    def netem(self, container_id, name, delay=None, loss=None, bw=None):
+        # Like tc qdisc change: the parameters not given are reset.
+        return self.batch(container_id, [('netem', name, delay, loss, bw)])
+
+    def set_state(self, container_id, name, up):
+        return self.batch(container_id, [('state', name, up)])
+
+    def batch(self, container_id, ops):
+        # Applies ('netem', name, delay, loss, bw) and ('state', name, up)
+        # operations of one container in order, each one acknowledged.
+        # Returns the number of failed operations.
+        ipr, lock = self.socket(container_id)
+        if ipr is None:
+            return self.nsenter_batch(container_id, ops)
+        failed = 0
+        with lock:
+            for op in ops:
+                try:
+                    index = ipr.link_lookup(ifname=op[1])[0]
+                    if op[0] == 'state':
+                        ipr.link('set',
+                                 index=index,
+                                 state='up' if op[2] else 'down')
+                    else:
+                        ipr.tc('change', 'netem', index,
+                               **self.netem_params(*op[2:]))
+                except Exception as e:
+                    failed += 1
+                    print(str(container_id) + ": " + op[0] + " on " +
+                          op[1] + " failed: " + repr(e))
+        return failed
+
+    def nsenter_batch(self, container_id, ops):
+        # one ip -batch and one tc -batch run for all the operations
+        failed = 0
+        scripts = (("ip", [
+            "link set dev " + op[1] + (" up" if op[2] else " down")
+            for op in ops if op[0] == 'state'
+        ]), ("tc", [
+            "qdisc change dev " + op[1] + self.netem_args(*op[2:])
+            for op in ops if op[0] == 'netem'
+        ]))
+        for tool, lines in scripts:
+            if len(lines) == 0:
+                continue
+            result = subprocess.run([
+                "nsenter", "--net=" + self.netns(container_id), tool,
+                "-force", "-batch", "-"
+            ],
+                                    input="\n".join(lines) + "\n",
+                                    capture_output=True,
+                                    text=True)
+            if result.returncode != 0:
+                failed += max(1, result.stderr.count("Command failed"))
+                print(str(container_id) + ": " + tool + " -batch failed: " +
+                      result.stderr.strip())
+        return failed
+
+    def addresses(self, container_id):
+        # {interface: "address/prefixlen"} of the IPv4 addresses
+        ipr, lock = self.socket(container_id)
+        if ipr is None:
+            return {
+                line.split()[1]: line.split()[3]
+                for line in self.nsenter(container_id, "ip -o -4 addr show")
+            }
+        with lock:
+            return {
+                addr.get_attr('IFA_LABEL'):
+                addr.get_attr('IFA_ADDRESS') + "/" + str(addr['prefixlen'])
+                for addr in ipr.get_addr(family=socket.AF_INET)
+            }
+
+    def interfaces(self, container_id):
+        # every interface but lo and the docker eth0
+        ipr, lock = self.socket(container_id)
+        if ipr is None:
+            names = [
+                line.split(":")[1].strip().split("@")[0]
+                for line in self.nsenter(container_id, "ip -o link show")
+            ]
+        else:
+            with lock:
+                names = [
+                    link.get_attr('IFLA_IFNAME') for link in ipr.get_links()
+                ]
+        return [name for name in names if name not in ("lo", "eth0")]
+
+    def close(self):
+        with self.lock:
+            for ipr in self.sockets.values():
+                ipr.close()
+            self.sockets.clear()
+            self.locks.clear()
+            self.pids.clear()
+
+
+sn_link_engine = sn_Link_Engine()
+
+SN_MAX_WORKERS = 64  # threads of the fan-out executor
+SN_INITIAL_WORKERS = 8
+
+
+class sn_Adaptive_Executor():
+    # Bounded fan-out of the orchestrator. At most limit tasks run at once:
+    # the limit grows by one after limit tasks finish within twice the
+    # lowest latency seen and halves when a task takes longer (AIMD),
+    # between 1 and max_workers.
+
+    def __init__(self, max_workers=SN_MAX_WORKERS,
+                 initial=SN_INITIAL_WORKERS):
+        self.max_workers = max_workers
+        self.limit = min(initial, max_workers)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers,
+                                       thread_name_prefix='sn_fanout')
+        self.cond = threading.Condition()
+        self.running = 0
+        # Kept across map calls, so every phase starts from the concurrency
+        # and latency baseline the previous ones converged to.
+        self.queued = 0  # submitted tasks waiting for a slot
+        self.max_queued = 0  # deepest queue so far
+        self.baseline = None  # lowest task latency (s)
+        self.since_change = 0  # tasks finished since the last limit change
+
+    def run_task(self, fn, args):
+        with self.cond:
+            while self.running >= self.limit:
+                self.cond.wait()
+            self.queued -= 1
+            self.running += 1
+        start = time.time()
+        try:
+            return fn(*args)
+        finally:
+            self.finished(time.time() - start)
+
+    def finished(self, latency):
+        with self.cond:
+            self.running -= 1
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            self.since_change += 1
+            if latency > 2 * self.baseline + 0.01:
+                if self.since_change >= self.limit // 2:
+                    # one decrease per window of tasks
+                    self.limit = max(1, self.limit // 2)
+                    self.since_change = 0
+            elif self.since_change >= self.limit:
+                self.limit = min(self.max_workers, self.limit + 1)
+                self.since_change = 0
+            self.cond.notify_all()
+
+    def map(self, phase, fn, args_list, report=True):
+        # Results of fn(*args) for every args, None for the tasks that
+        # raised, with a throughput report of the phase.
+        args_list = list(args_list)
+        start = time.time()
+        with self.cond:
+            self.queued += len(args_list)
+            self.max_queued = max(self.max_queued, self.queued)
+        futures = [
+            self.pool.submit(self.run_task, fn, args) for args in args_list
+        ]
+        results = []
+        failed = 0
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failed += 1
+                results.append(None)
+                print(phase + ": task failed: " + repr(e))
+        elapsed = time.time() - start
+        if not report:
+            return results
+        print("[" + phase + "] " + str(len(args_list)) + " tasks in " +
+              str(round(elapsed, 2)) + " s (" +
+              str(round(len(args_list) / max(elapsed, 1e-6), 1)) +
+              " tasks/s), " + str(failed) + " failed, peak queue depth " +
+              str(self.max_queued) + ", concurrency " + str(self.limit) +
+              ".")
+        return results
+
+
+sn_executor = sn_Adaptive_Executor()
+
+
+def sn_apply_batches(batches):
+    # {container id: operations}, one batch per container, containers in
+    # parallel. Returns the number of failed operations.
+    results = sn_executor.map("link operations", sn_link_engine.batch,
+                              batches.items())
+    # a batch that raised failed all of its operations
+    failed = sum(
+        len(ops) if result is None else result
+        for result, ops in zip(results, batches.values()))
+    print(
+        str(sum(len(ops) for ops in batches.values())) +
+        " link operations in " + str(len(batches)) + " containers, " +
+        str(failed) + " failed.")
+    return failed
+
 
 def sn_get_right_satellite(current_sat_id, current_orbit_id, orbit_num):
     if current_orbit_id == orbit_num - 1:
@@ -34,6 +440,7 @@ def sn_ISL_establish(current_sat_id, current_orbit_id, container_id_list,
     [down_sat_id,
      down_orbit_id] = sn_get_down_satellite(current_sat_id, current_orbit_id,
                                             sat_num)
+    down_id = down_orbit_id * sat_num + down_sat_id
     print("[" + str(isl_idx) + "/" + str(constellation_size * 2) +
           "] Establish intra-orbit ISL from: (" + str(current_sat_id) + "," +
           str(current_orbit_id) + ") to (" + str(down_sat_id) + "," +
@@ -42,91 +449,11 @@ def sn_ISL_establish(current_sat_id, current_orbit_id, container_id_list,
         "_" + str(down_sat_id) + "-" + str(down_orbit_id)
     address_16_23 = isl_idx >> 8
     address_8_15 = isl_idx & 0xff
-    # Create internal network in docker.
-    os.system('docker network create ' + ISL_name + " --subnet 10." +
-              str(address_16_23) + "." + str(address_8_15) + ".0/24")
-    print('[Create ISL:]' + 'docker network create ' + ISL_name +
-          " --subnet 10." + str(address_16_23) + "." + str(address_8_15) +
-          ".0/24")
-    os.system('docker network connect ' + ISL_name + " " +
-              str(container_id_list[current_orbit_id * sat_num +
-                                    current_sat_id]) + " --ip 10." +
-              str(address_16_23) + "." + str(address_8_15) + ".40")
-    delay = matrix[current_orbit_id * sat_num +
-                   current_sat_id][down_orbit_id * sat_num + down_sat_id]
-    with os.popen(
-            "docker exec -it " +
-            str(container_id_list[current_orbit_id * sat_num +
-                                  current_sat_id]) +
-            " ip addr | grep -B 2 10." + str(address_16_23) + "." +
-            str(address_8_15) +
-            ".40 | head -n 1 | awk -F: '{ print $2 }' | tr -d [:blank:]") as f:
-        ifconfig_output = f.readline()
-        target_interface = str(ifconfig_output).split("@")[0]
-        os.system("docker exec -d " +
-                  str(container_id_list[current_orbit_id * sat_num +
-                                        current_sat_id]) +
-                  " ip link set dev " + target_interface + " down")
-        os.system("docker exec -d " +
-                  str(container_id_list[current_orbit_id * sat_num +
-                                        current_sat_id]) +
-                  " ip link set dev " + target_interface + " name " + "B" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1) +
-                  "-eth" + str(down_orbit_id * sat_num + down_sat_id + 1))
-        os.system("docker exec -d " +
-                  str(container_id_list[current_orbit_id * sat_num +
-                                        current_sat_id]) +
-                  " ip link set dev B" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1) +
-                  "-eth" + str(down_orbit_id * sat_num + down_sat_id + 1) +
-                  " up")
-        os.system("docker exec -d " +
-                  str(container_id_list[current_orbit_id * sat_num +
-                                        current_sat_id]) +
-                  " tc qdisc add dev B" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1) +
-                  "-eth" + str(down_orbit_id * sat_num + down_sat_id + 1) +
-                  " root netem delay " + str(delay) + "ms loss " + str(loss) + "% rate " + str(bw) + "Gbit")
-    print('[Add current node:]' + 'docker network connect ' + ISL_name + " " +
-          str(container_id_list[current_orbit_id * sat_num + current_sat_id]) +
-          " --ip 10." + str(address_16_23) + "." + str(address_8_15) + ".40")
-    os.system('docker network connect ' + ISL_name + " " +
-              str(container_id_list[down_orbit_id * sat_num + down_sat_id]) +
-              " --ip 10." + str(address_16_23) + "." + str(address_8_15) +
-              ".10")
-    with os.popen(
-            "docker exec -it " +
-            str(container_id_list[down_orbit_id * sat_num + down_sat_id]) +
-            " ip addr | grep -B 2 10." + str(address_16_23) + "." +
-            str(address_8_15) +
-            ".10 | head -n 1 | awk -F: '{ print $2 }' | tr -d [:blank:]") as f:
-        ifconfig_output = f.readline()
-        target_interface = str(ifconfig_output).split("@")[0]
-        os.system("docker exec -d " +
-                  str(container_id_list[down_orbit_id * sat_num +
-                                        down_sat_id]) + " ip link set dev " +
-                  target_interface + " down")
-        os.system("docker exec -d " +
-                  str(container_id_list[down_orbit_id * sat_num +
-                                        down_sat_id]) + " ip link set dev " +
-                  target_interface + " name " + "B" +
-                  str(down_orbit_id * sat_num + down_sat_id + 1) + "-eth" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1))
-        os.system("docker exec -d " +
-                  str(container_id_list[down_orbit_id * sat_num +
-                                        down_sat_id]) + " ip link set dev B" +
-                  str(down_orbit_id * sat_num + down_sat_id + 1) + "-eth" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1) + " up")
-        os.system("docker exec -d " +
-                  str(container_id_list[down_orbit_id * sat_num +
-                                        down_sat_id]) + " tc qdisc add dev B" +
-                  str(down_orbit_id * sat_num + down_sat_id + 1) + "-eth" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1) +
-                  " root netem delay " + str(delay) + "ms loss " + str(loss) + "% rate " + str(bw) + "Gbit")
-    print('[Add down node:]' + 'docker network connect ' + ISL_name + " " +
-          str(container_id_list[down_orbit_id * sat_num + down_sat_id]) +
-          " --ip 10." + str(address_16_23) + "." + str(address_8_15) + ".10")
-
+    sn_link_establish(ISL_name,
+                      "10." + str(address_16_23) + "." + str(address_8_15),
+                      current_id + 1, ".40", down_id + 1, ".10",
+                      matrix[current_id][down_id], container_id_list, bw,
+                      loss)
     print("Add 10." + str(address_16_23) + "." + str(address_8_15) +
           ".40/24 and 10." + str(address_16_23) + "." + str(address_8_15) +
           ".10/24 to (" + str(current_sat_id) + "," + str(current_orbit_id) +
@@ -138,6 +465,7 @@ def sn_ISL_establish(current_sat_id, current_orbit_id, container_id_list,
     [right_sat_id,
      right_orbit_id] = sn_get_right_satellite(current_sat_id, current_orbit_id,
                                               orbit_num)
+    right_id = right_orbit_id * sat_num + right_sat_id
     print("[" + str(isl_idx) + "/" + str(constellation_size * 2) +
           "] Establish inter-orbit ISL from: (" + str(current_sat_id) + "," +
           str(current_orbit_id) + ") to (" + str(right_sat_id) + "," +
@@ -146,93 +474,11 @@ def sn_ISL_establish(current_sat_id, current_orbit_id, container_id_list,
         "_" + str(right_sat_id) + "-" + str(right_orbit_id)
     address_16_23 = isl_idx >> 8
     address_8_15 = isl_idx & 0xff
-    # Create internal network in docker.
-    os.system('docker network create ' + ISL_name + " --subnet 10." +
-              str(address_16_23) + "." + str(address_8_15) + ".0/24")
-    print('[Create ISL:]' + 'docker network create ' + ISL_name +
-          " --subnet 10." + str(address_16_23) + "." + str(address_8_15) +
-          ".0/24")
-    os.system('docker network connect ' + ISL_name + " " +
-              str(container_id_list[current_orbit_id * sat_num +
-                                    current_sat_id]) + " --ip 10." +
-              str(address_16_23) + "." + str(address_8_15) + ".30")
-    delay = matrix[current_orbit_id * sat_num +
-                   current_sat_id][right_orbit_id * sat_num + right_sat_id]
-    with os.popen(
-            "docker exec -it " +
-            str(container_id_list[current_orbit_id * sat_num +
-                                  current_sat_id]) +
-            " ip addr | grep -B 2 10." + str(address_16_23) + "." +
-            str(address_8_15) +
-            ".30 | head -n 1 | awk -F: '{ print $2 }' | tr -d [:blank:]") as f:
-        ifconfig_output = f.readline()
-        target_interface = str(ifconfig_output).split("@")[0]
-        os.system("docker exec -d " +
-                  str(container_id_list[current_orbit_id * sat_num +
-                                        current_sat_id]) +
-                  " ip link set dev " + target_interface + " down")
-        os.system("docker exec -d " +
-                  str(container_id_list[current_orbit_id * sat_num +
-                                        current_sat_id]) +
-                  " ip link set dev " + target_interface + " name " + "B" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1) +
-                  "-eth" + str(right_orbit_id * sat_num + right_sat_id + 1))
-        os.system("docker exec -d " +
-                  str(container_id_list[current_orbit_id * sat_num +
-                                        current_sat_id]) +
-                  " ip link set dev B" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1) +
-                  "-eth" + str(right_orbit_id * sat_num + right_sat_id + 1) +
-                  " up")
-        os.system("docker exec -d " +
-                  str(container_id_list[current_orbit_id * sat_num +
-                                        current_sat_id]) +
-                  " tc qdisc add dev B" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1) +
-                  "-eth" + str(right_orbit_id * sat_num + right_sat_id + 1) +
-                  " root netem delay " + str(delay) + "ms loss " + str(loss) + "% rate " + str(bw) + "Gbit")
-    print('[Add current node:]' + 'docker network connect ' + ISL_name + " " +
-          str(container_id_list[current_orbit_id * sat_num + current_sat_id]) +
-          " --ip 10." + str(address_16_23) + "." + str(address_8_15) + ".30")
-    os.system('docker network connect ' + ISL_name + " " +
-              str(container_id_list[right_orbit_id * sat_num + right_sat_id]) +
-              " --ip 10." + str(address_16_23) + "." + str(address_8_15) +
-              ".20")
-
-    with os.popen(
-            "docker exec -it " +
-            str(container_id_list[right_orbit_id * sat_num + right_sat_id]) +
-            " ip addr | grep -B 2 10." + str(address_16_23) + "." +
-            str(address_8_15) +
-            ".20 | head -n 1 | awk -F: '{ print $2 }' | tr -d [:blank:]") as f:
-        ifconfig_output = f.readline()
-        target_interface = str(ifconfig_output).split("@")[0]
-        os.system("docker exec -d " +
-                  str(container_id_list[right_orbit_id * sat_num +
-                                        right_sat_id]) + " ip link set dev " +
-                  target_interface + " down")
-        os.system("docker exec -d " +
-                  str(container_id_list[right_orbit_id * sat_num +
-                                        right_sat_id]) + " ip link set dev " +
-                  target_interface + " name " + "B" +
-                  str(right_orbit_id * sat_num + right_sat_id + 1) + "-eth" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1))
-        os.system("docker exec -d " +
-                  str(container_id_list[right_orbit_id * sat_num +
-                                        right_sat_id]) + " ip link set dev B" +
-                  str(right_orbit_id * sat_num + right_sat_id + 1) + "-eth" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1) + " up")
-        os.system("docker exec -d " +
-                  str(container_id_list[right_orbit_id * sat_num +
-                                        right_sat_id]) +
-                  " tc qdisc add dev B" +
-                  str(right_orbit_id * sat_num + right_sat_id + 1) + "-eth" +
-                  str(current_orbit_id * sat_num + current_sat_id + 1) +
-                  " root netem delay " + str(delay) + "ms loss " + str(loss) + "% rate " + str(bw) + "Gbit")
-    print('[Add right node:]' + 'docker network connect ' + ISL_name + " " +
-          str(container_id_list[right_orbit_id * sat_num + right_sat_id]) +
-          " --ip 10." + str(address_16_23) + "." + str(address_8_15) + ".20")
-
+    sn_link_establish(ISL_name,
+                      "10." + str(address_16_23) + "." + str(address_8_15),
+                      current_id + 1, ".30", right_id + 1, ".20",
+                      matrix[current_id][right_id], container_id_list, bw,
+                      loss)
     print("Add 10." + str(address_16_23) + "." + str(address_8_15) +
           ".30/24 and 10." + str(address_16_23) + "." + str(address_8_15) +
           ".20/24 to (" + str(current_sat_id) + "," + str(current_orbit_id) +
@@ -241,22 +487,19 @@ def sn_ISL_establish(current_sat_id, current_orbit_id, container_id_list,
 
 def sn_establish_ISLs(container_id_list, matrix, orbit_num, sat_num,
                       constellation_size, bw, loss):
-    ISL_threads = []
-    for current_orbit_id in range(0, orbit_num):
-        for current_sat_id in range(0, sat_num):
-            ISL_thread = threading.Thread(
-                target=sn_ISL_establish,
-                args=(current_sat_id, current_orbit_id, container_id_list,
-                      orbit_num, sat_num, constellation_size, matrix, bw,
-                      loss))
-            ISL_threads.append(ISL_thread)
-    for ISL_thread in ISL_threads:
-        ISL_thread.start()
-    for ISL_thread in ISL_threads:
-        ISL_thread.join()
+    sn_executor.map("ISLs", sn_ISL_establish,
+                    [(current_sat_id, current_orbit_id, container_id_list,
+                      orbit_num, sat_num, constellation_size, matrix, bw, loss)
+                     for current_orbit_id in range(0, orbit_num)
+                     for current_sat_id in range(0, sat_num)])
 
 
 def sn_get_param(file_):
+    if file_.endswith('.npy'):  # (a, b, delay) link list of one timestep
+        matrix = defaultdict(lambda: defaultdict(float))
+        for a, b, delay in numpy.load(file_).tolist():
+            matrix[a][b] = matrix[b][a] = round(delay, 2)
+        return matrix
     f = open(file_)
     ADJ = f.readlines()
     for i in range(len(ADJ)):
@@ -275,83 +518,64 @@ def sn_get_container_info():
     container_id_list = []
     for container_idx in range(1, n_container + 1):
         container_id_list.append(all_container_info[container_idx].split()[0])
-
+    sn_link_engine.resolve(container_id_list)
     return container_id_list
 
 
+def sn_GSL_establish(i, j, delay, container_id_list, constellation_size, bw,
+                     loss):
+    # IP address  (there is a link between i and j)
+    address_16_23 = (j - constellation_size) & 0xff
+    address_8_15 = i & 0xff
+    GSL_name = "GSL_" + str(i) + "-" + str(j)
+    sn_link_establish(GSL_name,
+                      "9." + str(address_16_23) + "." + str(address_8_15), i,
+                      ".50", j, ".60", delay, container_id_list, bw, loss)
+
+
+def sn_link_establish(network_name, prefix, a, host_a, b, host_b, delay,
+                      container_id_list, bw, loss):
+    # Point-to-point link between the 1-based nodes a and b, with the
+    # addresses prefix + host_a and prefix + host_b in a /24.
+    name_a = "B" + str(a) + "-eth" + str(b)
+    name_b = "B" + str(b) + "-eth" + str(a)
+    if sn_link_backend == "veth":
+        sn_link_engine.veth(container_id_list[a - 1], name_a,
+                            prefix + host_a, container_id_list[b - 1],
+                            name_b, prefix + host_b, delay, loss, bw)
+        print('[Add veth pair:]' + name_a + " " + prefix + host_a + "/24 " +
+              name_b + " " + prefix + host_b + "/24")
+        return
+    # Create internal network in docker.
+    os.system('docker network create ' + network_name + " --subnet " +
+              prefix + ".0/24")
+    print('[Create link network:]' + 'docker network create ' +
+          network_name + " --subnet " + prefix + ".0/24")
+    for node, host, name in ((a, host_a, name_a), (b, host_b, name_b)):
+        os.system('docker network connect ' + network_name + " " +
+                  str(container_id_list[node - 1]) + " --ip " + prefix +
+                  host)
+        sn_link_engine.attach(container_id_list[node - 1], prefix + host,
+                              name, delay, loss, bw)
+        print('[Add node:]' + 'docker network connect ' + network_name +
+              " " + str(container_id_list[node - 1]) + " --ip " + prefix +
+              host)
+
+
 def sn_establish_GSL(container_id_list, matrix, GS_num, constellation_size, bw,
                      loss):
     # starting links among satellites and ground stations
+    gsls = []
     for i in range(1, constellation_size + 1):
         for j in range(constellation_size + 1,
                        constellation_size + GS_num + 1):
             # matrix[i-1][j-1])==1 means a link between node i and node j
             if ((float(matrix[i - 1][j - 1])) <= 0.01):
                 continue
-            # IP address  (there is a link between i and j)
-            delay = str(matrix[i - 1][j - 1])
-            address_16_23 = (j - constellation_size) & 0xff
-            address_8_15 = i & 0xff
-            GSL_name = "GSL_" + str(i) + "-" + str(j)
-            # Create internal network in docker.
-            os.system('docker network create ' + GSL_name + " --subnet 9." +
-                      str(address_16_23) + "." + str(address_8_15) + ".0/24")
-            print('[Create GSL:]' + 'docker network create ' + GSL_name +
-                  " --subnet 9." + str(address_16_23) + "." +
-                  str(address_8_15) + ".0/24")
-            os.system('docker network connect ' + GSL_name + " " +
-                      str(container_id_list[i - 1]) + " --ip 9." +
-                      str(address_16_23) + "." + str(address_8_15) + ".50")
-            with os.popen(
-                    "docker exec -it " + str(container_id_list[i - 1]) +
-                    " ip addr | grep -B 2 9." + str(address_16_23) + "." +
-                    str(address_8_15) +
-                    ".50 | head -n 1 | awk -F: '{ print $2 }' | tr -d [:blank:]"
-            ) as f:
-                ifconfig_output = f.readline()
-                target_interface = str(ifconfig_output).split("@")[0]
-                os.system("docker exec -d " + str(container_id_list[i - 1]) +
-                          " ip link set dev " + target_interface + " down")
-                os.system("docker exec -d " + str(container_id_list[i - 1]) +
-                          " ip link set dev " + target_interface + " name " +
-                          "B" + str(i - 1 + 1) + "-eth" + str(j))
-                os.system("docker exec -d " + str(container_id_list[i - 1]) +
-                          " ip link set dev B" + str(i - 1 + 1) + "-eth" +
-                          str(j) + " up")
-                os.system("docker exec -d " + str(container_id_list[i - 1]) +
-                          " tc qdisc add dev B" + str(i - 1 + 1) + "-eth" +
-                          str(j) + " root netem delay " + str(delay) + "ms loss " + str(loss) + "% rate " + str(bw) + "Gbit")
-            print('[Add current node:]' + 'docker network connect ' +
-                  GSL_name + " " + str(container_id_list[i - 1]) + " --ip 9." +
-                  str(address_16_23) + "." + str(address_8_15) + ".50")
-
-            os.system('docker network connect ' + GSL_name + " " +
-                      str(container_id_list[j - 1]) + " --ip 9." +
-                      str(address_16_23) + "." + str(address_8_15) + ".60")
-            with os.popen(
-                    "docker exec -it " + str(container_id_list[j - 1]) +
-                    " ip addr | grep -B 2 9." + str(address_16_23) + "." +
-                    str(address_8_15) +
-                    ".60 | head -n 1 | awk -F: '{ print $2 }' | tr -d [:blank:]"
-            ) as f:
-                ifconfig_output = f.readline()
-                target_interface = str(ifconfig_output).split("@")[0]
-                os.system("docker exec -d " + str(container_id_list[j - 1]) +
-                          " ip link set dev " + target_interface + " down")
-                os.system("docker exec -d " + str(container_id_list[j - 1]) +
-                          " ip link set dev " + target_interface + " name " +
-                          "B" + str(j) + "-eth" + str(i - 1 + 1))
-                os.system("docker exec -d " + str(container_id_list[j - 1]) +
-                          " ip link set dev B" + str(j) + "-eth" +
-                          str(i - 1 + 1) + " up")
-                os.system("docker exec -d " + str(container_id_list[j - 1]) +
-                          " tc qdisc add dev B" + str(j) + "-eth" +
-                          str(i - 1 + 1) + " root netem delay " + str(delay) +
-                          "ms loss " + str(loss) + "% rate " + str(bw) +
-                          "Gbit")
-            print('[Add right node:]' + 'docker network connect ' + GSL_name +
-                  " " + str(container_id_list[j - 1]) + " --ip 9." +
-                  str(address_16_23) + "." + str(address_8_15) + ".60")
+            gsls.append((i, j, matrix[i - 1][j - 1], container_id_list,
+                         constellation_size, bw, loss))
+    # failed links are counted in the report of the phase
+    sn_executor.map("GSLs", sn_GSL_establish, gsls)
     for j in range(constellation_size + 1, constellation_size + GS_num + 1):
         GS_name = "GS_" + str(j)
         # Create default network and interface for GS.
@@ -362,21 +586,10 @@ def sn_establish_GSL(container_id_list, matrix, GS_num, constellation_size, bw,
         os.system('docker network connect ' + GS_name + " " +
                   str(container_id_list[j - 1]) + " --ip 9." + str(j) + "." +
                   str(j) + ".10")
-        with os.popen(
-                "docker exec -it " + str(container_id_list[j - 1]) +
-                " ip addr | grep -B 2 9." + str(j) + "." + str(j) +
-                ".10 | head -n 1 | awk -F: '{ print $2 }' | tr -d [:blank:]"
-        ) as f:
-            ifconfig_output = f.readline()
-            target_interface = str(ifconfig_output).split("@")[0]
-            os.system("docker exec -d " + str(container_id_list[j - 1]) +
-                      " ip link set dev " + target_interface + " down")
-            os.system("docker exec -d " + str(container_id_list[j - 1]) +
-                      " ip link set dev " + target_interface + " name " + "B" +
-                      str(j - 1 + 1) + "-default")
-            os.system("docker exec -d " + str(container_id_list[j - 1]) +
-                      " ip link set dev B" + str(j - 1 + 1) + "-default" +
-                      " up")
+        # no netem on the default interface of a GS
+        sn_link_engine.attach(container_id_list[j - 1],
+                              "9." + str(j) + "." + str(j) + ".10",
+                              "B" + str(j) + "-default")
         print('[Add current node:]' + 'docker network connect ' + GS_name +
               " " + str(container_id_list[j - 1]) + " --ip 9." + str(j) + "." +
               str(j) + ".10")
@@ -387,7 +600,7 @@ def sn_copy_run_conf(container_idx, Path, current, total):
               str(container_idx) + ":/B" + str(current + 1) + ".conf")
     print("[" + str(current + 1) + "/" + str(total) + "]" +
           " docker cp bird.conf " + str(container_idx) + ":/bird.conf")
-    #os.system("docker exec -it " + str(container_idx) + " bird -c B" +
+    #os.system("docker exec -i " + str(container_idx) + " bird -c B" +
     #          str(current + 1) + ".conf")
     result = subprocess.run(["docker", "exec", str(container_idx), "bird", "-c", "B"+str(current+1)+".conf"],
                             capture_output=True, text=True)
@@ -398,75 +611,201 @@ def sn_copy_run_conf(container_idx, Path, current, total):
           " has started. ")
 
 
-def sn_copy_run_conf_to_each_container(container_id_list, sat_node_number,
-                                       fac_node_number, path):
+SN_ROUTING_TIMEOUT = 120  # s
+# control socket of bird 2 and bird 1, under /proc/<pid>/root
+BIRD_SOCKETS = ("/run/bird/bird.ctl", "/var/run/bird/bird.ctl",
+                "/var/run/bird.ctl", "/usr/local/var/run/bird.ctl")
+
+
+def sn_birdc(container_id, cmd):
+    # Reply text of a bird command, over the control socket of the
+    # container when reachable, birdc in the container otherwise.
+    root = "/proc/" + str(sn_link_engine.pids.get(str(container_id))) + "/root"
+    for path in BIRD_SOCKETS:
+        if not os.path.exists(root + path):
+            continue
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as ctl:
+            ctl.settimeout(5)
+            ctl.connect(root + path)
+            reader = ctl.makefile('r')
+            reader.readline()  # 0001 greeting
+            ctl.sendall((cmd + "\n").encode())
+            lines = []
+            for line in reader:
+                lines.append(line)
+                # the reply ends with a 0xxx (done), 8xxx or 9xxx (error)
+                # line whose code is followed by a space
+                if re.match(r"^[089]\d{3} ", line):
+                    break
+            return "".join(lines)
+    with os.popen("docker exec -i " + str(container_id) + " birdc " +
+                  cmd) as f:
+        return f.read()
+
+
+def sn_full_neighbors(reply):
+    # OSPF neighbors in Full state (Full/PtP, Full/DR...) of a
+    # "show ospf neighbors" reply, from birdc or the control socket
+    return len(re.findall(r"\s\d+\s+Full(?:/\S*)?\s", reply))
+
+
+def sn_route_count(reply):
+    # routes of a "show route count" reply: its "Total:" line when bird
+    # shows several tables, else the sum of the table lines
+    total = re.search(r"Total: (\d+) of \d+ routes", reply)
+    if total:
+        return int(total.group(1))
+    return sum(int(n) for n in re.findall(r"(\d+) of \d+ routes", reply))
+
+
+def sn_ospf_state(container_id):
+    # (neighbors in Full state, routes) of a container
+    return (sn_full_neighbors(sn_birdc(container_id, "show ospf neighbors")),
+            sn_route_count(sn_birdc(container_id, "show route count")))
+
+
+def sn_expected_ospf(container_id_list, conf_path):
+    # (neighbors, routes) each node has once OSPF converged: an adjacency
+    # per link configured in the bird files of both ends, and a route per
+    # subnet of the OSPF interfaces reachable through adjacencies.
+    # every container in parallel, one that failed has no address
+    all_addresses = sn_executor.map("addresses", sn_link_engine.addresses,
+                                    [(container_id, )
+                                     for container_id in container_id_list],
+                                    report=False)
+    active = []
+    for current, addresses in enumerate(all_addresses):
+        conf = conf_path + "/B" + str(current + 1) + ".conf"
+        configured = set()
+        if os.path.exists(conf):
+            with open(conf) as f:
+                configured = set(re.findall(r'interface "(B[^"]+)"', f.read()))
+        addresses = addresses or {}
+        active.append({
+            name: addresses[name]
+            for name in configured if name in addresses
+        })
+    parent = list(range(len(active)))
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    neighbors = [0] * len(active)
+    for node, interfaces in enumerate(active):
+        for name in interfaces:
+            peer = re.match(r"B\d+-eth(\d+)$", name)
+            if peer is None or int(peer.group(1)) > len(active):
+                continue
+            peer = int(peer.group(1)) - 1
+            if "B" + str(peer + 1) + "-eth" + str(node + 1) in active[peer]:
+                neighbors[node] += 1
+                parent[find(node)] = find(peer)
+    subnets = defaultdict(set)
+    for node, interfaces in enumerate(active):
+        for address in interfaces.values():
+            subnets[find(node)].add(ipaddress.ip_interface(address).network)
+    return [(neighbors[node], len(subnets[find(node)]))
+            for node in range(len(active))]
+
+
+def sn_wait_routing(container_id_list, conf_path, timeout, interval=1):
+    # Polls every node until it has its expected adjacencies and routes,
+    # or timeout (s). Returns the time to converge, None on timeout.
+    start = time.time()
+    expected = sn_expected_ospf(container_id_list, conf_path)
+    pending = list(range(len(container_id_list)))
+    while True:
+        states = sn_executor.map("OSPF state", sn_ospf_state,
+                                 [(container_id_list[node], )
+                                  for node in pending],
+                                 report=False)
+        observed = dict(zip(pending, states))
+        pending = [
+            node for node, state in zip(pending, states)
+            if state is None or state[0] < expected[node][0] or
+            state[1] < expected[node][1]
+        ]
+        elapsed = time.time() - start
+        if len(pending) == 0:
+            print("Routing converged in " + str(round(elapsed, 2)) + " s.")
+            return elapsed
+        if elapsed >= timeout:
+            print("Routing not converged after " + str(timeout) + " s: " +
+                  str(len(pending)) + " nodes pending (observed/expected "
+                  "Full neighbors and routes):")
+            for node in pending:
+                state = observed[node]
+                print("  B" + str(node + 1) + ": " +
+                      ("unreachable" if state is None else str(state[0])) +
+                      "/" + str(expected[node][0]) + " neighbors, " +
+                      ("-" if state is None else str(state[1])) + "/" +
+                      str(expected[node][1]) + " routes")
+            return None
+        sleep(interval)
+
+
+def sn_copy_run_conf_to_each_container(container_id_list,
+                                       sat_node_number,
+                                       fac_node_number,
+                                       path,
+                                       timeout=SN_ROUTING_TIMEOUT):
     print(
         "Copy bird configuration file to each container and run routing process."
     )
     total = len(container_id_list)
-    copy_threads = []
-    for current in range(0, total):
-        copy_thread = threading.Thread(
-            target=sn_copy_run_conf,
-            args=(container_id_list[current], path + "/conf/bird-" +
-                  str(sat_node_number) + "-" + str(fac_node_number), current,
-                  total))
-        copy_threads.append(copy_thread)
-    for copy_thread in copy_threads:
-        copy_thread.start()
-    for copy_thread in copy_threads:
-        copy_thread.join()
+    sn_executor.map("routing", sn_copy_run_conf,
+                    [(container_id_list[current], path + "/conf/bird-" +
+                      str(sat_node_number) + "-" + str(fac_node_number),
+                      current, total) for current in range(0, total)])
     print("Initializing routing...")
-    sleep(120)
+    sn_wait_routing(
+        container_id_list,
+        path + "/conf/bird-" + str(sat_node_number) + "-" +
+        str(fac_node_number), timeout)
     print("Routing initialized!")
 
 
-def sn_damage_link(sat_index, container_id_list):
-    with os.popen(
-            "docker exec -it " + str(container_id_list[sat_index]) +
-            " ifconfig | sed 's/[ \t].*//;/^\(eth0\|\)\(lo\|\)$/d'") as f:
-        ifconfig_output = f.readlines()
-        for intreface in range(0, len(ifconfig_output), 2):
-            os.system("docker exec -d " + str(container_id_list[sat_index]) +
-                      " tc qdisc change dev " +
-                      ifconfig_output[intreface][:-1] +
-                      " root netem loss 100%")
-            print("docker exec -d " + str(container_id_list[sat_index]) +
-                  " tc qdisc change dev " + ifconfig_output[intreface][:-1] +
-                  " root netem loss 100%")
-
-
-def sn_damage(random_list, container_id_list):
-    damage_threads = []
-    for random_satellite in random_list:
-        damage_thread = threading.Thread(target=sn_damage_link,
-                                         args=(int(random_satellite),
-                                               container_id_list))
-        damage_threads.append(damage_thread)
-    for damage_thread in damage_threads:
-        damage_thread.start()
-    for damage_thread in damage_threads:
-        damage_thread.join()
-
-
-def sn_recover_link(
-    damaged_satellite,
-    container_id_list,
-    sat_loss,
-):
-    with os.popen(
-            "docker exec -it " + str(container_id_list[damaged_satellite]) +
-            " ifconfig | sed 's/[ \t].*//;/^\(eth0\|\)\(lo\|\)$/d'") as f:
-        ifconfig_output = f.readlines()
-        for i in range(0, len(ifconfig_output), 2):
-            os.system("docker exec -d " +
-                      str(container_id_list[damaged_satellite]) +
-                      " tc qdisc change dev " + ifconfig_output[i][:-1] +
-                      " root netem loss " + str(sat_loss) + "%")
-            print("docker exec -d " +
-                  str(container_id_list[damaged_satellite]) +
-                  " tc qdisc change dev " + ifconfig_output[i][:-1] +
-                  " root netem loss " + str(sat_loss) + "%")
+def sn_container_interfaces(container_id):
+    # link interfaces (B<i>-eth<j>, B<i>-default) of a container
+    return sn_link_engine.interfaces(container_id)
+
+
+def sn_damage_link(sat_index, container_id_list, interfaces=None):
+    # operations damaging every link interface of a satellite
+    if interfaces is None:
+        interfaces = sn_container_interfaces(container_id_list[sat_index])
+    for intreface in interfaces:
+        print(str(container_id_list[sat_index]) + ": tc qdisc change dev " +
+              intreface + " root netem loss 100%")
+    return [('netem', intreface, None, 100, None) for intreface in interfaces]
+
+
+def sn_damage(random_list, container_id_list, interfaces=None):
+    # interfaces: cache of sn_container_interfaces by satellite index
+    batches = {}
+    for random_satellite in set(int(s) for s in random_list):
+        batches[container_id_list[random_satellite]] = sn_damage_link(
+            random_satellite, container_id_list,
+            None if interfaces is None else interfaces(random_satellite))
+    sn_apply_batches(batches)
+
+
+def sn_recover_link(damaged_satellite,
+                    container_id_list,
+                    sat_loss,
+                    interfaces=None):
+    if interfaces is None:
+        interfaces = sn_container_interfaces(
+            container_id_list[damaged_satellite])
+    for intreface in interfaces:
+        print(str(container_id_list[damaged_satellite]) +
+              ": tc qdisc change dev " + intreface + " root netem loss " +
+              str(sat_loss) + "%")
+    return [('netem', intreface, None, sat_loss, None)
+            for intreface in interfaces]
 
 
 def sn_del_network(network_name):
@@ -474,82 +813,256 @@ def sn_del_network(network_name):
 
 
 def sn_stop_emulation():
+    sn_link_engine.close()
     os.system("docker service rm constellation-test")
     with os.popen("docker rm -f $(docker ps -a -q)") as f:
         f.readlines()
     with os.popen("docker network ls") as f:
         all_br_info = f.readlines()
-        del_threads = []
-        for line in all_br_info:
-            if "La" in line or "Le" or "GS" in line:
-                network_name = line.split()[1]
-                del_thread = threading.Thread(target=sn_del_network,
-                                              args=(network_name, ))
-                del_threads.append(del_thread)
-        for del_thread in del_threads:
-            del_thread.start()
-        for del_thread in del_threads:
-            del_thread.join()
-
-
-def sn_recover(damage_list, container_id_list, sat_loss):
-    recover_threads = []
-    for damaged_satellite in damage_list:
-        recover_thread = threading.Thread(target=sn_recover_link,
-                                          args=(int(damaged_satellite),
-                                                container_id_list, sat_loss))
-        recover_threads.append(recover_thread)
-    for recover_thread in recover_threads:
-        recover_thread.start()
-    for recover_thread in recover_threads:
-        recover_thread.join()
-
-
-def sn_update_delay(matrix, container_id_list,
-                    constellation_size):  # updating delays
-    delay_threads = []
+    network_names = []
+    for line in all_br_info:
+        if "La" in line or "Le" or "GS" in line:
+            network_names.append((line.split()[1], ))
+    sn_executor.map("networks", sn_del_network, network_names)
+
+
+def sn_recover(damage_list, container_id_list, sat_loss, interfaces=None):
+    batches = {}
+    for damaged_satellite in set(int(s) for s in damage_list):
+        batches[container_id_list[damaged_satellite]] = sn_recover_link(
+            damaged_satellite, container_id_list, sat_loss,
+            None if interfaces is None else interfaces(damaged_satellite))
+    sn_apply_batches(batches)
+
+
+def sn_matrix_links(matrix):
+    # (row, col, delay) with row < col of every link in a dense matrix or in
+    # the link list loaded by sn_get_param.
+    if isinstance(matrix, dict):
+        for row in matrix:
+            for col, delay in matrix[row].items():
+                if row < col and delay > 0:
+                    yield row, col, delay
+        return
     for row in range(len(matrix)):
-        for col in range(row, len(matrix[row])):
+        for col in range(row + 1, len(matrix[row])):
             if float(matrix[row][col]) > 0:
-                if row < col:
-                    delay_thread = threading.Thread(
-                        target=sn_delay_change,
-                        args=(row, col, matrix[row][col], container_id_list,
-                              constellation_size))
-                    delay_threads.append(delay_thread)
-                else:
-                    delay_thread = threading.Thread(
-                        target=sn_delay_change,
-                        args=(col, row, matrix[col][row], container_id_list,
-                              constellation_size))
-                    delay_threads.append(delay_thread)
-    for delay_thread in delay_threads:
-        delay_thread.start()
-    for delay_thread in delay_threads:
-        delay_thread.join()
+                yield row, col, matrix[row][col]
+
+
+def sn_update_delay(matrix,
+                    container_id_list,
+                    constellation_size,
+                    isl=(None, None),
+                    gsl=(None, None),
+                    damaged=()):  # updating delays
+    # both ends of every link, grouped into one batch per container.
+    # tc qdisc change resets the netem parameters it is not given, so the
+    # (bw, loss) of the ISLs and GSLs go along with the delay, loss 100 on
+    # the interfaces of the damaged (0-based) satellites.
+    batches = defaultdict(list)
+    for row, col, delay in sn_matrix_links(matrix):
+        bw, loss = isl if col < constellation_size else gsl
+        for a, b in ((row, col), (col, row)):
+            batches[container_id_list[a]].append(
+                ('netem', "B" + str(a + 1) + "-eth" + str(b + 1), delay,
+                 100 if a in damaged else loss, bw))
+    sn_apply_batches(batches)
     print("Delay updating done.\n")
 
 
-def sn_delay_change(link_x, link_y, delay, container_id_list,
-                    constellation_size):  # multi-thread updating delays
-    if link_y <= constellation_size:
-        os.system("docker exec -d " + str(container_id_list[link_x]) +
-                  " tc qdisc change dev B" + str(link_x + 1) + "-eth" +
-                  str(link_y + 1) + " root netem delay " + str(delay) + "ms")
-        os.system("docker exec -d " + str(container_id_list[link_y]) +
-                  " tc qdisc change dev B" + str(link_y + 1) + "-eth" +
-                  str(link_x + 1) + " root netem delay " + str(delay) + "ms")
-    else:
-        os.system("docker exec -d " + str(container_id_list[link_x]) +
-                  " tc qdisc change dev B" + str(link_x + 1) + "-eth" +
-                  str(link_y + 1) + " root netem delay " + str(delay) + "ms")
-        os.system("docker exec -d " + str(container_id_list[link_y]) +
-                  " tc qdisc change dev B" + str(link_y + 1) + "-eth" +
-                  str(link_x + 1) + " root netem delay " + str(delay) + "ms")
+def sn_GSL_delete(first_index, second_index, container_id_list):
+    if sn_link_backend == "veth":
+        # removing one end of the pair removes the other one
+        sn_link_engine.delete(container_id_list[first_index - 1],
+                              "B" + str(first_index) + "-eth" +
+                              str(second_index))
+        return
+    sn_link_engine.set_state(container_id_list[second_index - 1],
+                             "B" + str(second_index) + "-eth" +
+                             str(first_index), False)
+    sn_link_engine.set_state(container_id_list[first_index - 1],
+                             "B" + str(first_index) + "-eth" +
+                             str(second_index), False)
+    GSL_name = "GSL_" + str(first_index) + "-" + str(second_index)
+    os.system('docker network disconnect ' + GSL_name + " " +
+              str(container_id_list[first_index - 1]))
+    os.system('docker network disconnect ' + GSL_name + " " +
+              str(container_id_list[second_index - 1]))
+    os.system('docker network rm ' + GSL_name)
+
+
+def sn_ISL_state(first_index, second_index, up, delay, bw, loss,
+                 container_id_list):
+    batches = {}
+    for i, j in ((first_index, second_index), (second_index, first_index)):
+        interface = "B" + str(i) + "-eth" + str(j)
+        batches[container_id_list[i - 1]] = [('state', interface, up)]
+        if up:
+            batches[container_id_list[i - 1]].append(
+                ('netem', interface, delay, loss, bw))
+    sn_apply_batches(batches)
+
+
+class sn_Orchestrater_Daemon():
+    # State kept between the commands of the daemon mode: the container
+    # list (docker ps) and the link interfaces of each container, read once
+    # and refreshed only for the containers whose links change.
+
+    def __init__(self, run_id=''):
+        self.run_id = run_id
+        self.container_id_list = sn_get_container_info()
+        self.interface_cache = {}
+        self.damaged = set()  # 0-based satellites at loss 100
+        self.lock = threading.Lock()
+
+    def interfaces(self, index):
+        # interfaces of the 0-based node index
+        with self.lock:
+            interfaces = self.interface_cache.get(index)
+        if interfaces is None:
+            interfaces = sn_container_interfaces(
+                self.container_id_list[index])
+            with self.lock:
+                self.interface_cache[index] = interfaces
+        return interfaces
+
+    def forget(self, *indexes):
+        with self.lock:
+            for index in indexes:
+                self.interface_cache.pop(index, None)
+
+    def handle(self, request):
+        # One command as a dict, returns the reply fields.
+        cmd = request['cmd']
+        if cmd == 'hello':
+            return {'run_id': self.run_id}
+        elif cmd == 'update_delays':
+            sn_update_delay(
+                sn_get_param(request['path']), self.container_id_list,
+                request['constellation_size'],
+                (request.get('sat_bw'), request.get('sat_loss')),
+                (request.get('sat_ground_bw'), request.get('sat_ground_loss')),
+                self.damaged)
+        elif cmd == 'damage':
+            sn_damage(request['satellites'], self.container_id_list,
+                      self.interfaces)
+            self.damaged.update(int(s) for s in request['satellites'])
+        elif cmd == 'recover':
+            sn_recover(request['satellites'], self.container_id_list,
+                       request['sat_loss'], self.interfaces)
+            self.damaged.difference_update(
+                int(s) for s in request['satellites'])
+        elif cmd == 'add_gsl':
+            sn_GSL_establish(request['sat'], request['gs'], request['delay'],
+                             self.container_id_list,
+                             request['constellation_size'], request['bw'],
+                             request['loss'])
+            self.forget(request['sat'] - 1, request['gs'] - 1)
+        elif cmd == 'del_link':
+            sn_GSL_delete(request['a'], request['b'], self.container_id_list)
+            self.forget(request['a'] - 1, request['b'] - 1)
+        elif cmd == 'set_isl':
+            sn_ISL_state(request['a'], request['b'], request['up'],
+                         request['delay'], request['bw'], request['loss'],
+                         self.container_id_list)
+        elif cmd == 'containers':
+            self.container_id_list = sn_get_container_info()
+            self.forget(*list(self.interface_cache))
+            return {'containers': len(self.container_id_list)}
+        elif cmd == 'stop':
+            sn_stop_emulation()
+        else:
+            raise ValueError("unknown command " + str(cmd))
+        return {}
+
+
+class sn_Orchestrater_Handler(socketserver.StreamRequestHandler):
+    # Line-delimited JSON: one {"cmd": ..., "token": ..., args} request per
+    # line, answered by {"ok", "elapsed" (s), "error" or the reply fields}.
+    # The token is the secret of orchestrater.port, readable by the owner of
+    # the daemon only; a request without it closes the connection.
+
+    def handle(self):
+        for line in self.rfile:
+            start = time.time()
+            request = None
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                reply = {'ok': False, 'error': repr(e)}
+            if request is not None and not (
+                    isinstance(request, dict) and hmac.compare_digest(
+                        str(request.get('token', '')), self.server.token)):
+                reply = {'ok': False, 'error': "unauthorized request"}
+                request = None
+            elif request is not None:
+                try:
+                    reply = self.server.daemon_state.handle(request)
+                    reply['ok'] = True
+                except Exception as e:
+                    # a failed stop still stops the daemon
+                    reply = {'ok': False, 'error': repr(e)}
+            reply['elapsed'] = time.time() - start
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+            if request is None:
+                return
+            if request.get('cmd') == 'stop':
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+def sn_port_file():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "orchestrater.port")
+
+
+def sn_run_daemon(port, run_id='', port_file=None):
+    # Serves commands on 127.0.0.1:port (a free one for 0), reached through
+    # the SSH transport of the controller, until a stop command. Once it
+    # listens, "<port> <run_id> <token>" goes to orchestrater.port next to
+    # this script, created with mode 0600: only its owner learns the token
+    # every request must carry, other local users cannot drive the links.
+    if port_file is None:
+        port_file = sn_port_file()
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', port),
+                                             sn_Orchestrater_Handler)
+    server.daemon_threads = True
+    server.daemon_state = sn_Orchestrater_Daemon(run_id)
+    server.token = uuid.uuid4().hex
+    port = server.server_address[1]
+    if os.path.exists(port_file + ".tmp"):
+        os.remove(port_file + ".tmp")
+    line = str(port) + " " + run_id + " " + server.token + "\n"
+    fd = os.open(port_file + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(line)
+    os.replace(port_file + ".tmp", port_file)
+    print("Orchestrater daemon listening on port " + str(port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        # unless a newer daemon took it over
+        if os.path.exists(port_file):
+            with open(port_file) as f:
+                mine = f.read() == line
+            if mine:
+                os.remove(port_file)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) == 10:
+    if len(sys.argv) in (3, 4, 5) and sys.argv[1] == 'daemon':
+        if len(sys.argv) >= 4:
+            sn_link_backend = sys.argv[3]
+        sn_run_daemon(int(sys.argv[2]),
+                      sys.argv[4] if len(sys.argv) == 5 else '')
+    elif len(sys.argv) in (10, 11):
+        if len(sys.argv) == 11:
+            sn_link_backend = sys.argv[10]
         orbit_num = int(sys.argv[1])
         sat_num = int(sys.argv[2])
         constellation_size = int(sys.argv[3])
@@ -565,21 +1078,29 @@ if __name__ == '__main__':
                           constellation_size, sat_bandwidth, sat_loss)
         sn_establish_GSL(container_id_list, matrix, GS_num, constellation_size,
                          sat_ground_bandwidth, sat_ground_loss)
-    elif len(sys.argv) == 4:
+    elif len(sys.argv) in (4, 5, 8):
         if sys.argv[3] == "update":
             current_delay_path = sys.argv[1]
             constellation_size = int(sys.argv[2])
+            # ISL and GSL bandwidth and loss, re-applied with the delays
+            isl = gsl = (None, None)
+            if len(sys.argv) == 8:
+                isl = (float(sys.argv[4]), float(sys.argv[5]))
+                gsl = (float(sys.argv[6]), float(sys.argv[7]))
             matrix = sn_get_param(current_delay_path)
             container_id_list = sn_get_container_info()
-            sn_update_delay(matrix, container_id_list, constellation_size)
+            sn_update_delay(matrix, container_id_list, constellation_size,
+                            isl, gsl)
         else:
             constellation_size = int(sys.argv[1])
             GS_num = int(sys.argv[2])
             path = sys.argv[3]
+            timeout = float(
+                sys.argv[4]) if len(sys.argv) == 5 else SN_ROUTING_TIMEOUT
             container_id_list = sn_get_container_info()
             sn_copy_run_conf_to_each_container(container_id_list,
                                                constellation_size, GS_num,
-                                               path)
+                                               path, timeout)
     elif len(sys.argv) == 2:
         path = sys.argv[1]
         random_list = numpy.loadtxt(path + "/damage_list.txt")
@@ -0,0 +1,534 @@
+#encoding: utf-8
+"""
+Vectorized satellite propagation used by sn_observer: all satellites are
+initialized as one SatrecArray and the whole (satellite x time) grid is
+propagated in a single call. Satellites come either from an idealized
+Walker shell or from a TLE catalog (tle/*.tle) sorted into the same
+orbit x slot grid.
+"""
+from datetime import datetime, timedelta
+import os
+from sgp4.api import Satrec, SatrecArray, WGS84, jday
+from skyfield.api import load
+from skyfield.sgp4lib import theta_GMST1982
+import numpy as np
+
+from starrynet.sn_timeline import sn_discard
+
+WGS84_A = 6378.137  # equatorial radius (km)
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+EMULATION_START = datetime(2022, 1, 1, 1, 0, 0)
+WALKER_EPOCH = datetime(2020, 1, 1, 0, 0, 0)
+# gravity constants of the WGS84 model the satrecs are initialized with
+SGP4_XKE = 60.0 / np.sqrt(6378.137**3 / 398600.5)
+SGP4_J2 = 0.00108262998905
+SGP4_RADIUS = 6378.137
+
+
+def sn_walker_satrecs(inclination,
+                      satellite_altitude,
+                      orbit_number,
+                      sat_number,
+                      orbit_start_long,
+                      orbit_spacing,
+                      epoch_date=WALKER_EPOCH):
+    # Idealized Walker shell, satellite index = orbit * sat_number + slot
+    since = datetime(1949, 12, 31, 0, 0, 0)
+    epoch = (epoch_date - since).total_seconds() / 86400
+    inclination = inclination * 2 * np.pi / 360
+    GM = 3.9860044e14
+    R = 6371393
+    altitude = satellite_altitude * 1000
+    mean_motion = np.sqrt(GM / (R + altitude)**3) * 60
+    num_of_sat = orbit_number * sat_number
+    F = 18
+    satrecs = []
+    for i in range(orbit_number):
+        if orbit_spacing > 0:
+            raan = orbit_start_long + i * (orbit_spacing * np.pi / 180)
+        else:
+            raan = i / orbit_number * 2 * np.pi
+        for j in range(sat_number):
+            mean_anomaly = (j * 360 / sat_number + i * 360 * F /
+                            num_of_sat) % 360 * 2 * np.pi / 360
+            satrec = Satrec()
+            satrec.sgp4init(
+                WGS84,  # gravity model
+                'i',  # 'a' = old AFSPC mode, 'i' = improved mode
+                i * sat_number + j,  # satnum: Satellite number
+                epoch,  # epoch: days since 1949 December 31 00:00 UT
+                2.8098e-05,  # bstar: drag coefficient (/earth radii)
+                6.969196665e-13,  # ndot: ballistic coefficient (revs/day)
+                0.0,  # nddot: second derivative of mean motion (revs/day^3)
+                0.001,  # ecco: eccentricity
+                0.0,  # argpo: argument of perigee (radians)
+                inclination,  # inclo: inclination (radians)
+                mean_anomaly,  # mo: mean anomaly (radians)
+                mean_motion,  # no_kozai: mean motion (radians/minute)
+                raan,  # nodeo: right ascension of ascending node (radians)
+            )
+            satrecs.append(satrec)
+    return satrecs
+
+
+def sn_walker_elements(inclination, satellite_altitude, orbit_number,
+                       sat_number, orbit_start_long, orbit_spacing):
+    # The sn_walker_satrecs shell as arrays: inclination, RAAN and mean
+    # anomaly (rad) and Kozai mean motion (rad/min) of every satellite.
+    GM = 3.9860044e14
+    R = 6371393
+    F = 18
+    num_of_sat = orbit_number * sat_number
+    orbit, slot = np.divmod(np.arange(num_of_sat), sat_number)
+    if orbit_spacing > 0:
+        raan = orbit_start_long + orbit * (orbit_spacing * np.pi / 180)
+    else:
+        raan = orbit / orbit_number * 2 * np.pi
+    mean_anomaly = (slot * 360 / sat_number + orbit * 360 * F /
+                    num_of_sat) % 360 * 2 * np.pi / 360
+    mean_motion = np.sqrt(GM / (R + satellite_altitude * 1000)**3) * 60
+    return (np.full(num_of_sat, inclination * 2 * np.pi / 360),
+            raan.astype(np.float64), mean_anomaly,
+            np.full(num_of_sat, mean_motion))
+
+
+def sn_j2_rates(inc, no_kozai):
+    # Semi-major axis (Earth radii) and J2 secular rates (rad/min) of RAAN
+    # and argument of latitude of circular orbits. Kozai mean motion is
+    # converted to the Brouwer one as in SGP4.
+    cos_i = np.cos(inc)
+    ak = (SGP4_XKE / no_kozai)**(2 / 3)
+    d1 = 0.75 * SGP4_J2 * (3 * cos_i * cos_i - 1)
+    delta = d1 / (ak * ak)
+    adel = ak * (1 - delta * delta - delta *
+                 (1 / 3 + 134 * delta * delta / 81))
+    no = no_kozai / (1 + d1 / (adel * adel))
+    a = (SGP4_XKE / no)**(2 / 3)
+    k = 1.5 * SGP4_J2 / (a * a) * no
+    raan_dot = -k * cos_i
+    u_dot = no + 0.5 * k * (3 * cos_i * cos_i - 1) - 0.5 * k * (
+        1 - 5 * cos_i * cos_i)
+    return a, raan_dot, u_dot
+
+
+def sn_walker_period(inclination, satellite_altitude):
+    # Nodal period (s) of the shell, after which the relative geometry of
+    # its satellites (and so every ISL delay) repeats.
+    inc, _, _, no_kozai = sn_walker_elements(inclination, satellite_altitude,
+                                             1, 1, 0, 0)
+    _, _, u_dot = sn_j2_rates(inc, no_kozai)
+    return float(2 * np.pi / u_dot[0] * 60)
+
+
+def sn_j2_propagate(inclination,
+                    satellite_altitude,
+                    orbit_number,
+                    sat_number,
+                    orbit_start_long,
+                    orbit_spacing,
+                    duration,
+                    resolution,
+                    first=0,
+                    start=EMULATION_START):
+    # Closed-form circular orbits with the J2 secular drift of RAAN and
+    # argument of latitude, same return values as sn_propagate. The shell
+    # is placed at its Walker phases at start (no drag, no short-period
+    # terms), see sn_j2_error for the deviation from SGP4.
+    inc, raan, mean_anomaly, no_kozai = sn_walker_elements(
+        inclination, satellite_altitude, orbit_number, sat_number,
+        orbit_start_long, orbit_spacing)
+    cos_i = np.cos(inc)
+    a, raan_dot, u_dot = sn_j2_rates(inc, no_kozai)
+    # (time, sat), minutes since start
+    tsince = (np.arange(first, first + duration) * resolution / 60.0)[:,
+                                                                       None]
+    raan = raan + raan_dot * tsince
+    u = mean_anomaly + u_dot * tsince
+    radius = a * SGP4_RADIUS
+    teme = np.empty((duration, len(inc), 3))
+    teme[..., 0] = radius * (np.cos(raan) * np.cos(u) -
+                             np.sin(raan) * np.sin(u) * cos_i)
+    teme[..., 1] = radius * (np.sin(raan) * np.cos(u) +
+                             np.cos(raan) * np.sin(u) * cos_i)
+    teme[..., 2] = radius * np.sin(u) * np.sin(inc)
+    jd, fr, fr_ut1 = sn_time_grid(duration, resolution, start, first)
+    ecef = sn_teme_to_ecef(teme, jd, fr_ut1)
+    lla = sn_ecef_to_lla(ecef)
+    return teme, ecef, lla
+
+
+def sn_j2_error(inclination,
+                satellite_altitude,
+                orbit_number,
+                sat_number,
+                orbit_start_long,
+                orbit_spacing,
+                duration,
+                resolution,
+                start=EMULATION_START,
+                samples=16):
+    # Largest position difference (km) between sn_j2_propagate and SGP4
+    # run on the same shell with its epoch at start, over samples instants
+    # spread across the emulation.
+    first = np.unique(np.linspace(0, duration - 1, samples).astype(int))
+    satrecs = sn_walker_satrecs(inclination, satellite_altitude,
+                                orbit_number, sat_number, orbit_start_long,
+                                orbit_spacing, start)
+    error = 0
+    for t in first.tolist():
+        sgp4_teme, _, _ = sn_propagate(satrecs, 1, resolution, t, start)
+        j2_teme, _, _ = sn_j2_propagate(inclination, satellite_altitude,
+                                        orbit_number, sat_number,
+                                        orbit_start_long, orbit_spacing, 1,
+                                        resolution, t, start)
+        error = max(error,
+                    np.linalg.norm(sgp4_teme - j2_teme, axis=-1).max())
+    return error
+
+
+def sn_read_tle(tle_path):
+    # [(name, line1, line2)] of a 3-line (or 2-line) TLE catalog
+    with open(tle_path) as f:
+        lines = [line.rstrip() for line in f if line.strip()]
+    tles = []
+    for num, line in enumerate(lines):
+        if line.startswith('1 ') and num + 1 < len(lines) and lines[
+                num + 1].startswith('2 '):
+            name = lines[num - 1].strip() if num > 0 and not lines[
+                num - 1].startswith('2 ') else line[2:7]
+            tles.append((name, line, lines[num + 1]))
+    return tles
+
+
+def sn_orbit_elements(r, v):
+    # Inclination, RAAN and argument of latitude (deg) of TEME state
+    # vectors (..., 3), as seen at the same instant for every satellite.
+    h = np.cross(r, v)
+    inclination = np.degrees(
+        np.arccos(h[..., 2] / np.linalg.norm(h, axis=-1)))
+    raan = np.arctan2(h[..., 0], -h[..., 1])
+    # angle from the ascending node to the satellite in the orbit plane
+    node = np.stack((np.cos(raan), np.sin(raan), np.zeros_like(raan)),
+                    axis=-1)
+    cos_u = np.sum(node * r, axis=-1)
+    sin_u = np.sum(np.cross(node, r) * h, axis=-1) / np.linalg.norm(h,
+                                                                    axis=-1)
+    u = np.degrees(np.arctan2(sin_u, cos_u)) % 360
+    return inclination, np.degrees(raan) % 360, u
+
+
+def sn_split_planes(shell, gap, cut):
+    # Orbital planes of a RAAN sorted shell, cut after every gap[k] where
+    # cut[k] (gap[k] follows shell[k]).
+    cuts = np.nonzero(cut)[0] + 1
+    if len(cuts):
+        # start from a cut so that no plane wraps around 360 deg
+        shell = np.roll(shell, -cuts[-1] % len(shell))
+        cuts = (cuts - cuts[-1]) % len(shell)
+    return [p for p in np.split(shell, np.sort(cuts)) if len(p)]
+
+
+def sn_check_isl(tle_path, r, satellite_altitude, orbit_number, sat_number):
+    # Reports the +Grid ISLs of a TLE grid (r: TEME positions in grid
+    # order) longer than the line of sight, grazing the Earth's surface.
+    limit = 2 * np.sqrt((WGS84_A + satellite_altitude)**2 - WGS84_A**2)
+    r = r.reshape(orbit_number, sat_number, 3)
+    length = np.stack(
+        (np.linalg.norm(r - np.roll(r, -1, axis=1), axis=-1),
+         np.linalg.norm(r - np.roll(r, -1, axis=0), axis=-1)))
+    if orbit_number == 1:
+        length = length[:1]
+    blocked = np.count_nonzero(length > limit)
+    if blocked:
+        print("Warning: " + str(blocked) + " ISLs of the " + tle_path +
+              " grid exceed the " + str(round(limit)) +
+              " km line of sight (longest " + str(round(length.max())) +
+              " km), the catalog misses satellites of the shell.")
+    return blocked
+
+
+def sn_tle_satrecs(tle_path,
+                   inclination,
+                   satellite_altitude,
+                   orbit_number,
+                   sat_number,
+                   inclination_tolerance=1.0,
+                   altitude_tolerance=25,
+                   plane_gap=None):
+    # Picks an orbit_number x sat_number grid out of a TLE catalog and
+    # returns its satrecs (index = orbit * sat_number + slot) and the
+    # emulation start, the minute of the newest TLE epoch.
+    # The shell is the most populated inclination group (split at 0.05 deg
+    # gaps) within the tolerances. It is cut into orbital planes wherever
+    # the sorted RAANs leave a gap above plane_gap degrees (by default at
+    # the largest relative jump between consecutive gap sizes). The
+    # orbit_number most populated planes are kept in RAAN order (with too
+    # few planes, the shell is cut at its orbit_number largest RAAN gaps)
+    # and each contributes, in phase order, the sat_number satellites
+    # closest to evenly spaced arguments of latitude, so the +Grid ISLs
+    # link neighbors as in a Walker shell. ISLs longer than the line of
+    # sight are reported.
+    satrecs = [
+        Satrec.twoline2rv(line1, line2)
+        for name, line1, line2 in sn_read_tle(tle_path)
+    ]
+    epoch = max(s.jdsatepoch + s.jdsatepochF for s in satrecs)
+    start = datetime(2000, 1, 1, 12) + timedelta(days=epoch - 2451545.0)
+    start = start.replace(second=0, microsecond=0)
+    jd, fr, _ = sn_time_grid(1, 1, start)
+    e, r, v = SatrecArray(satrecs).sgp4(jd, fr)
+    r, v = r[:, 0], v[:, 0]
+    inc, raan, u = sn_orbit_elements(r, v)
+    altitude = np.linalg.norm(r, axis=1) - WGS84_A
+    shell = np.nonzero((e[:, 0] == 0)
+                       & (np.abs(inc - inclination) <= inclination_tolerance)
+                       & (np.abs(altitude - satellite_altitude) <=
+                          altitude_tolerance))[0]
+    if len(shell) == 0:
+        raise ValueError("No satellite of " + tle_path + " matches " +
+                         str(inclination) + " deg / " +
+                         str(satellite_altitude) + " km.")
+    shell = shell[np.argsort(inc[shell])]
+    groups = np.split(shell, np.nonzero(np.diff(inc[shell]) > 0.05)[0] + 1)
+    shell = max(groups, key=len)
+    shell = shell[np.argsort(raan[shell])]
+    gap = np.diff(np.append(raan[shell], raan[shell[0]] + 360))
+    if plane_gap is None:
+        sizes = np.sort(gap[gap > 1e-3])
+        if len(sizes) > 1:
+            jump = np.argmax(sizes[1:] / sizes[:-1])
+            plane_gap = max(sizes[jump], 0.5)
+        else:
+            plane_gap = 0.5
+    planes = sn_split_planes(shell, gap, gap > plane_gap)
+    full = [p for p in planes if len(p) >= sat_number]
+    if len(full) < orbit_number:
+        # too few planes told apart, cut at the largest RAAN gaps instead
+        cut = np.zeros(len(gap), dtype=bool)
+        cut[np.argsort(gap)[-orbit_number:]] = True
+        cut_planes = sn_split_planes(shell, gap, cut)
+        cut_full = [p for p in cut_planes if len(p) >= sat_number]
+        # kept only if it tells more full planes apart
+        if len(cut_full) > len(full):
+            planes, full = cut_planes, cut_full
+    if len(full) < orbit_number:
+        sizes = sorted((len(p) for p in planes), reverse=True)
+        fits = []
+        if full:
+            fits.append(str(len(full)) + "x" + str(sat_number))
+        # orbit_number planes of the cut at the largest gaps
+        cut_sizes = sorted((len(p) for p in cut_planes), reverse=True)
+        if len(cut_sizes) >= orbit_number:
+            fits.append(
+                str(orbit_number) + "x" + str(cut_sizes[orbit_number - 1]))
+        raise ValueError(tle_path + " has " + str(len(full)) +
+                         " planes with at least " + str(sat_number) +
+                         " satellites, " + str(orbit_number) +
+                         " requested (plane sizes " + str(sizes) +
+                         "). Its shell fits a " + " or ".join(fits) +
+                         " grid (orbit_number x sat_number).")
+    full = sorted(sorted(full, key=len, reverse=True)[:orbit_number],
+                  key=lambda p: np.median(raan[p]))
+    grid = []
+    phase = None
+    for plane in full:
+        plane = list(plane[np.argsort(u[plane])])
+        if phase is None:
+            phase = u[plane[0]]
+        # the satellites closest to evenly spaced slot phases from the
+        # phase of the previous plane, so that the plane offset carries over
+        # and inter-orbit neighbors stay side by side
+        slots = []
+        for slot in range(sat_number):
+            target = (phase + slot * 360 / sat_number) % 360
+            # circular distance to the slot phase
+            dist = [abs((u[k] - target + 180) % 360 - 180) for k in plane]
+            slots.append(plane.pop(int(np.argmin(dist))))
+        # in phase order, slot 0 being the closest to the previous plane's
+        slots.sort(key=lambda k: (u[k] - phase + 180 / sat_number) % 360)
+        phase = u[slots[0]]
+        grid += slots
+    sn_check_isl(tle_path, r[grid], satellite_altitude, orbit_number,
+                 sat_number)
+    return [satrecs[k] for k in grid], start
+
+
+def sn_time_grid(duration, resolution, start=EMULATION_START, first=0):
+    # Julian dates of the sampling instants first ... first + duration - 1:
+    # whole day jd, UTC fraction fr for SGP4 and UT1 fraction fr_ut1 for the
+    # Earth rotation angle.
+    seconds = np.arange(first, first + duration) * resolution
+    day, fraction = jday(start.year, start.month, start.day, start.hour,
+                         start.minute,
+                         start.second + start.microsecond * 1e-6)
+    fr = fraction + seconds / 86400.0
+    whole = np.floor(fr)
+    jd = day + whole
+    fr = fr - whole
+    t_ts = load.timescale().utc(*start.timetuple()[:5],
+                                start.second + start.microsecond * 1e-6 +
+                                seconds)
+    fr_ut1 = np.asarray(t_ts.whole - jd + t_ts.ut1_fraction,
+                        dtype=np.float64)
+    return jd, fr, fr_ut1
+
+
+def sn_teme_to_ecef(teme, jd_ut1, fr_ut1):
+    # teme: (time, sat, 3). Rotate about z by the Greenwich mean sidereal
+    # angle of each instant (polar motion is neglected).
+    theta, _ = theta_GMST1982(jd_ut1, fr_ut1)
+    c = np.cos(theta)[:, None]
+    s = np.sin(theta)[:, None]
+    ecef = np.empty_like(teme)
+    ecef[..., 0] = c * teme[..., 0] + s * teme[..., 1]
+    ecef[..., 1] = -s * teme[..., 0] + c * teme[..., 1]
+    ecef[..., 2] = teme[..., 2]
+    return ecef
+
+
+def sn_ecef_to_lla(ecef):
+    # WGS84 geodetic latitude/longitude in degrees and elevation in km
+    x = ecef[..., 0]
+    y = ecef[..., 1]
+    z = ecef[..., 2]
+    lon = np.arctan2(y, x)
+    p = np.hypot(x, y)
+    lat = np.arctan2(z, p * (1 - WGS84_E2))
+    for _ in range(4):
+        sin_lat = np.sin(lat)
+        N = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat * sin_lat)
+        lat = np.arctan2(z + WGS84_E2 * N * sin_lat, p)
+    sin_lat = np.sin(lat)
+    N = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat * sin_lat)
+    h = p * np.cos(lat) + z * sin_lat - N * (1 - WGS84_E2 * sin_lat * sin_lat)
+    lla = np.empty_like(ecef)
+    lla[..., 0] = np.degrees(lat)
+    lla[..., 1] = np.degrees(lon)
+    lla[..., 2] = h
+    return lla
+
+
+def sn_geodetic_to_ecef(lat_long):
+    # lat_long: rows of [lat, long] or [lat, long, elevation (km)]
+    lat_long = [[float(v) for v in row] for row in lat_long]
+    lla = np.zeros((len(lat_long), 3))
+    for num, row in enumerate(lat_long):
+        lla[num, :len(row)] = row[:3]
+    lat = np.radians(lla[:, 0])
+    lon = np.radians(lla[:, 1])
+    N = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat)**2)
+    ecef = np.empty_like(lla)
+    ecef[:, 0] = (N + lla[:, 2]) * np.cos(lat) * np.cos(lon)
+    ecef[:, 1] = (N + lla[:, 2]) * np.cos(lat) * np.sin(lon)
+    ecef[:, 2] = (N * (1 - WGS84_E2) + lla[:, 2]) * np.sin(lat)
+    return ecef
+
+
+def sn_propagate(satrecs,
+                 duration,
+                 resolution,
+                 first=0,
+                 start=EMULATION_START):
+    # Returns contiguous (time, sat, 3) arrays: TEME (km), ECEF (km) and
+    # LLA (deg, deg, km) of the samples first ... first + duration - 1.
+    jd, fr, fr_ut1 = sn_time_grid(duration, resolution, start, first)
+    e, r, v = SatrecArray(satrecs).sgp4(jd, fr)
+    if np.any(e):
+        bad = np.unique(np.nonzero(e)[0])
+        print("SGP4 propagation error for satellites: " + str(bad.tolist()))
+    teme = np.ascontiguousarray(r.transpose(1, 0, 2))
+    ecef = sn_teme_to_ecef(teme, jd, fr_ut1)
+    lla = sn_ecef_to_lla(ecef)
+    return teme, ecef, lla
+
+
+def sn_position_path(path):
+    return path + "/position.npy"
+
+
+def sn_create_positions(path, duration, sat_num):
+    # One memory-mappable (time, sat, 3) float64 ECEF array (km), sample t
+    # is taken at t * resolution seconds. Filled by sn_store_positions.
+    store = np.lib.format.open_memmap(sn_position_path(path),
+                                      mode='w+',
+                                      dtype=np.float64,
+                                      shape=(duration, sat_num, 3))
+    del store
+
+
+def sn_store_positions(path, first, ecef):
+    store = np.load(sn_position_path(path), mmap_mode='r+')
+    store[first:first + len(ecef)] = ecef
+    store.flush()
+    del store
+
+
+def sn_discard_positions(path, first, last):
+    # Drops the samples first ... last - 1, they read as zeros afterwards.
+    store = np.load(sn_position_path(path), mmap_mode='r')
+    offset, stride = store.offset, store.strides[0]
+    del store
+    sn_discard(sn_position_path(path), offset + first * stride,
+               (last - first) * stride)
+
+
+class PositionStore():
+
+    def __init__(self, position_path, order=6):
+        self.ecef = np.load(position_path, mmap_mode='r')
+        self.duration, self.sat_num = self.ecef.shape[0], self.ecef.shape[1]
+        # number of samples of the Lagrange interpolation
+        self.order = max(1, min(order, self.duration))
+
+    def ecef_at(self, time_index):
+        # (sat, 3) ECEF at a sample index, fractional ones are interpolated
+        # in ECEF (smooth, no longitude wrap) through the nearest samples.
+        if float(time_index).is_integer():
+            return np.asarray(self.ecef[int(time_index)])
+        if time_index < 0 or time_index > self.duration - 1:
+            raise IndexError("time " + str(time_index) +
+                             " is out of the propagated range")
+        first = int(np.floor(time_index)) - (self.order - 1) // 2
+        first = min(max(first, 0), self.duration - self.order)
+        nodes = np.arange(first, first + self.order)
+        ecef = np.zeros((self.sat_num, 3))
+        for k in nodes:
+            others = nodes[nodes != k]
+            weight = np.prod((time_index - others) / (k - others))
+            ecef += weight * self.ecef[k]
+        return ecef
+
+    def positions(self, time_index):
+        # (sat, 3) latitude, longitude (deg) and altitude (km)
+        return sn_ecef_to_lla(self.ecef_at(time_index))
+
+    def position(self, sat_index, time_index):
+        # LLA of the 1-based satellite sat_index
+        return self.positions(time_index)[sat_index - 1]
+
+
+def sn_positions_from_text(position_dir, position_path):
+    # Converts the legacy position/<t>.txt LLA files of an old run.
+    duration = 0
+    while os.path.exists(position_dir + "/" + str(duration) + ".txt"):
+        duration += 1
+    if duration == 0:
+        raise FileNotFoundError("No position files in " + position_dir)
+    ecef = np.stack([
+        sn_geodetic_to_ecef(
+            np.loadtxt(position_dir + "/" + str(t) + ".txt",
+                       delimiter=',',
+                       ndmin=2)) for t in range(duration)
+    ])
+    np.save(position_path, ecef)
+    return PositionStore(position_path)
+
+
+def sn_open_positions(path):
+    # Opens <path>/position.npy, converting an old position/*.txt run.
+    position_path = sn_position_path(path)
+    if os.path.exists(position_path):
+        return PositionStore(position_path)
+    return sn_positions_from_text(path + "/position", position_path)
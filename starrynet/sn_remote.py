@@ -0,0 +1,308 @@
+#encoding: utf-8
+"""
+Remote command execution over the SSH transport of the remote machine.
+Every command runs on its own session channel of that single transport,
+without a PTY, from a bounded pool of threads, so independent commands
+overlap instead of queueing behind each other. sshd allows 10 sessions
+per connection by default (MaxSessions), which bounds the pool size.
+
+RemoteOrchestrator keeps sn_orchestrater.py running on the remote machine
+as a daemon and sends it line-delimited JSON commands over a direct-tcpip
+channel of the same transport, so a command costs one round trip instead
+of an upload and a new python3 process. Each run starts its own daemon on
+a free port, which it writes with the run id and a random token into
+orchestrater.port next to the script (mode 0600). The controller checks
+the run id before sending any command, so a daemon left over by an
+earlier run is never reused, and every request carries the token, without
+which the daemon refuses it.
+
+RemoteFiles uploads over SFTP and remembers the content hash of every file
+it pushed, so unchanged files are not sent again and files already on the
+remote machine under another name are copied there.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import json
+import os
+import select
+import socket
+import tarfile
+import threading
+import time
+import uuid
+
+DEFAULT_CHANNELS = 8
+RECV_SIZE = 32768
+# 0 lets every daemon bind a free port, read back from orchestrater.port
+ORCHESTRATOR_PORT = 0
+
+# stdout is a list of lines (with their line breaks), as readlines() gives
+RemoteResult = namedtuple('RemoteResult',
+                          ['cmd', 'exit_code', 'stdout', 'stderr', 'elapsed'])
+
+
+class RemoteExecutor():
+
+    def __init__(self, transport, channels=DEFAULT_CHANNELS, timeout=None):
+        self.transport = transport
+        self.channels = channels
+        # seconds a command may run, None to wait for it
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=channels,
+                                       thread_name_prefix='sn_remote')
+
+    def execute(self, cmd):
+        start = time.time()
+        channel = self.transport.open_session()
+        try:
+            channel.settimeout(self.timeout)
+            channel.exec_command(cmd)
+            # both streams drained as they come, so a command filling the
+            # stderr window never stalls its stdout
+            stdout, stderr = [], []
+            while True:
+                # read first: all the data is buffered once EOF is received
+                eof = channel.eof_received or channel.closed
+                if channel.recv_ready():
+                    stdout.append(channel.recv(RECV_SIZE))
+                elif channel.recv_stderr_ready():
+                    stderr.append(channel.recv_stderr(RECV_SIZE))
+                elif eof:
+                    break
+                elif not select.select([channel], [], [], self.timeout)[0]:
+                    raise socket.timeout(cmd + " timed out")
+            exit_code = channel.recv_exit_status()
+        finally:
+            channel.close()
+        return RemoteResult(
+            cmd, exit_code,
+            b"".join(stdout).decode(errors='replace').splitlines(True),
+            b"".join(stderr).decode(errors='replace'), time.time() - start)
+
+    def submit(self, cmd):
+        # Future of the RemoteResult of cmd
+        return self.pool.submit(self.execute, cmd)
+
+    def run(self, cmd):
+        return self.submit(cmd).result()
+
+    def run_all(self, cmds):
+        # RemoteResults of independent commands, run concurrently
+        return [future.result() for future in [self.submit(c) for c in cmds]]
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+def sn_file_hash(local_file):
+    digest = hashlib.sha1()
+    with open(local_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RemoteFiles():
+
+    def __init__(self, remote_ftp, executor):
+        self.remote_ftp = remote_ftp
+        self.executor = executor
+        self.hashes = {}  # remote path -> content hash pushed there
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.files_sent = 0
+        self.files_copied = 0
+        self.files_skipped = 0
+
+    def plan(self, uploads):
+        # Splits (local, remote) pairs into files to send and remote copies
+        # from a path that held the same content when it was pushed, as
+        # (source, remote, local, size, hash). A file whose remote path was
+        # last pushed with the same content is skipped without looking at
+        # the remote machine, see forget().
+        send, copies = [], []
+        with self.lock:
+            for local_file, remote_file in uploads:
+                digest = sn_file_hash(local_file)
+                size = os.path.getsize(local_file)
+                if self.hashes.get(remote_file) == digest:
+                    self.files_skipped += 1
+                    self.bytes_saved += size
+                    continue
+                source = next((path for path, known in self.hashes.items()
+                               if known == digest), None)
+                if source is not None:
+                    copies.append(
+                        (source, remote_file, local_file, size, digest))
+                    self.bytes_saved += size
+                else:
+                    send.append((local_file, remote_file, size))
+                self.hashes[remote_file] = digest
+        return send, copies
+
+    def forget(self, remote_file):
+        # For files changed on the remote machine by other means: plan()
+        # trusts the hash pushed last and never rereads the remote file, so
+        # until it is forgotten a changed file is not uploaded again.
+        with self.lock:
+            self.hashes.pop(remote_file, None)
+
+    def put(self, local_file, remote_file):
+        self.put_all([(local_file, remote_file)])
+
+    def put_all(self, uploads):
+        # Several files go in one tar archive, extracted remotely.
+        send, copies = self.plan(uploads)
+        try:
+            self.send(send)
+            if copies:
+                stale = self.copy(copies)
+                # sent after all, not saved
+                self.count(0, -sum(size for _, _, size in stale))
+                self.send(stale)
+                with self.lock:
+                    self.files_copied += len(copies) - len(stale)
+                    self.files_sent += len(stale)
+        except Exception:
+            with self.lock:
+                for local_file, remote_file, size in send:
+                    self.hashes.pop(remote_file, None)
+                for source, remote_file, _, _, _ in copies:
+                    self.hashes.pop(remote_file, None)
+            raise
+        with self.lock:
+            self.files_sent += len(send)
+
+    def send(self, send):
+        if len(send) == 1:
+            local_file, remote_file, size = send[0]
+            self.remote_ftp.put(local_file, remote_file)
+            self.count(size, 0)
+        elif len(send) > 1:
+            self.put_archive(send)
+
+    def copy(self, copies):
+        # Remote copies, each one only if its source still has the content
+        # it was pushed with (it may have changed there since). Returns the
+        # (local, remote, size) uploads to send instead.
+        results = self.executor.run_all([
+            "[ \"$(sha1sum < " + source + " | cut -c1-40)\" = " + digest +
+            " ] && cp " + source + " " + remote_file
+            for source, remote_file, _, _, digest in copies
+        ])
+        stale = []
+        for (source, remote_file, local_file, size,
+             digest), result in zip(copies, results):
+            if result.exit_code != 0:
+                self.forget(source)
+                stale.append((local_file, remote_file, size))
+        return stale
+
+    def put_archive(self, send):
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+            for local_file, remote_file, size in send:
+                # add() would strip the leading / of absolute names
+                info = archive.gettarinfo(local_file)
+                info.name = remote_file
+                with open(local_file, 'rb') as f:
+                    archive.addfile(info, f)
+        archive_file = "sn_upload_" + str(os.getpid()) + ".tar.gz"
+        buffer.seek(0)
+        self.remote_ftp.putfo(buffer, archive_file)
+        sent = buffer.getbuffer().nbytes
+        self.count(sent, max(0, sum(size for _, _, size in send) - sent))
+        # -P keeps absolute member names, relative ones land in $HOME
+        result = self.executor.run("tar -xPzf " + archive_file + " && rm " +
+                                   archive_file)
+        if result.exit_code != 0:
+            raise IOError("extracting " + archive_file + " failed: " +
+                          result.stderr)
+
+    def count(self, sent, saved):
+        with self.lock:
+            self.bytes_sent += sent
+            self.bytes_saved += saved
+
+    def report(self):
+        return ("Uploads: " + str(self.files_sent) + " files, " +
+                str(self.bytes_sent) + " bytes sent, " +
+                str(self.files_copied) + " copied remotely, " +
+                str(self.files_skipped) + " unchanged files skipped, " +
+                str(self.bytes_saved) + " bytes saved.")
+
+
+class RemoteOrchestrator():
+
+    def __init__(self, executor, remote_files, file_path,
+                 port=ORCHESTRATOR_PORT, timeout=None, link_backend="bridge"):
+        self.executor = executor
+        self.link_backend = link_backend
+        self.remote_files = remote_files
+        self.file_path = file_path
+        self.port = port
+        self.timeout = timeout
+        self.channel = None
+        self.reader = None
+        self.token = None
+        self.lock = threading.Lock()
+
+    def start(self, local_file, attempts=50, interval=0.2):
+        # Uploads the orchestrator once, starts it detached and connects.
+        remote_file = self.file_path + '/sn_orchestrater.py'
+        port_file = self.file_path + '/orchestrater.port'
+        log_file = self.file_path + '/orchestrater.log'
+        self.run_id = uuid.uuid4().hex
+        self.remote_files.put(local_file, remote_file)
+        self.executor.run("rm -f " + port_file + " && nohup python3 " +
+                          remote_file + " daemon " + str(self.port) + " " +
+                          self.link_backend + " " + self.run_id + " > " +
+                          log_file + " 2>&1 < /dev/null &")
+        for attempt in range(attempts):
+            # "<port> <run id> <token>" once the daemon of this run listens
+            result = self.executor.run("cat " + port_file)
+            fields = "".join(result.stdout).split()
+            if result.exit_code == 0 and fields[1:2] == [self.run_id]:
+                self.port = int(fields[0])
+                self.token = fields[2]
+                break
+            time.sleep(interval)
+        else:
+            raise RuntimeError("orchestrator daemon did not start, see " +
+                               log_file)
+        self.channel = self.executor.transport.open_channel(
+            'direct-tcpip', ('127.0.0.1', self.port), ('127.0.0.1', 0))
+        self.channel.settimeout(self.timeout)
+        self.reader = self.channel.makefile('r')
+        run_id = self.request('hello')['run_id']
+        if run_id != self.run_id:
+            self.close()
+            raise RuntimeError("port " + str(self.port) +
+                               " is served by another orchestrator daemon"
+                               " (run " + run_id + ")")
+        return self
+
+    def request(self, cmd, **args):
+        # Reply dict of the command, raises if it failed remotely
+        args['cmd'] = cmd
+        args['token'] = self.token
+        with self.lock:
+            self.channel.sendall((json.dumps(args) + "\n").encode())
+            line = self.reader.readline()
+        if not line:
+            raise ConnectionError("orchestrator daemon closed the channel "
+                                  "during " + cmd + ", see " +
+                                  self.file_path + "/orchestrater.log")
+        reply = json.loads(line)
+        if not reply['ok']:
+            raise RuntimeError("orchestrator: " + cmd + " failed: " +
+                               reply['error'])
+        return reply
+
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
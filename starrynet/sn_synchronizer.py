@@ -45,11 +45,28 @@ class StarryNet():
         self.multi_machine = sn_args.multi_machine
         self.antenna_number = sn_args.antenna_number
         self.antenna_inclination = sn_args.antenna_inclination
+        self.topology_layout = sn_args.topology_layout
+        self.query_cache = sn_args.query_cache
+        self.workers = sn_args.workers
+        self.cache_size = sn_args.cache_size
+        self.tle_file = sn_args.tle_file
+        self.propagator = sn_args.propagator
+        self.epsilon = sn_args.epsilon
+        self.lookahead = sn_args.lookahead
+        self.delay_threshold = sn_args.delay_threshold
+        self.delay_ratio = sn_args.delay_ratio
+        self.link_backend = sn_args.link_backend
+        self.routing_timeout = sn_args.routing_timeout
+        self.routing_convergence_time = None  # s, measured by routing init
         self.container_global_idx = 1
         self.hello_interval = hello_interval
         self.AS = AS
         self.configuration_file_path = os.path.dirname(
             os.path.abspath(configuration_file_path))
+        if self.tle_file:
+            # relative to the configuration file
+            self.tle_file = os.path.join(self.configuration_file_path,
+                                         self.tle_file)
         self.file_path = './' + sn_args.cons_name + '-' + str(
             sn_args.orbit_number) + '-' + str(sn_args.sat_number) + '-' + str(
                 sn_args.satellite_altitude) + '-' + str(
@@ -63,7 +80,14 @@ class StarryNet():
                                  self.antenna_number,
                                  GS_lat_long, self.antenna_inclination,
                                  self.intra_routing, self.hello_interval,
-                                 self.AS)
+                                 self.AS, self.topology_layout,
+                                 self.sat_bandwidth,
+                                 self.sat_ground_bandwidth, self.sat_loss,
+                                 self.sat_ground_loss, self.workers,
+                                 self.configuration_file_path + "/cache",
+                                 self.cache_size * 1024 * 1024,
+                                 self.tle_file, self.propagator, self.cycle,
+                                 self.epsilon, self.lookahead)
         self.docker_service_name = 'constellation-test'
         self.isl_idx = 0
         self.ISL_hub = 'ISL_hub'
@@ -83,6 +107,7 @@ class StarryNet():
         if self.remote_ftp is None:
             print('Remote ftp login failure.')
             return
+        self.remote = sn_remote_executor(self.remote_ssh, sn_args.channels)
         self.utility_checking_time = []
         self.ping_src = []
         self.ping_des = []
@@ -110,6 +135,13 @@ class StarryNet():
         sn_thread.join()
         # Initiate a necessary delay and position data for emulation
         self.observer.calculate_delay()
+        self.timeline = sn_open_timeline(
+            self.configuration_file_path + "/" + self.file_path,
+            self.resolution, self.observer.window)
+        self.topology = TopologyCache(self.timeline,
+                                      self.query_cache * 1024 * 1024)
+        self.positions = sn_open_positions(self.configuration_file_path + "/" +
+                                           self.file_path)
         # Generate configuration file for routing
         self.observer.generate_conf(self.remote_ssh, self.remote_ftp)
 
@@ -131,7 +163,8 @@ class StarryNet():
             self.remote_ssh, self.remote_ftp, self.orbit_number,
             self.sat_number, self.constellation_size, self.fac_num,
             self.file_path, self.configuration_file_path, self.sat_bandwidth,
-            self.sat_ground_bandwidth, self.sat_loss, self.sat_ground_loss)
+            self.sat_ground_bandwidth, self.sat_loss, self.sat_ground_loss,
+            self.link_backend)
         isl_thread.start()
         isl_thread.join()
         print("Link initialization done.")
@@ -141,49 +174,59 @@ class StarryNet():
             self.remote_ssh, self.remote_ftp, self.orbit_number,
             self.sat_number, self.constellation_size, self.fac_num,
             self.file_path, self.sat_bandwidth, self.sat_ground_bandwidth,
-            self.sat_loss, self.sat_ground_loss)
+            self.sat_loss, self.sat_ground_loss, self.routing_timeout)
         routing_thread.start()
         routing_thread.join()
+        self.routing_convergence_time = routing_thread.convergence_time
         print("Bird routing in all containers are running.")
 
     def get_distance(self, sat1_index, sat2_index, time_index):
-        delaypath = self.configuration_file_path + "/" + self.file_path + '/delay/' + str(
-            time_index) + '.txt'
-        adjacency_matrix = sn_get_param(delaypath)
-        delay = float(adjacency_matrix[sat1_index - 1][sat2_index - 1])
+        delay = self.topology.delay(sat1_index, sat2_index, time_index)
         dis = delay * (17.31 / 29.5 * 299792.458) / 1000  # km
         return dis
 
     def get_neighbors(self, sat_index, time_index):
-        neighbors = []
-        delaypath = self.configuration_file_path + "/" + self.file_path + '/delay/' + str(
-            time_index) + '.txt'
-        adjacency_matrix = sn_get_param(delaypath)
         sats = self.orbit_number * self.sat_number
-        for i in range(sats):
-            if (float(adjacency_matrix[i][sat_index - 1]) > 0.01):
-                neighbors.append(i + 1)
-        return neighbors
+        neighbors = self.topology.neighbors(sat_index, time_index)
+        return neighbors[neighbors <= sats].tolist()
 
     def get_GSes(self, sat_index, time_index):
-        GSes = []
-        delaypath = self.configuration_file_path + "/" + self.file_path + '/delay/' + str(
-            time_index) + '.txt'
-        adjacency_matrix = sn_get_param(delaypath)
         sats = self.orbit_number * self.sat_number
-        for i in range(sats, len(adjacency_matrix)):
-            if (float(adjacency_matrix[i][sat_index - 1]) > 0.01):
-                GSes.append(i + 1)
-        return GSes
+        GSes = self.topology.neighbors(sat_index, time_index)
+        return GSes[GSes > sats].tolist()
+
+    # Batch variants, time_indexes defaults to every timestep.
+    def get_distance_series(self, pairs, time_indexes=None):
+        # pairs: (P, 2) node indexes. Returns (time, P) distances in km.
+        pairs = np.asarray(pairs).reshape(-1, 2)
+        delay = self.timeline.delay_series(pairs[:, 0], pairs[:, 1],
+                                           time_indexes)
+        return delay * (17.31 / 29.5 * 299792.458) / 1000  # km
+
+    def get_neighbor_timeline(self, sat_index, time_indexes=None):
+        # (time, node) bool matrix, column j is node j + 1
+        return self.timeline.neighbor_series(sat_index, time_indexes)
+
+    def get_GS_timeline(self, time_indexes=None):
+        # (time, satellite, GS) bool matrix of the GS attachments
+        return self.timeline.gsl_series(self.orbit_number * self.sat_number,
+                                        time_indexes)
+
+    def get_cache_stats(self):
+        # hit/miss counters and memory use of the query cache
+        return self.topology.stats()
 
     def get_utility(self, time_index):
         self.utility_checking_time.append(time_index)
 
     def get_position(self, sat_index, time_index):
-        path = self.configuration_file_path + "/" + self.file_path + '/position/' + '/%d.txt' % time_index
-        f = open(path)
-        ADJ = f.readlines()
-        return ADJ[sat_index - 1]
+        # time_index may be fractional, e.g. 10.5 lies between samples 10
+        # and 11. Returns [latitude, longitude, altitude (km)].
+        return self.positions.position(sat_index, time_index)
+
+    def get_positions(self, time_index):
+        # (satellite, 3) LLA of all the satellites at once
+        return self.positions.positions(time_index)
 
     def get_IP(self, sat_index):
         IP_info = sn_remote_cmd(
@@ -236,7 +279,9 @@ class StarryNet():
             self.damage_list, self.recovery_time, self.route_src,
             self.route_time, self.duration, self.resolution,
             self.utility_checking_time,
-            self.perf_src, self.perf_des, self.perf_time, self.perf_options)
+            self.perf_src, self.perf_des, self.perf_time, self.perf_options,
+            self.observer.window, self.delay_threshold, self.delay_ratio,
+            self.link_backend, self.sat_bandwidth)
         sn_thread.start()
         sn_thread.join()
 
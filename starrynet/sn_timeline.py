@@ -0,0 +1,783 @@
+#encoding: utf-8
+"""
+Binary topology timeline written by the Observer. One file holds the link
+delays (ms) of every timestep: a fixed 64-byte header followed by one
+fixed-stride record per timestep, read through numpy.memmap without any
+parsing. Two layouts are supported:
+
+dense:  each record is the (node_num, node_num) float32 delay matrix.
+sparse: each record holds the +Grid ISL delays as (sat_num, 2) float32
+        (intra-orbit link to the next slot, inter-orbit link to the next
+        orbit), then for every GS the indexes (int32, -1 for none) and
+        delays (float32) of its antenna_number GSLs. Size scales with the
+        number of links instead of node_num^2.
+        With a non-zero isl_period the ISL delays of timesteps
+        1 ... isl_period are stored once, in a block between the header
+        and the records, and reused modulo isl_period; the records then
+        only hold the GSLs.
+
+An adaptive timeline (sn_compact_timeline) only keeps the records of its
+keyframes, the timesteps where a link appears or disappears or some delay
+moved by more than epsilon. An int32 table after the header (and ISL
+block) gives the keyframe every timestep reads, and timesteps between
+keyframes repeat it entirely, ISLs included.
+"""
+from collections import defaultdict, OrderedDict
+import json
+import mmap
+import os
+import struct
+import numpy as np
+
+TIMELINE_MAGIC = b'SNTL'
+TIMELINE_VERSION = 1
+# magic, version, layout, node number, duration, resolution (s)
+TIMELINE_HEADER = struct.Struct('<4sHHIId')
+# sparse only: orbit number, satellites per orbit, GS number, antenna number,
+# ISL period (timesteps, 0 for ISL delays in every record)
+TIMELINE_GRID = struct.Struct('<IIIII')
+# number of keyframes, 0 for a record per timestep
+TIMELINE_FRAMES = struct.Struct('<I')
+TIMELINE_FRAMES_OFFSET = TIMELINE_HEADER.size + TIMELINE_GRID.size
+TIMELINE_HEADER_SIZE = 64
+LAYOUT_DENSE = 0
+LAYOUT_SPARSE = 1
+LAYOUTS = {'dense': LAYOUT_DENSE, 'sparse': LAYOUT_SPARSE}
+# bytes of records copied at once when a timeline is compacted
+COMPACT_CHUNK = 64 * 1024 * 1024
+
+
+def sn_timeline_path(path):
+    return path + "/topology.bin"
+
+
+# Satellite indexes of the intra-orbit and inter-orbit +Grid neighbors.
+def sn_isl_peers(num_orbits, num_sats_per_orbit):
+    orbit, slot = np.divmod(np.arange(num_orbits * num_sats_per_orbit),
+                            num_sats_per_orbit)
+    down = orbit * num_sats_per_orbit + (slot + 1) % num_sats_per_orbit
+    right = ((orbit + 1) % num_orbits) * num_sats_per_orbit + slot
+    return down, right
+
+
+def sn_sparse_dtype(sat_num, fac_num, antenna_num, isl=True):
+    fields = [('gsl_sat', '<i4', (fac_num, antenna_num)),
+              ('gsl_delay', '<f4', (fac_num, antenna_num))]
+    if isl:
+        fields.insert(0, ('isl', '<f4', (sat_num, 2)))
+    return np.dtype(fields)
+
+
+def sn_discard(file_path, offset, length):
+    # Frees the disk blocks and cached pages of the whole pages within a
+    # byte range of a store, which then reads as zeros (Linux only).
+    start = -(-offset // mmap.PAGESIZE) * mmap.PAGESIZE
+    end = (offset + length) // mmap.PAGESIZE * mmap.PAGESIZE
+    if end <= start or not hasattr(mmap, 'MADV_REMOVE'):
+        return
+    with open(file_path, 'r+b') as f:
+        m = mmap.mmap(f.fileno(), end)
+        m.madvise(mmap.MADV_REMOVE, start, end - start)
+        m.close()
+
+
+def sn_write_header(timeline_path,
+                    layout,
+                    node_num,
+                    duration,
+                    resolution,
+                    grid=(0, 0, 0, 0, 0),
+                    keyframes=0):
+    with open(timeline_path, 'wb') as f:
+        header = TIMELINE_HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION,
+                                      layout, node_num, duration,
+                                      resolution) + TIMELINE_GRID.pack(*grid)
+        header += TIMELINE_FRAMES.pack(keyframes)
+        f.write(header.ljust(TIMELINE_HEADER_SIZE, b'\0'))
+
+
+def sn_create_timeline(timeline_path, node_num, duration, resolution):
+    # Returns a writable memmap of all the dense delay matrices; timestep t
+    # (the legacy delay/<t>.txt, starting from 1) is row t - 1.
+    sn_write_header(timeline_path, LAYOUT_DENSE, node_num, duration,
+                    resolution)
+    return np.memmap(timeline_path,
+                     dtype=np.float32,
+                     mode='r+',
+                     offset=TIMELINE_HEADER_SIZE,
+                     shape=(duration, node_num, node_num))
+
+
+def sn_create_sparse_timeline(timeline_path,
+                              orbit_number,
+                              sat_number,
+                              fac_num,
+                              antenna_num,
+                              duration,
+                              resolution,
+                              isl_period=0):
+    sat_num = orbit_number * sat_number
+    sn_write_header(timeline_path, LAYOUT_SPARSE, sat_num + fac_num,
+                    duration, resolution,
+                    (orbit_number, sat_number, fac_num, antenna_num,
+                     isl_period))
+    # sized by opening it for writing
+    return Timeline(timeline_path, 'r+')
+
+
+def sn_store_delay(matrices, time_index, delay_matrix):
+    # Same 0.01 ms precision as the legacy '%.2f' text files.
+    matrices[time_index - 1] = np.round(delay_matrix, 2)
+
+
+def sn_store_links(timeline, time_index, gsl_sat, gsl_delay, isl_delay):
+    # isl_delay is only needed (and stored) for time_index <= isl_period
+    record = timeline.records[time_index - 1]
+    if time_index <= timeline.isl_period:
+        timeline.isl_block[time_index - 1] = np.round(isl_delay, 2)
+    record['gsl_sat'] = gsl_sat
+    record['gsl_delay'] = np.where(gsl_sat >= 0, np.round(gsl_delay, 2), 0)
+
+
+def sn_keyframes(timeline, epsilon):
+    # Timesteps that start a keyframe: the first one, then every timestep
+    # whose links differ from the current keyframe or whose delays moved
+    # by more than epsilon (ms) from it.
+    keyframes = [1]
+    mask = timeline.link_mask(1)
+    delays = timeline.link_delays(1)
+    for time_index in range(2, timeline.duration + 1):
+        now_mask = timeline.link_mask(time_index)
+        now_delays = timeline.link_delays(time_index)
+        if np.any(now_mask != mask) or np.max(
+                np.abs(now_delays - delays), initial=0) > epsilon:
+            keyframes.append(time_index)
+            mask, delays = now_mask, now_delays
+    return np.array(keyframes)
+
+
+def sn_write_rows(f, records, rows):
+    # records[rows] copied to f a bounded chunk at a time
+    step = max(1, COMPACT_CHUNK // max(records.strides[0], 1))
+    for start in range(0, len(rows), step):
+        f.write(
+            np.ascontiguousarray(records[rows[start:start + step]]).tobytes())
+
+
+def sn_compact_timeline(timeline_path, epsilon):
+    # Rewrites a uniformly sampled timeline in place, keeping only the
+    # records of its keyframes. Returns the number of keyframes.
+    timeline = Timeline(timeline_path)
+    if timeline.keyframes:
+        return timeline.keyframes
+    keyframes = sn_keyframes(timeline, epsilon)
+    frames = keyframes[np.searchsorted(
+        keyframes, np.arange(1, timeline.duration + 1), side='right') - 1]
+    with open(timeline_path, 'rb') as f:
+        header = bytearray(f.read(TIMELINE_HEADER_SIZE))
+    TIMELINE_FRAMES.pack_into(header, TIMELINE_FRAMES_OFFSET, len(keyframes))
+    if timeline.layout == LAYOUT_DENSE:
+        records = timeline.matrices
+    else:
+        records = timeline.records
+    # the ISL block of a sparse timeline is kept as is
+    isl_block = timeline.layout == LAYOUT_SPARSE and (
+        'isl' not in records.dtype.names)
+    compact_path = timeline_path + ".compact"
+    with open(compact_path, 'wb') as f:
+        f.write(header)
+        if isl_block:
+            sn_write_rows(f, timeline.isl_block,
+                          np.arange(len(timeline.isl_block)))
+        f.write(frames.astype('<i4').tobytes())
+        sn_write_rows(f, records, keyframes - 1)
+    del timeline, records
+    os.replace(compact_path, timeline_path)
+    return len(keyframes)
+
+
+class Timeline():
+
+    def __init__(self, timeline_path, mode='r', window=None):
+        # mode 'r+' lets the Observer fill a created timeline in place.
+        # window is the sn_Topology_Window_Thread still generating it, every
+        # read then waits for its timesteps.
+        self.timeline_path = timeline_path
+        self.window = window
+        with open(timeline_path, 'rb') as f:
+            header = f.read(TIMELINE_HEADER_SIZE)
+        (magic, version, self.layout, self.node_num, self.duration,
+         self.resolution) = TIMELINE_HEADER.unpack_from(header)
+        if magic != TIMELINE_MAGIC or version != TIMELINE_VERSION:
+            raise ValueError(timeline_path + " is not a StarryNet timeline.")
+        (self.orbit_number, self.sat_number, self.fac_num, self.antenna_num,
+         isl_period) = TIMELINE_GRID.unpack_from(header, TIMELINE_HEADER.size)
+        self.keyframes = TIMELINE_FRAMES.unpack_from(
+            header, TIMELINE_FRAMES_OFFSET)[0]
+        offset = TIMELINE_HEADER_SIZE
+        if self.layout == LAYOUT_SPARSE:
+            self.sat_num = self.orbit_number * self.sat_number
+        if isl_period:
+            self.isl_period = isl_period
+            self.isl_block = np.memmap(timeline_path,
+                                       dtype=np.float32,
+                                       mode=mode,
+                                       offset=offset,
+                                       shape=(isl_period, self.sat_num, 2))
+            offset += self.isl_block.nbytes
+        # frames[t - 1]: keyframe (timestep) read by timestep t, rows[t - 1]
+        # its record
+        if self.keyframes:
+            self.frames = np.array(
+                np.memmap(timeline_path,
+                          dtype='<i4',
+                          mode='r',
+                          offset=offset,
+                          shape=(self.duration, )))
+            offset += 4 * self.duration
+            self.rows = np.searchsorted(np.unique(self.frames), self.frames)
+        else:
+            self.frames = np.arange(1, self.duration + 1)
+            self.rows = np.arange(self.duration)
+        record_num = self.keyframes if self.keyframes else self.duration
+        if self.layout == LAYOUT_DENSE:
+            self.matrices = np.memmap(timeline_path,
+                                      dtype=np.float32,
+                                      mode=mode,
+                                      offset=offset,
+                                      shape=(record_num, self.node_num,
+                                             self.node_num))
+            return
+        self.records = np.memmap(timeline_path,
+                                 dtype=sn_sparse_dtype(self.sat_num,
+                                                       self.fac_num,
+                                                       self.antenna_num,
+                                                       isl_period == 0),
+                                 mode=mode,
+                                 offset=offset,
+                                 shape=(record_num, ))
+        if isl_period:
+            self.isl_rows = (self.frames - 1) % isl_period
+        else:
+            self.isl_period = record_num
+            self.isl_block = self.records['isl']
+            self.isl_rows = self.rows
+        # Fixed ISL edge index: edge k is isl_src[k] <-> isl_dst[k] and its
+        # delay is isl.reshape(-1)[k].
+        down, right = sn_isl_peers(self.orbit_number, self.sat_number)
+        self.isl_src = np.repeat(np.arange(self.sat_num), 2)
+        self.isl_dst = np.stack((down, right), axis=1).reshape(-1)
+        # With 1 or 2 orbits (or slots per orbit) some edges are self-loops
+        # or repeat a pair, only the first edge of each pair is a link.
+        self.isl_edges = np.zeros(len(self.isl_src), dtype=bool)
+        _, first = np.unique(
+            np.minimum(self.isl_src, self.isl_dst) * self.node_num +
+            np.maximum(self.isl_src, self.isl_dst),
+            return_index=True)
+        self.isl_edges[first] = True
+        self.isl_edges &= self.isl_src != self.isl_dst
+
+    def wait(self, first, last=None):
+        # Blocks until timesteps first ... last of an incremental timeline
+        # are generated, raises ValueError once they are discarded.
+        if self.window is not None:
+            self.window.require(first, first if last is None else last)
+
+    def keyframe(self, time_index):
+        # timestep whose record time_index reads, itself unless adaptive
+        return int(self.frames[time_index - 1])
+
+    def isl(self, time_index):
+        # (sat_num, 2) ISL delays of a sparse timeline
+        self.wait(time_index)
+        return self.isl_block[self.isl_rows[time_index - 1]]
+
+    def links(self, time_index):
+        # Every link of timestep time_index as 0-based (a, b, delay) arrays
+        # with a < b, ordered by (a, b).
+        self.wait(time_index)
+        if self.layout == LAYOUT_DENSE:
+            matrix = self.matrices[self.rows[time_index - 1]]
+            a, b = np.nonzero(np.triu(matrix, 1) > 0)
+            return a, b, matrix[a, b]
+        record = self.records[self.rows[time_index - 1]]
+        fac, slot = np.nonzero(record['gsl_sat'] >= 0)
+        a = np.concatenate((self.isl_src, record['gsl_sat'][fac, slot]))
+        b = np.concatenate((self.isl_dst, self.sat_num + fac))
+        delay = np.concatenate(
+            (self.isl(time_index).reshape(-1), record['gsl_delay'][fac,
+                                                                   slot]))
+        keep = (a != b) & (delay > 0)
+        a, b, delay = a[keep], b[keep], delay[keep]
+        a, b = np.minimum(a, b), np.maximum(a, b)
+        _, first = np.unique(a * self.node_num + b, return_index=True)
+        return a[first], b[first], delay[first]
+
+    def link_mask(self, time_index):
+        # Flat boolean mask over every possible link of the layout (upper
+        # triangle for dense, ISL edge index then GS x satellite slots for
+        # sparse). Its shape never changes, so two timesteps diff with XOR.
+        self.wait(time_index)
+        if self.layout == LAYOUT_DENSE:
+            matrix = self.matrices[self.rows[time_index - 1]]
+            return np.triu(matrix > 0, 1).reshape(-1)
+        record = self.records[self.rows[time_index - 1]]
+        gsl = np.zeros((self.fac_num, self.sat_num), dtype=bool)
+        fac, slot = np.nonzero(record['gsl_sat'] >= 0)
+        gsl[fac, record['gsl_sat'][fac, slot]] = True
+        isl = (self.isl(time_index).reshape(-1) > 0) & self.isl_edges
+        return np.concatenate((isl, gsl.reshape(-1)))
+
+    def link_delays(self, time_index):
+        # Delays (ms) aligned with link_mask(time_index), 0 for no link.
+        self.wait(time_index)
+        if self.layout == LAYOUT_DENSE:
+            matrix = self.matrices[self.rows[time_index - 1]]
+            return np.triu(matrix, 1).reshape(-1)
+        record = self.records[self.rows[time_index - 1]]
+        gsl = np.zeros((self.fac_num, self.sat_num), dtype=np.float32)
+        fac, slot = np.nonzero(record['gsl_sat'] >= 0)
+        gsl[fac, record['gsl_sat'][fac, slot]] = record['gsl_delay'][fac,
+                                                                     slot]
+        isl = np.where(self.isl_edges, self.isl(time_index).reshape(-1), 0)
+        return np.concatenate((isl, gsl.reshape(-1)))
+
+    def mask_links(self, index):
+        # 0-based (a, b) node pairs, a < b, of flat link_mask indexes.
+        if self.layout == LAYOUT_DENSE:
+            return np.divmod(index, self.node_num)
+        isl_num = len(self.isl_src)
+        isl = index < isl_num
+        fac, sat = np.divmod(index - isl_num, self.sat_num)
+        a = np.where(isl, self.isl_src[np.where(isl, index, 0)], sat)
+        b = np.where(isl, self.isl_dst[np.where(isl, index, 0)],
+                     self.sat_num + fac)
+        return np.minimum(a, b), np.maximum(a, b)
+
+    def time_indexes(self, time_indexes=None):
+        # 1-based timesteps as an int array, all of them by default
+        if time_indexes is None:
+            times = np.arange(1, self.duration + 1)
+        else:
+            times = np.atleast_1d(np.asarray(time_indexes, dtype=np.int64))
+        if len(times):
+            self.wait(int(times.min()), int(times.max()))
+        return times
+
+    def pair_index(self, node1_indexes, node2_indexes):
+        # link_mask positions of 1-based node pairs, -1 for impossible links
+        a = np.asarray(node1_indexes, dtype=np.int64) - 1
+        b = np.asarray(node2_indexes, dtype=np.int64) - 1
+        a, b = np.minimum(a, b), np.maximum(a, b)
+        if self.layout == LAYOUT_DENSE:
+            return np.where(a != b, a * self.node_num + b, -1)
+        index = np.full(a.shape, -1, dtype=np.int64)
+        src = np.minimum(self.isl_src, self.isl_dst)
+        dst = np.maximum(self.isl_src, self.isl_dst)
+        edge = src * self.node_num + dst
+        # first edge of each pair, as in links()
+        order = np.argsort(edge, kind='stable')
+        pos = np.searchsorted(edge[order], a * self.node_num + b)
+        pos = np.minimum(pos, len(order) - 1)
+        isl = (b < self.sat_num) & (a != b) & (edge[order][pos]
+                                               == a * self.node_num + b)
+        index[isl] = order[pos[isl]]
+        gsl = (a < self.sat_num) & (b >= self.sat_num) & (b < self.node_num)
+        index[gsl] = len(self.isl_src) + (b[gsl] -
+                                          self.sat_num) * self.sat_num + a[gsl]
+        return index
+
+    def delay_series(self, node1_indexes, node2_indexes, time_indexes=None):
+        # (time, pair) delays (ms) of many 1-based node pairs, 0 for no link.
+        # Each pair maps to its fixed link slot once, then every timestep is
+        # gathered in one pass.
+        times = self.time_indexes(time_indexes)
+        index = np.atleast_1d(self.pair_index(node1_indexes, node2_indexes))
+        series = np.zeros((len(times), len(index)))
+        if self.layout == LAYOUT_DENSE:
+            valid = index >= 0
+            a, b = np.divmod(index[valid], self.node_num)
+            series[:, valid] = self.matrices[self.rows[times - 1][:, None], a,
+                                             b]
+            return np.round(series, 2)
+        isl_num = len(self.isl_src)
+        isl = (index >= 0) & (index < isl_num)
+        sat, side = np.divmod(index[isl], 2)
+        series[:, isl] = self.isl_block[self.isl_rows[times - 1][:, None], sat,
+                                        side]
+        gsl = index >= isl_num
+        if np.any(gsl):
+            fac, sat = np.divmod(index[gsl] - isl_num, self.sat_num)
+            rows = self.rows[times - 1][:, None]
+            # (time, pair, antenna), a satellite holds at most one antenna
+            hit = self.records['gsl_sat'][rows, fac] == sat[:, None]
+            delay = self.records['gsl_delay'][rows, fac]
+            series[:, gsl] = np.where(hit, delay, 0).max(axis=2)
+        return np.round(series, 2)
+
+    def neighbor_series(self, node_index, time_indexes=None, threshold=0.01):
+        # (time, node) boolean matrix, column j is node j + 1
+        nodes = np.arange(1, self.node_num + 1)
+        return self.delay_series(np.full(self.node_num, node_index), nodes,
+                                 time_indexes) > threshold
+
+    def gsl_series(self, sat_num, time_indexes=None):
+        # (time, sat, GS) boolean matrix of the satellite-GS links
+        times = self.time_indexes(time_indexes)
+        if self.layout == LAYOUT_DENSE:
+            rows = self.rows[times - 1][:, None, None]
+            sats = np.arange(sat_num)[:, None]
+            return self.matrices[rows, sats,
+                                 np.arange(sat_num, self.node_num)] > 0
+        series = np.zeros((len(times), self.sat_num, self.fac_num),
+                          dtype=bool)
+        rows = self.rows[times - 1]
+        gsl_sat = self.records['gsl_sat'][rows]
+        gsl_delay = self.records['gsl_delay'][rows]
+        row, fac, slot = np.nonzero((gsl_sat >= 0) & (gsl_delay > 0))
+        series[row, gsl_sat[row, fac, slot], fac] = True
+        return series
+
+    def matrix(self, time_index):
+        # Dense delay matrix (ms) of timestep time_index, starting from 1.
+        self.wait(time_index)
+        if self.layout == LAYOUT_DENSE:
+            return self.matrices[self.rows[time_index - 1]]
+        matrix = np.zeros((self.node_num, self.node_num), dtype=np.float32)
+        a, b, delay = self.links(time_index)
+        matrix[a, b] = delay
+        matrix[b, a] = delay
+        return matrix
+
+    def link_dict(self, time_index):
+        # matrix[i][j] style access (0-based, 0 for no link) to one timestep
+        # without building the dense matrix.
+        matrix = defaultdict(lambda: defaultdict(float))
+        a, b, delay = self.links(time_index)
+        for i, j, d in zip(a.tolist(), b.tolist(), delay.tolist()):
+            matrix[i][j] = matrix[j][i] = round(d, 2)
+        return matrix
+
+    def delay(self, node1_index, node2_index, time_index):
+        self.wait(time_index)
+        if self.layout == LAYOUT_DENSE:
+            d = self.matrices[self.rows[time_index - 1], node1_index - 1,
+                              node2_index - 1]
+        else:
+            a, b = sorted((node1_index - 1, node2_index - 1))
+            record = self.records[self.rows[time_index - 1]]
+            d = 0
+            if b < self.sat_num:
+                hit = np.nonzero(((self.isl_src == a) & (self.isl_dst == b))
+                                 | ((self.isl_src == b) &
+                                    (self.isl_dst == a)))[0]
+                if len(hit):
+                    d = self.isl(time_index).reshape(-1)[hit[0]]
+            elif a < self.sat_num:
+                slot = np.nonzero(record['gsl_sat'][b - self.sat_num] == a)[0]
+                if len(slot):
+                    d = record['gsl_delay'][b - self.sat_num][slot[0]]
+        # Stored with 0.01 ms precision, undo the float32 rounding noise.
+        return round(float(d), 2)
+
+    def neighbors(self, node_index, time_index, threshold=0.01):
+        # 1-based indexes of the nodes linked to node_index, ascending.
+        self.wait(time_index)
+        node = node_index - 1
+        if self.layout == LAYOUT_DENSE:
+            column = self.matrices[self.rows[time_index - 1], :, node]
+            return np.nonzero(column > threshold)[0] + 1
+        a, b, delay = self.links(time_index)
+        keep = ((a == node) | (b == node)) & (delay > threshold)
+        return np.unique(np.where(a[keep] == node, b[keep], a[keep])) + 1
+
+    def discard(self, first, last):
+        # Drops the records of timesteps first + 1 ... last of a timeline
+        # sampled uniformly, they read as no links afterwards.
+        if self.layout == LAYOUT_DENSE:
+            records = self.matrices
+        else:
+            records = self.records
+        stride = records.strides[0]
+        sn_discard(self.timeline_path, records.offset + first * stride,
+                   (last - first) * stride)
+
+    def save_links(self, time_index, npy_path, tracker=None):
+        # Link list of one timestep for the remote orchestrator, only the
+        # links whose delay moved when a LinkDelayTracker is given. Returns
+        # the number of links saved.
+        a, b, delay = self.links(time_index)
+        if tracker is not None:
+            send = tracker.select(a, b, delay)
+            a, b, delay = a[send], b[send], delay[send]
+        links = np.zeros(len(a),
+                         dtype=[('a', '<i4'), ('b', '<i4'), ('delay', '<f4')])
+        links['a'] = a
+        links['b'] = b
+        links['delay'] = delay
+        np.save(npy_path, links)
+        return len(links)
+
+
+class TopologyCache():
+    # Query layer over a Timeline: decoded timesteps are kept as symmetric
+    # CSR adjacency (indptr, 0-based peers, delays ms) in an LRU cache
+    # bounded by memory_budget bytes, so lookups cost O(degree).
+
+    def __init__(self, timeline, memory_budget=64 * 1024 * 1024):
+        self.timeline = timeline
+        self.memory_budget = memory_budget
+        self.snapshots = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def adjacency(self, time_index):
+        # outside the window of an incremental timeline, raises before any
+        # snapshot is cached
+        self.timeline.wait(time_index)
+        snapshot = self.snapshots.get(time_index)
+        if snapshot is not None:
+            self.hits += 1
+            self.snapshots.move_to_end(time_index)
+            return snapshot
+        self.misses += 1
+        a, b, delay = self.timeline.links(time_index)
+        src = np.concatenate((a, b))
+        dst = np.concatenate((b, a))
+        delay = np.round(np.concatenate((delay, delay)).astype(np.float64), 2)
+        order = np.lexsort((dst, src))
+        indptr = np.zeros(self.timeline.node_num + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=self.timeline.node_num),
+                  out=indptr[1:])
+        snapshot = (indptr, dst[order].astype(np.int32), delay[order])
+        self.snapshots[time_index] = snapshot
+        self.nbytes += sum(v.nbytes for v in snapshot)
+        # keep the newest snapshot even if it alone exceeds the budget
+        while self.nbytes > self.memory_budget and len(self.snapshots) > 1:
+            _, old = self.snapshots.popitem(last=False)
+            self.nbytes -= sum(v.nbytes for v in old)
+        return snapshot
+
+    def row(self, node_index, time_index):
+        # 0-based peers and delays of 1-based node_index
+        indptr, peers, delay = self.adjacency(time_index)
+        start, end = indptr[node_index - 1], indptr[node_index]
+        return peers[start:end], delay[start:end]
+
+    def delay(self, node1_index, node2_index, time_index):
+        peers, delay = self.row(node1_index, time_index)
+        hit = np.searchsorted(peers, node2_index - 1)
+        if hit < len(peers) and peers[hit] == node2_index - 1:
+            return float(delay[hit])
+        return 0.0
+
+    def neighbors(self, node_index, time_index, threshold=0.01):
+        # 1-based indexes of the nodes linked to node_index, ascending.
+        peers, delay = self.row(node_index, time_index)
+        return peers[delay > threshold] + 1
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'timesteps': len(self.snapshots),
+            'bytes': self.nbytes,
+            'memory_budget': self.memory_budget
+        }
+
+
+class LinkDelayTracker():
+    # Last delay applied on each link (0-based a < b, as Timeline.links), so
+    # delay updates carry only the links that moved by more than threshold
+    # ms or ratio (fraction) of their applied delay.
+
+    def __init__(self, node_num, threshold=0, ratio=0):
+        self.node_num = node_num
+        self.threshold = threshold
+        self.ratio = ratio
+        self.keys = np.zeros(0, dtype=np.int64)  # sorted a * node_num + b
+        self.delays = np.zeros(0, dtype=np.float32)
+        self.applied = 0
+        self.suppressed = 0
+
+    def lookup(self, keys):
+        # (known mask, applied delay) of each key
+        if len(self.keys) == 0:
+            return np.zeros(len(keys), dtype=bool), np.zeros(len(keys))
+        slot = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return self.keys[slot] == keys, self.delays[slot]
+
+    def select(self, a, b, delay):
+        # Mask of the links to send. The links absent from (a, b) are
+        # forgotten, they are reapplied in full when they come back.
+        keys = a.astype(np.int64) * self.node_num + b
+        order = np.argsort(keys, kind='stable')
+        known, previous = self.lookup(keys)
+        change = np.abs(delay - previous)
+        keep = known & ((change <= self.threshold) |
+                        (change <= self.ratio * previous))
+        self.keys = keys[order]
+        self.delays = np.where(keep, previous, delay)[order].astype(np.float32)
+        self.suppressed += int(np.count_nonzero(keep))
+        self.applied += int(len(keep) - np.count_nonzero(keep))
+        return ~keep
+
+    def seed(self, a, b, delay):
+        # delays applied by other means, e.g. at link initialization
+        keys = a.astype(np.int64) * self.node_num + b
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.delays = np.asarray(delay, dtype=np.float32)[order]
+
+    def forget(self, a, b):
+        # link changed by other means, sent in full next time
+        keep = self.keys != (min(a, b) * self.node_num + max(a, b))
+        self.keys, self.delays = self.keys[keep], self.delays[keep]
+
+    def reset(self):
+        self.keys = self.keys[:0]
+        self.delays = self.delays[:0]
+
+
+def sn_read_events(events_path, offset, count):
+    with open(events_path, "rb") as f:
+        f.seek(offset)
+        return [json.loads(f.readline()) for _ in range(count)]
+
+
+def sn_events_path(path):
+    return path + "/Topo_leo_change.jsonl"
+
+
+def sn_events_index_path(path):
+    return path + "/Topo_leo_change.idx.npy"
+
+
+# Offset index of the event log: one row per change-set, in time order.
+# second is when the emulation applies it, time * resolution unless the
+# Observer placed a handover between two samples.
+EVENTS_INDEX_DTYPE = np.dtype([('time', '<i4'), ('offset', '<i8'),
+                               ('count', '<i4'), ('duration', '<i4'),
+                               ('second', '<i4')])
+
+
+class TopologyEventWriter():
+    # Line-delimited JSON, one link event per line:
+    # {"time", "kind": "add"/"del", "node_a", "node_b" (1-based, a < b),
+    #  "delay" (ms), "bw" (Gbps), "loss" (%)}. The deletions of a change-set
+    # come before its additions.
+
+    def __init__(self, path, resolution=1):
+        self.path = path
+        self.resolution = resolution
+        self.f = open(sn_events_path(path), "wb")
+        self.index = []
+
+    def flush(self):
+        # makes the change-sets written so far readable by sn_read_events
+        self.f.flush()
+
+    def write(self, time_index, dels, adds, second=None):
+        if second is None:
+            second = time_index * self.resolution
+        offset = self.f.tell()
+        count = 0
+        for kind, links in (("del", dels), ("add", adds)):
+            for a, b, delay, bw, loss in links:
+                event = {
+                    "time": int(time_index),
+                    "kind": kind,
+                    "node_a": int(a),
+                    "node_b": int(b),
+                    "delay": round(float(delay), 2),
+                    "bw": bw,
+                    "loss": loss
+                }
+                self.f.write(json.dumps(event).encode() + b"\n")
+                count += 1
+        self.index.append((time_index, offset, count, 0, second))
+
+    def close(self, duration):
+        self.f.close()
+        index = np.array(self.index, dtype=EVENTS_INDEX_DTYPE)
+        # a change-set lasts until the next one or the end of the emulation
+        index['duration'] = np.diff(np.append(index['time'], duration))
+        np.save(sn_events_index_path(self.path), index)
+
+
+class TopologyEvents():
+
+    def __init__(self, path, resolution=1):
+        self.events_path = sn_events_path(path)
+        self.index = np.load(sn_events_index_path(path))
+        self.times = self.index['time']
+        self.durations = self.index['duration']
+        if 'second' in self.index.dtype.names:
+            self.seconds = self.index['second']
+        else:
+            # logs written before handovers were refined
+            self.seconds = self.times * resolution
+
+    def read(self, row):
+        # Events of change-set row, read with one seek.
+        return sn_read_events(self.events_path, int(self.index['offset'][row]),
+                              int(self.index['count'][row]))
+
+    def changes(self, time_index):
+        # Events of the change-sets at time_index, in the order applied.
+        first = np.searchsorted(self.times, time_index)
+        last = np.searchsorted(self.times, time_index, side='right')
+        return [
+            event for row in range(first, last) for event in self.read(row)
+        ]
+
+    def __iter__(self):
+        for time_index in np.unique(self.times).tolist():
+            yield time_index, self.changes(time_index)
+
+    def change_sets(self):
+        # (time, second, events) of every change-set, as the emulation
+        # applies them
+        for row in range(len(self.times)):
+            yield int(self.times[row]), int(self.seconds[row]), self.read(row)
+
+
+def sn_timeline_from_text(delay_dir, timeline_path, resolution):
+    # Converts a legacy run (delay/1.txt ... delay/<duration>.txt).
+    duration = 0
+    while os.path.exists(delay_dir + "/" + str(duration + 1) + ".txt"):
+        duration += 1
+    if duration == 0:
+        raise FileNotFoundError("No delay files in " + delay_dir)
+    first = np.loadtxt(delay_dir + "/1.txt", delimiter=',', ndmin=2)
+    matrices = sn_create_timeline(timeline_path, len(first), duration,
+                                  resolution)
+    matrices[0] = first
+    for time_index in range(2, duration + 1):
+        matrices[time_index - 1] = np.loadtxt(delay_dir + "/" +
+                                              str(time_index) + ".txt",
+                                              delimiter=',',
+                                              ndmin=2)
+    matrices.flush()
+    del matrices
+    return Timeline(timeline_path)
+
+
+def sn_timeline_to_text(timeline_path, delay_dir):
+    # Writes the legacy dense delay/<t>.txt layout.
+    timeline = Timeline(timeline_path)
+    os.makedirs(delay_dir, exist_ok=True)
+    for time_index in range(1, timeline.duration + 1):
+        np.savetxt(delay_dir + "/" + str(time_index) + ".txt",
+                   timeline.matrix(time_index),
+                   fmt='%.2f',
+                   delimiter=',')
+
+
+def sn_open_timeline(path, resolution=1, window=None):
+    # Opens <path>/topology.bin, converting an old delay/*.txt run if needed.
+    timeline_path = sn_timeline_path(path)
+    if os.path.exists(timeline_path):
+        return Timeline(timeline_path, window=window)
+    return sn_timeline_from_text(path + "/delay", timeline_path, resolution)
@@ -6,8 +6,12 @@ import argparse
 import os
 from time import sleep
 import time
+import itertools
 import numpy
 import random
+
+from starrynet.sn_remote import *
+from starrynet.sn_timeline import *
 """
 Starrynet utils that are used in sn_synchronizer
 author: Yangtao Deng (dengyt21@mails.tsinghua.edu.cn) and Zeqi Lai (zeqilai@tsinghua.edu.cn)
@@ -79,6 +83,19 @@ def sn_load_file(path, GS_lat_long):
     data['remote_machine_IP'] = table["remote_machine_IP"]
     data['remote_machine_username'] = table["remote_machine_username"]
     data['remote_machine_password'] = table["remote_machine_password"]
+    data['topology_layout'] = table.get("Topology layout", "sparse")
+    data['query_cache'] = table.get("Query cache (MB)", 64)
+    data['workers'] = table.get("Precompute workers", 0)
+    data['cache_size'] = table.get("Artifact cache (MB)", 1024)
+    data['tle_file'] = table.get("TLE file", "")
+    data['propagator'] = table.get("Propagator", "sgp4")
+    data['epsilon'] = table.get("Delay epsilon (ms)", 0)
+    data['lookahead'] = table.get("Lookahead (s)", 0)
+    data['channels'] = table.get("Remote channels", DEFAULT_CHANNELS)
+    data['delay_threshold'] = table.get("Delay threshold (ms)", 0)
+    data['delay_ratio'] = table.get("Delay threshold (%)", 0)
+    data['link_backend'] = table.get("Link backend", "bridge")
+    data['routing_timeout'] = table.get("Routing timeout (s)", 120)
 
     parser = argparse.ArgumentParser(description='manual to this script')
     parser.add_argument('--cons_name', type=str, default=data['cons_name'])
@@ -136,6 +153,48 @@ def sn_load_file(path, GS_lat_long):
     parser.add_argument('--remote_machine_password',
                         type=str,
                         default=data['remote_machine_password'])
+    parser.add_argument('--topology_layout',
+                        type=str,
+                        choices=['sparse', 'dense'],
+                        default=data['topology_layout'])
+    # memory budget of the decoded timesteps kept for the query API
+    parser.add_argument('--query_cache',
+                        type=int,
+                        default=data['query_cache'])
+    # processes computing the topology timeline, 0 for one per CPU
+    parser.add_argument('--workers', type=int, default=data['workers'])
+    # size cap of the cache of computed timelines, 0 to disable it
+    parser.add_argument('--cache_size',
+                        type=int,
+                        default=data['cache_size'])
+    # e.g. tle/Starlink.tle, empty for an idealized Walker shell
+    parser.add_argument('--tle_file', type=str, default=data['tle_file'])
+    parser.add_argument('--propagator',
+                        type=str,
+                        choices=['sgp4', 'j2'],
+                        default=data['propagator'])
+    # delay change that stores a new timestep, 0 samples every resolution
+    parser.add_argument('--epsilon', type=float, default=data['epsilon'])
+    # topology generated ahead of the emulation, 0 to precompute it all
+    parser.add_argument('--lookahead', type=int, default=data['lookahead'])
+    # concurrent SSH channels of the remote commands
+    parser.add_argument('--channels', type=int, default=data['channels'])
+    # delay moves not sent to the containers: absolute (ms) or relative (%)
+    parser.add_argument('--delay_threshold',
+                        type=float,
+                        default=data['delay_threshold'])
+    parser.add_argument('--delay_ratio',
+                        type=float,
+                        default=data['delay_ratio'])
+    # bridge: a docker network per link, veth: veth pairs between namespaces
+    parser.add_argument('--link_backend',
+                        type=str,
+                        choices=['bridge', 'veth'],
+                        default=data['link_backend'])
+    # longest wait for OSPF to converge after starting bird
+    parser.add_argument('--routing_timeout',
+                        type=float,
+                        default=data['routing_timeout'])
 
     parser.add_argument('--path',
                         '-p',
@@ -163,20 +222,16 @@ def sn_get_param(file_):
 
 
 def sn_init_remote_machine(host, username, password):
-    # transport = paramiko.Transport((host, 22))
-    # transport.connect(username=username, password=password)
     remote_machine_ssh = paramiko.SSHClient()
-    # remote_machine_ssh._transport = transport
     remote_machine_ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
     remote_machine_ssh.connect(hostname=host,
                                port=22,
                                username=username,
                                password=password)
-    transport = paramiko.Transport((host, 22))
-    transport.connect(username=username, password=password)
+    # commands and SFTP share the transport of the SSH client
+    transport = remote_machine_ssh.get_transport()
     return remote_machine_ssh, transport
-    # transport.close()
 
 
 def sn_init_remote_ftp(transport):
@@ -184,10 +239,96 @@ def sn_init_remote_ftp(transport):
     return ftp_client
 
 
+# RemoteExecutor of each SSH client, created on first use
+remote_executors = {}
+remote_executors_lock = threading.Lock()
+
+
+def sn_remote_executor(remote_ssh, channels=DEFAULT_CHANNELS):
+    with remote_executors_lock:
+        executor = remote_executors.get(id(remote_ssh))
+        if executor is None:
+            executor = RemoteExecutor(remote_ssh.get_transport(), channels)
+            remote_executors[id(remote_ssh)] = executor
+        return executor
+
+
+def sn_remote_submit(remote_ssh, cmd):
+    # Future of the RemoteResult (exit code, output, timing) of cmd
+    return sn_remote_executor(remote_ssh).submit(cmd)
+
+
+def sn_remote_cmds(remote_ssh, cmds):
+    # stdout lines of independent commands, run concurrently
+    return [
+        result.stdout
+        for result in sn_remote_executor(remote_ssh).run_all(cmds)
+    ]
+
+
 def sn_remote_cmd(remote_ssh, cmd):
-    stdin, stdout, stderr = remote_ssh.exec_command(cmd, get_pty=True)
-    lines = stdout.readlines()
-    return lines
+    return sn_remote_executor(remote_ssh).run(cmd).stdout
+
+
+# RemoteFiles upload cache of each SFTP client, created on first use
+remote_files = {}
+
+
+def sn_remote_files(remote_ssh, remote_ftp):
+    with remote_executors_lock:
+        files = remote_files.get(id(remote_ftp))
+    if files is None:
+        files = RemoteFiles(remote_ftp, sn_remote_executor(remote_ssh))
+        with remote_executors_lock:
+            files = remote_files.setdefault(id(remote_ftp), files)
+    return files
+
+
+def sn_remote_put(remote_ssh, remote_ftp, local_file, remote_file):
+    # skipped when the remote file already has the same content
+    sn_remote_files(remote_ssh, remote_ftp).put(local_file, remote_file)
+
+
+def sn_remote_put_all(remote_ssh, remote_ftp, uploads):
+    # (local, remote) pairs, the changed ones sent in one archive
+    sn_remote_files(remote_ssh, remote_ftp).put_all(uploads)
+
+
+# RemoteOrchestrator daemon of each SSH client, while the emulation runs
+remote_orchestrators = {}
+
+
+def sn_start_orchestrator(remote_ssh, remote_ftp, file_path,
+                          link_backend="bridge"):
+    with remote_executors_lock:
+        orchestrator = remote_orchestrators.get(id(remote_ssh))
+    if orchestrator is None:
+        orchestrator = RemoteOrchestrator(
+            sn_remote_executor(remote_ssh),
+            sn_remote_files(remote_ssh, remote_ftp),
+            file_path,
+            link_backend=link_backend).start(
+                os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"))
+        with remote_executors_lock:
+            remote_orchestrators[id(remote_ssh)] = orchestrator
+    return orchestrator
+
+
+def sn_orchestrator(remote_ssh):
+    # the running daemon, None before the emulation starts
+    with remote_executors_lock:
+        return remote_orchestrators.get(id(remote_ssh))
+
+
+def sn_stop_orchestrator(remote_ssh):
+    with remote_executors_lock:
+        orchestrator = remote_orchestrators.pop(id(remote_ssh), None)
+    if orchestrator is not None:
+        try:
+            orchestrator.request('stop')
+        finally:
+            orchestrator.close()
+    return orchestrator
 
 
 # A thread designed for initializing working directory.
@@ -251,11 +392,13 @@ def sn_get_container_info(remote_machine_ssh):
 
 def sn_delete_remote_network_bridge(remote_ssh):
     all_br_info = sn_remote_cmd(remote_ssh, "docker network ls")
+    cmds = []
     for line in all_br_info:
         if "La" in line or "Le" in line or "GS" in line:
             network_name = line.split()[1]
             print('docker network rm ' + network_name)
-            sn_remote_cmd(remote_ssh, 'docker network rm ' + network_name)
+            cmds.append('docker network rm ' + network_name)
+    sn_remote_cmds(remote_ssh, cmds)
 
 
 def sn_reset_docker_env(remote_ssh, docker_service_name, node_size):
@@ -276,11 +419,12 @@ def sn_reset_docker_env(remote_ssh, docker_service_name, node_size):
 def sn_rename_all_container(remote_ssh, container_id_list, new_idx):
     print("Rename all containers ...")
     new_idx = 1
+    cmds = []
     for container_id in container_id_list:
-        sn_remote_cmd(
-            remote_ssh, "docker rename " + str(container_id) +
-            " ovs_container_" + str(new_idx))
+        cmds.append("docker rename " + str(container_id) + " ovs_container_" +
+                    str(new_idx))
         new_idx = new_idx + 1
+    sn_remote_cmds(remote_ssh, cmds)
 
 
 # A thread designed for initializing constellation links.
@@ -289,8 +433,9 @@ class sn_Link_Init_Thread(threading.Thread):
     def __init__(self, remote_ssh, remote_ftp, orbit_num, sat_num,
                  constellation_size, fac_num, file_path,
                  configuration_file_path, sat_bandwidth, sat_ground_bandwidth,
-                 sat_loss, sat_ground_loss):
+                 sat_loss, sat_ground_loss, link_backend="bridge"):
         threading.Thread.__init__(self)
+        self.link_backend = link_backend
         self.remote_ssh = remote_ssh
         self.constellation_size = constellation_size
         self.fac_num = fac_num
@@ -306,12 +451,17 @@ class sn_Link_Init_Thread(threading.Thread):
 
     def run(self):
         print('Run in link init thread.')
-        self.remote_ftp.put(
-            os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"),
-            self.file_path + "/sn_orchestrater.py")
-        self.remote_ftp.put(
-            self.configuration_file_path + "/" + self.file_path +
-            '/delay/1.txt', self.file_path + "/1.txt")
+        timeline = sn_open_timeline(self.configuration_file_path + "/" +
+                                    self.file_path)
+        timeline.save_links(
+            1, self.configuration_file_path + "/" + self.file_path +
+            '/mid_files/1.npy')
+        sn_remote_put_all(
+            self.remote_ssh, self.remote_ftp,
+            [(os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"),
+              self.file_path + "/sn_orchestrater.py"),
+             (self.configuration_file_path + "/" + self.file_path +
+              '/mid_files/1.npy', self.file_path + "/1.npy")])
         print('Initializing links ...')
         sn_remote_cmd(
             self.remote_ssh, "python3 " + self.file_path +
@@ -319,7 +469,8 @@ class sn_Link_Init_Thread(threading.Thread):
             str(self.sat_num) + " " + str(self.constellation_size) + " " +
             str(self.fac_num) + " " + str(self.sat_bandwidth) + " " +
             str(self.sat_loss) + " " + str(self.sat_ground_bandwidth) + " " +
-            str(self.sat_ground_loss) + " " + self.file_path + "/1.txt")
+            str(self.sat_ground_loss) + " " + self.file_path + "/1.npy " +
+            self.link_backend)
 
 
 # A thread designed for initializing bird routing.
@@ -327,9 +478,12 @@ class sn_Routing_Init_Thread(threading.Thread):
 
     def __init__(self, remote_ssh, remote_ftp, orbit_num, sat_num,
                  constellation_size, fac_num, file_path, sat_bandwidth,
-                 sat_ground_bandwidth, sat_loss, sat_ground_loss):
+                 sat_ground_bandwidth, sat_loss, sat_ground_loss,
+                 routing_timeout=120):
         threading.Thread.__init__(self)
         self.remote_ssh = remote_ssh
+        self.routing_timeout = routing_timeout
+        self.convergence_time = None  # s, None if it timed out
         self.constellation_size = constellation_size
         self.fac_num = fac_num
         self.orbit_num = orbit_num
@@ -345,15 +499,21 @@ class sn_Routing_Init_Thread(threading.Thread):
         print(
             "Copy bird configuration file to each container and run routing process."
         )
-        self.remote_ftp.put(
+        sn_remote_put(
+            self.remote_ssh, self.remote_ftp,
             os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"),
             self.file_path + "/sn_orchestrater.py")
         print('Initializing routing ...')
-        sn_remote_cmd(
+        output = sn_remote_cmd(
             self.remote_ssh, "python3 " + self.file_path +
             "/sn_orchestrater.py" + " " + str(self.constellation_size) + " " +
-            str(self.fac_num) + " " + self.file_path)
-        print("Routing initialized!")
+            str(self.fac_num) + " " + self.file_path + " " +
+            str(self.routing_timeout))
+        for line in output:
+            if line.startswith("Routing converged in"):
+                self.convergence_time = float(line.split()[3])
+            if line.startswith("Routing"):
+                print(line.strip())
 
 
 # A thread designed for emulation.
@@ -365,10 +525,13 @@ class sn_Emulation_Start_Thread(threading.Thread):
                  ping_src, ping_des, ping_time, sr_src, sr_des, sr_target,
                  sr_time, damage_ratio, damage_time, damage_list,
                  recovery_time, route_src, route_time, duration, resolution,
-                 utility_checking_time, perf_src, perf_des, perf_time, perf_options):
+                 utility_checking_time, perf_src, perf_des, perf_time, perf_options,
+                 window=None, delay_threshold=0, delay_ratio=0,
+                 link_backend="bridge", sat_bw=None):
         threading.Thread.__init__(self)
         self.remote_ssh = remote_ssh
         self.remote_ftp = remote_ftp
+        self.sat_bw = sat_bw
         self.sat_loss = sat_loss
         self.sat_ground_bw = sat_ground_bw
         self.sat_ground_loss = sat_ground_loss
@@ -397,243 +560,166 @@ class sn_Emulation_Start_Thread(threading.Thread):
         self.duration = duration
         self.resolution = resolution
         self.utility_checking_time = utility_checking_time
+        self.updated_keyframe = None
+        # incremental topology generated along the emulation, if any
+        self.window = window
+        self.delay_threshold = delay_threshold
+        self.delay_ratio = delay_ratio  # percent
+        self.delays = None  # LinkDelayTracker of the running emulation
+        self.link_backend = link_backend
         if self.container_id_list == []:
             self.container_id_list = sn_get_container_info(self.remote_ssh)
 
     def run(self):
         ping_threads = []
         perf_threads = []
+        path = self.configuration_file_path + "/" + self.file_path
+        timeline = sn_open_timeline(path, self.resolution, self.window)
+        # the link initialization applied the delays of timestep 1
+        self.delays = LinkDelayTracker(timeline.node_num,
+                                       self.delay_threshold,
+                                       self.delay_ratio / 100)
+        self.delays.seed(*timeline.links(1))
+        if self.window is not None:
+            change_sets = self.window.change_sets()
+        else:
+            change_sets = TopologyEvents(path, self.resolution).change_sets()
+        end_time = self.duration * self.resolution
         timeptr = 2  # current emulating time
-        topo_change_file_path = self.configuration_file_path + "/" + self.file_path + '/Topo_leo_change.txt'
-        fi = open(topo_change_file_path, 'r')
-        line = fi.readline()
-        print(self.perf_time)
-        while line:  # starting reading change information and emulating
-            words = line.split()
-            if words[0] == 'time':
+        # Commands of the emulation go to one long-running orchestrator.
+        sn_start_orchestrator(self.remote_ssh, self.remote_ftp,
+                              self.file_path, self.link_backend)
+        # None stands for the end of the emulation after the last change.
+        for time_index, current_time, changes in itertools.chain(
+                change_sets, [(None, None, None)]):
+            print('Emulation in No.' + str(timeptr) + ' second.')
+            # the time when the new change occurrs
+            change_time = end_time if current_time is None else current_time
+            while change_time > timeptr:
+                start_time = time.time()
+                self.emulate_second(timeptr, timeline, ping_threads,
+                                    perf_threads)
+                timeptr += 1
+                passed_time = (time.time() - start_time) if (
+                    time.time() - start_time) < 1 else 1
+                sleep(1 - passed_time)
+                if timeptr >= end_time:
+                    break
                 print('Emulation in No.' + str(timeptr) + ' second.')
-                # the time when the new change occurrs
-                current_time = str(int(words[1][:-1]))
-                while int(current_time)*self.resolution > timeptr:
-                    start_time = time.time()
-                    if timeptr in self.utility_checking_time:
-                        sn_check_utility(
-                            timeptr, self.remote_ssh,
-                            self.configuration_file_path + "/" +
-                            self.file_path)
-                    if timeptr % self.update_interval == 0:
-                        # updating link delays after link changes
-                        sn_update_delay(self.file_path,
-                                        self.configuration_file_path, int(timeptr/self.resolution)+1,
-                                        self.constellation_size,
-                                        self.remote_ssh, self.remote_ftp)
-                    if timeptr in self.damage_time:
-                        sn_damage(
-                            self.damage_ratio[self.damage_time.index(timeptr)],
-                            self.damage_list, self.constellation_size,
-                            self.remote_ssh, self.remote_ftp, self.file_path,
-                            self.configuration_file_path)
-                    if timeptr in self.recovery_time:
-                        sn_recover(self.damage_list, self.sat_loss,
-                                   self.remote_ssh, self.remote_ftp,
-                                   self.file_path,
-                                   self.configuration_file_path)
-                    if timeptr in self.sr_time:
-                        index = [
-                            i for i, val in enumerate(self.sr_time)
-                            if val == timeptr
-                        ]
-                        for index_num in index:
-                            sn_sr(self.sr_src[index_num],
-                                  self.sr_des[index_num],
-                                  self.sr_target[index_num],
-                                  self.container_id_list, self.remote_ssh)
-                    if timeptr in self.ping_time:
-                        if timeptr in self.ping_time:
-                            index = [
-                                i for i, val in enumerate(self.ping_time)
-                                if val == timeptr
-                            ]
-                            for index_num in index:
-                                ping_thread = threading.Thread(
-                                    target=sn_ping,
-                                    args=(self.ping_src[index_num],
-                                          self.ping_des[index_num],
-                                          self.ping_time[index_num],
-                                          self.constellation_size,
-                                          self.container_id_list,
-                                          self.file_path,
-                                          self.configuration_file_path,
-                                          self.remote_ssh))
-                                ping_thread.start()
-                                ping_threads.append(ping_thread)
-                    if timeptr in self.perf_time:
-                        if timeptr in self.perf_time:
-                            index = [
-                                i for i, val in enumerate(self.perf_time)
-                                if val == timeptr
-                            ]
-                            for index_num in index:
-                                print(f"Preparing iperf at {timeptr} {self.perf_src[index_num]} -> {self.perf_des[index_num]} with {self.perf_options[index_num]}")
-                                perf_thread = threading.Thread(
-                                    target=sn_perf,
-                                    args=(self.perf_src[index_num],
-                                          self.perf_des[index_num],
-                                          self.perf_options[index_num],
-                                          self.perf_time[index_num],
-                                          self.constellation_size,
-                                          self.container_id_list,
-                                          self.file_path,
-                                          self.configuration_file_path,
-                                          self.remote_ssh))
-                                perf_thread.start()
-                                perf_threads.append(perf_thread)
-                    if timeptr in self.route_time:
-                        index = [
-                            i for i, val in enumerate(self.route_time)
-                            if val == timeptr
-                        ]
-                        for index_num in index:
-                            sn_route(self.route_src[index_num],
-                                     self.route_time[index_num],
-                                     self.file_path,
-                                     self.configuration_file_path,
-                                     self.container_id_list, self.remote_ssh)
-                    timeptr += 1
-                    end_time = time.time()
-                    passed_time = (
-                        end_time -
-                        start_time) if (end_time - start_time) < 1 else 1
-                    sleep(1 - passed_time)
-                    if timeptr >= self.duration*self.resolution:
-                        return
-                    print('Emulation in No.' + str(timeptr) + ' second.')
-                print("A change in time " + current_time + ':')
-                line = fi.readline()
-                words = line.split()
-                line = fi.readline()
-                line = fi.readline()
-                words = line.split()
-                while words[0] != 'add:':  # dellink
-                    word = words[0].split('-')
-                    s = int(word[0])
-                    f = int(word[1])
-                    if s > f:
-                        tmp = s
-                        s = f
-                        f = tmp
+            if current_time is None or timeptr >= end_time:
+                break
+            if changes is None:
+                continue  # nothing generated before change_time yet
+            print("A change in time " + str(current_time) + ':')
+            # Each change-set lists its deleted links before the added ones.
+            for change in changes:
+                s, f = sorted((change['node_a'], change['node_b']))
+                self.delays.forget(s - 1, f - 1)
+                if f <= self.constellation_size:
+                    # ISL interfaces stay in place, only their state changes
+                    print(change['kind'] + " ISL " + str(s) + "-" + str(f))
+                    sn_set_ISL_state(s, f, change['kind'] == 'add',
+                                     change['delay'], change['bw'],
+                                     change['loss'], self.container_id_list,
+                                     self.remote_ssh)
+                elif change['kind'] == 'del':
                     print("del link " + str(s) + "-" + str(f) + "\n")
-                    sn_del_link(s, f, self.container_id_list, self.remote_ssh)
-                    line = fi.readline()
-                    words = line.split()
-                line = fi.readline()
-                words = line.split()
-                if len(words) == 0:
-                    return
-                while words[0] != 'time':  # add link
-                    word = words[0].split('-')
-                    s = int(word[0])
-                    f = int(word[1])
-                    if s > f:
-                        tmp = s
-                        s = f
-                        f = tmp
+                    sn_del_link(s, f, self.container_id_list,
+                                self.remote_ssh)
+                else:
                     print("add link", s, f)
-                    current_topo_path = self.configuration_file_path + "/" + self.file_path + '/delay/' + str(
-                        current_time) + '.txt'
-                    matrix = sn_get_param(current_topo_path)
-                    sn_establish_new_GSL(self.container_id_list, matrix,
+                    sn_establish_new_GSL(self.container_id_list,
+                                         change['delay'],
                                          self.constellation_size,
-                                         self.sat_ground_bw,
-                                         self.sat_ground_loss, s, f,
+                                         change['bw'], change['loss'], s, f,
                                          self.remote_ssh)
-                    line = fi.readline()
-                    words = line.split()
-                    if len(words) == 0:
-                        return
-                if timeptr in self.utility_checking_time:
-                    sn_check_utility(
-                        timeptr, self.remote_ssh,
-                        self.configuration_file_path + "/" + self.file_path)
-                if timeptr % self.update_interval == 0:
-                    # updating link delays after link changes
-                    sn_update_delay(self.file_path,
-                                    self.configuration_file_path, int(timeptr/self.resolution)+1,
-                                    self.constellation_size, self.remote_ssh,
-                                    self.remote_ftp)
-                if timeptr in self.damage_time:
-                    sn_damage(
-                        self.damage_ratio[self.damage_time.index(timeptr)],
-                        self.damage_list, self.constellation_size,
-                        self.remote_ssh, self.remote_ftp, self.file_path,
-                        self.configuration_file_path)
-                if timeptr in self.recovery_time:
-                    sn_recover(self.damage_list, self.sat_loss,
-                               self.remote_ssh, self.remote_ftp,
-                               self.file_path, self.configuration_file_path)
-                if timeptr in self.sr_time:
-                    index = [
-                        i for i, val in enumerate(self.sr_time)
-                        if val == timeptr
-                    ]
-                    for index_num in index:
-                        sn_sr(self.sr_src[index_num], self.sr_des[index_num],
-                              self.sr_target[index_num],
-                              self.container_id_list, self.remote_ssh)
-                if timeptr in self.ping_time:
-                    if timeptr in self.ping_time:
-                        index = [
-                            i for i, val in enumerate(self.ping_time)
-                            if val == timeptr
-                        ]
-                        for index_num in index:
-                            ping_thread = threading.Thread(
-                                target=sn_ping,
-                                args=(self.ping_src[index_num],
-                                      self.ping_des[index_num],
-                                      self.ping_time[index_num],
-                                      self.constellation_size,
-                                      self.container_id_list, self.file_path,
-                                      self.configuration_file_path,
-                                      self.remote_ssh))
-                            ping_thread.start()
-                            ping_threads.append(ping_thread)
-                if timeptr in self.perf_time:
-                    if timeptr in self.perf_time:
-                        index = [
-                            i for i, val in enumerate(self.perf_time)
-                            if val == timeptr
-                        ]
-                        for index_num in index:
-                            perf_thread = threading.Thread(
-                                target=sn_perf,
-                                args=(self.perf_src[index_num],
-                                      self.perf_des[index_num],
-                                      self.perf_time[index_num],
-                                      self.constellation_size,
-                                      self.container_id_list, self.file_path,
-                                      self.configuration_file_path,
-                                      self.remote_ssh))
-                            perf_thread.start()
-                            perf_threads.append(perf_thread)
-                if timeptr in self.route_time:
-                    index = [
-                        i for i, val in enumerate(self.route_time)
-                        if val == timeptr
-                    ]
-                    for index_num in index:
-                        sn_route(self.route_src[index_num],
-                                 self.route_time[index_num], self.file_path,
-                                 self.configuration_file_path,
-                                 self.container_id_list, self.remote_ssh)
-                timeptr += 1  # current emulating time
-                if timeptr >= self.duration*self.resolution:
-                    return
-        fi.close()
+            self.emulate_second(timeptr, timeline, ping_threads, perf_threads)
+            timeptr += 1  # current emulating time
+            if timeptr >= end_time:
+                break
         for ping_thread in ping_threads:
             ping_thread.join()
         for perf_thread in perf_threads:
             perf_thread.join()
+        print("Delay updates: " + str(self.delays.applied) + " applied, " +
+              str(self.delays.suppressed) + " suppressed.")
+
+    def emulate_second(self, timeptr, timeline, ping_threads, perf_threads):
+        if self.window is not None:
+            self.window.advance(int(timeptr / self.resolution) + 1)
+        if timeptr in self.utility_checking_time:
+            sn_check_utility(timeptr, self.remote_ssh,
+                             self.configuration_file_path + "/" +
+                             self.file_path)
+        if timeptr % self.update_interval == 0:
+            # updating link delays after link changes, unless the timestep
+            # repeats the keyframe already applied (adaptive timelines)
+            time_index = int(timeptr / self.resolution) + 1
+            if timeline.keyframe(time_index) != self.updated_keyframe:
+                sn_update_delay(self.file_path, self.configuration_file_path,
+                                timeline, time_index, self.constellation_size,
+                                self.remote_ssh, self.remote_ftp, self.delays,
+                                (self.sat_bw, self.sat_loss,
+                                 self.sat_ground_bw, self.sat_ground_loss))
+                self.updated_keyframe = timeline.keyframe(time_index)
+        if timeptr in self.damage_time:
+            # netem loss changes reset the delays of the damaged satellites,
+            # the next update sends every link again
+            self.delays.reset()
+            self.updated_keyframe = None
+            sn_damage(self.damage_ratio[self.damage_time.index(timeptr)],
+                      self.damage_list, self.constellation_size,
+                      self.remote_ssh, self.remote_ftp, self.file_path,
+                      self.configuration_file_path)
+        if timeptr in self.recovery_time:
+            self.delays.reset()
+            self.updated_keyframe = None
+            sn_recover(self.damage_list, self.sat_loss, self.remote_ssh,
+                       self.remote_ftp, self.file_path,
+                       self.configuration_file_path)
+        if timeptr in self.sr_time:
+            index = [i for i, val in enumerate(self.sr_time) if val == timeptr]
+            for index_num in index:
+                sn_sr(self.sr_src[index_num], self.sr_des[index_num],
+                      self.sr_target[index_num], self.container_id_list,
+                      self.remote_ssh)
+        if timeptr in self.ping_time:
+            index = [
+                i for i, val in enumerate(self.ping_time) if val == timeptr
+            ]
+            for index_num in index:
+                ping_thread = threading.Thread(
+                    target=sn_ping,
+                    args=(self.ping_src[index_num], self.ping_des[index_num],
+                          self.ping_time[index_num], self.constellation_size,
+                          self.container_id_list, self.file_path,
+                          self.configuration_file_path, self.remote_ssh))
+                ping_thread.start()
+                ping_threads.append(ping_thread)
+        if timeptr in self.perf_time:
+            index = [
+                i for i, val in enumerate(self.perf_time) if val == timeptr
+            ]
+            for index_num in index:
+                print(f"Preparing iperf at {timeptr} {self.perf_src[index_num]} -> {self.perf_des[index_num]} with {self.perf_options[index_num]}")
+                perf_thread = threading.Thread(
+                    target=sn_perf,
+                    args=(self.perf_src[index_num], self.perf_des[index_num],
+                          self.perf_options[index_num],
+                          self.perf_time[index_num], self.constellation_size,
+                          self.container_id_list, self.file_path,
+                          self.configuration_file_path, self.remote_ssh))
+                perf_thread.start()
+                perf_threads.append(perf_thread)
+        if timeptr in self.route_time:
+            index = [
+                i for i, val in enumerate(self.route_time) if val == timeptr
+            ]
+            for index_num in index:
+                sn_route(self.route_src[index_num],
+                         self.route_time[index_num], self.file_path,
+                         self.configuration_file_path,
+                         self.container_id_list, self.remote_ssh)
 
 
 def sn_check_utility(time_index, remote_ssh, file_path):
@@ -643,18 +729,44 @@ def sn_check_utility(time_index, remote_ssh, file_path):
     f.close()
 
 
-def sn_update_delay(file_path, configuration_file_path, timeptr,
-                    constellation_size, remote_ssh,
-                    remote_ftp):  # updating delays
-    remote_ftp.put(os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"),
-                   file_path + "/sn_orchestrater.py")
-    remote_ftp.put(
-        configuration_file_path + "/" + file_path + '/delay/' + str(timeptr) +
-        '.txt', file_path + '/' + str(timeptr) + '.txt')
-    sn_remote_cmd(
-        remote_ssh,
-        "python3 " + file_path + "/sn_orchestrater.py " + file_path + '/' +
-        str(timeptr) + '.txt ' + str(constellation_size) + " update")
+def sn_update_delay(file_path, configuration_file_path, timeline, timeptr,
+                    constellation_size, remote_ssh, remote_ftp,
+                    delays=None, links=None):  # updating delays
+    # delays: LinkDelayTracker, only the links that moved are sent.
+    # links: (ISL bw, ISL loss, GSL bw, GSL loss), re-applied along with the
+    # delays as tc qdisc change resets the netem parameters not given.
+    count = timeline.save_links(
+        timeptr, configuration_file_path + "/" + file_path + '/mid_files/' +
+        str(timeptr) + '.npy', delays)
+    if delays is not None:
+        print(str(count) + " delay updates, " + str(delays.suppressed) +
+              " suppressed so far.")
+    if count == 0:
+        return
+    uploads = [(configuration_file_path + "/" + file_path + '/mid_files/' +
+                str(timeptr) + '.npy', file_path + '/' + str(timeptr) + '.npy')]
+    orchestrator = sn_orchestrator(remote_ssh)
+    if orchestrator is not None:
+        sn_remote_put_all(remote_ssh, remote_ftp, uploads)
+        request = {}
+        if links is not None:
+            request = dict(zip(('sat_bw', 'sat_loss', 'sat_ground_bw',
+                                'sat_ground_loss'), links))
+        orchestrator.request('update_delays',
+                             path=file_path + '/' + str(timeptr) + '.npy',
+                             constellation_size=constellation_size,
+                             **request)
+    else:
+        sn_remote_put_all(
+            remote_ssh, remote_ftp,
+            uploads + [(os.path.join(os.getcwd(),
+                                     "starrynet/sn_orchestrater.py"),
+                        file_path + "/sn_orchestrater.py")])
+        sn_remote_cmd(
+            remote_ssh, "python3 " + file_path + "/sn_orchestrater.py " +
+            file_path + '/' + str(timeptr) + '.npy ' +
+            str(constellation_size) + " update" +
+            ("" if links is None else " " + " ".join(map(str, links))))
     print("Delay updating done.\n")
 
 
@@ -670,13 +782,19 @@ def sn_damage(ratio, damage_list, constellation_size, remote_ssh, remote_ftp,
     numpy.savetxt(
         configuration_file_path + "/" + file_path +
         '/mid_files/damage_list.txt', random_list)
-    remote_ftp.put(os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"),
-                   file_path + "/sn_orchestrater.py")
-    remote_ftp.put(
-        configuration_file_path + "/" + file_path +
-        '/mid_files/damage_list.txt', file_path + "/damage_list.txt")
-    sn_remote_cmd(remote_ssh,
-                  "python3 " + file_path + "/sn_orchestrater.py " + file_path)
+    orchestrator = sn_orchestrator(remote_ssh)
+    if orchestrator is not None:
+        orchestrator.request('damage', satellites=random_list)
+    else:
+        sn_remote_put_all(
+            remote_ssh, remote_ftp,
+            [(os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"),
+              file_path + "/sn_orchestrater.py"),
+             (configuration_file_path + "/" + file_path +
+              '/mid_files/damage_list.txt', file_path + "/damage_list.txt")])
+        sn_remote_cmd(
+            remote_ssh,
+            "python3 " + file_path + "/sn_orchestrater.py " + file_path)
     print("Damage done.\n")
 
 
@@ -687,30 +805,38 @@ def sn_recover(damage_list, sat_loss, remote_ssh, remote_ftp, file_path,
     numpy.savetxt(
         configuration_file_path + "/" + file_path +
         '/mid_files/damage_list.txt', cumulated_damage_list)
-    remote_ftp.put(os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"),
-                   file_path + "/sn_orchestrater.py")
-    remote_ftp.put(
-        configuration_file_path + "/" + file_path +
-        '/mid_files/damage_list.txt', file_path + "/damage_list.txt")
-    sn_remote_cmd(
-        remote_ssh, "python3 " + file_path + "/sn_orchestrater.py " +
-        file_path + " " + str(sat_loss))
+    orchestrator = sn_orchestrator(remote_ssh)
+    if orchestrator is not None:
+        orchestrator.request('recover',
+                             satellites=[int(s) for s in cumulated_damage_list],
+                             sat_loss=sat_loss)
+    else:
+        sn_remote_put_all(
+            remote_ssh, remote_ftp,
+            [(os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"),
+              file_path + "/sn_orchestrater.py"),
+             (configuration_file_path + "/" + file_path +
+              '/mid_files/damage_list.txt', file_path + "/damage_list.txt")])
+        sn_remote_cmd(
+            remote_ssh, "python3 " + file_path + "/sn_orchestrater.py " +
+            file_path + " " + str(sat_loss))
     cumulated_damage_list.clear()
     print("Link recover done.\n")
 
 
 def sn_sr(src, des, target, container_id_list, remote_ssh):
+    target_IP = sn_remote_submit(
+        remote_ssh, "docker exec -i " + str(container_id_list[target - 1]) +
+        " ifconfig B" + str(target) + "-eth" + str(src) +
+        "|awk -F '[ :]+' 'NR==2{print $4}'")
     ifconfig_output = sn_remote_cmd(
-        remote_ssh, "docker exec -it " + str(container_id_list[des - 1]) +
+        remote_ssh, "docker exec -i " + str(container_id_list[des - 1]) +
         " ifconfig | sed 's/[ \t].*//;/^\(eth0\|\)\(lo\|\)$/d'")
     des_IP = sn_remote_cmd(
         remote_ssh,
-        "docker exec -it " + str(container_id_list[des - 1]) + " ifconfig " +
+        "docker exec -i " + str(container_id_list[des - 1]) + " ifconfig " +
         ifconfig_output[0][:-1] + "|awk -F '[ :]+' 'NR==2{print $4}'")
-    target_IP = sn_remote_cmd(
-        remote_ssh, "docker exec -it " + str(container_id_list[target - 1]) +
-        " ifconfig B" + str(target) + "-eth" + str(src) +
-        "|awk -F '[ :]+' 'NR==2{print $4}'")
+    target_IP = target_IP.result().stdout
     sn_remote_cmd(
         remote_ssh, "docker exec -d " + str(container_id_list[src - 1]) +
         " ip route del " + str(des_IP[0][:-3]) + "0/24")
@@ -727,15 +853,15 @@ def sn_ping(src, des, time_index, constellation_size, container_id_list,
             file_path, configuration_file_path, remote_ssh):
     if des <= constellation_size:
         ifconfig_output = sn_remote_cmd(
-            remote_ssh, "docker exec -it " + str(container_id_list[des - 1]) +
+            remote_ssh, "docker exec -i " + str(container_id_list[des - 1]) +
             " ifconfig | sed 's/[ \t].*//;/^\(eth0\|\)\(lo\|\)$/d'")
         des_IP = sn_remote_cmd(
-            remote_ssh, "docker exec -it " + str(container_id_list[des - 1]) +
+            remote_ssh, "docker exec -i " + str(container_id_list[des - 1]) +
             " ifconfig " + ifconfig_output[0][:-1] +
             "|awk -F '[ :]+' 'NR==2{print $4}'")
     else:
         des_IP = sn_remote_cmd(
-            remote_ssh, "docker exec -it " + str(container_id_list[des - 1]) +
+            remote_ssh, "docker exec -i " + str(container_id_list[des - 1]) +
             " ifconfig B" + str(des) +
             "-default |awk -F '[ :]+' 'NR==2{print $4}'")
     ping_result = sn_remote_cmd(
@@ -754,15 +880,15 @@ def sn_perf(src, des,
             file_path, configuration_file_path, remote_ssh):
     if des <= constellation_size:
         ifconfig_output = sn_remote_cmd(
-            remote_ssh, "docker exec -it " + str(container_id_list[des - 1]) +
+            remote_ssh, "docker exec -i " + str(container_id_list[des - 1]) +
             " ifconfig | sed 's/[ \t].*//;/^\(eth0\|\)\(lo\|\)$/d'")
         des_IP = sn_remote_cmd(
-            remote_ssh, "docker exec -it " + str(container_id_list[des - 1]) +
+            remote_ssh, "docker exec -i " + str(container_id_list[des - 1]) +
             " ifconfig " + ifconfig_output[0][:-1] +
             "|awk -F '[ :]+' 'NR==2{print $4}'")
     else:
         des_IP = sn_remote_cmd(
-            remote_ssh, "docker exec -it " + str(container_id_list[des - 1]) +
+            remote_ssh, "docker exec -i " + str(container_id_list[des - 1]) +
             " ifconfig B" + str(des) +
             "-default |awk -F '[ :]+' 'NR==2{print $4}'")
 
@@ -791,7 +917,7 @@ def sn_route(src, time_index, file_path, configuration_file_path,
              container_id_list, remote_ssh):
     route_result = sn_remote_cmd(
         remote_ssh,
-        "docker exec -it " + str(container_id_list[src - 1]) + " route ")
+        "docker exec -i " + str(container_id_list[src - 1]) + " route ")
     f = open(
         configuration_file_path + "/" + file_path + "/route-" + str(src) +
         "_" + str(time_index) + ".txt", "w")
@@ -799,12 +925,22 @@ def sn_route(src, time_index, file_path, configuration_file_path,
     f.close()
 
 
-def sn_establish_new_GSL(container_id_list, matrix, constellation_size, bw,
+def sn_establish_new_GSL(container_id_list, delay, constellation_size, bw,
                          loss, sat_index, GS_index, remote_ssh):
     i = sat_index
     j = GS_index
+    orchestrator = sn_orchestrator(remote_ssh)
+    if orchestrator is not None:
+        orchestrator.request('add_gsl',
+                             sat=i,
+                             gs=j,
+                             delay=float(delay),
+                             bw=bw,
+                             loss=loss,
+                             constellation_size=constellation_size)
+        return
     # IP address  (there is a link between i and j)
-    delay = str(matrix[i - 1][j - 1])
+    delay = str(delay)
     address_16_23 = (j - constellation_size) & 0xff
     address_8_15 = i & 0xff
     GSL_name = "GSL_" + str(i) + "-" + str(j)
@@ -815,97 +951,102 @@ def sn_establish_new_GSL(container_id_list, matrix, constellation_size, bw,
     print('[Create GSL:]' + 'docker network create ' + GSL_name +
           " --subnet 9." + str(address_16_23) + "." + str(address_8_15) +
           ".0/24")
-    sn_remote_cmd(
-        remote_ssh, 'docker network connect ' + GSL_name + " " +
-        str(container_id_list[i - 1]) + " --ip 9." + str(address_16_23) + "." +
-        str(address_8_15) + ".50")
-    ifconfig_output = sn_remote_cmd(
-        remote_ssh, "docker exec -it " + str(container_id_list[i - 1]) +
+    # Both ends are set up side by side, each one in order.
+    ends = ((i, j, ".50"), (j, i, ".60"))
+    sn_remote_cmds(remote_ssh, [
+        'docker network connect ' + GSL_name + " " +
+        str(container_id_list[node - 1]) + " --ip 9." + str(address_16_23) +
+        "." + str(address_8_15) + host for node, peer, host in ends
+    ])
+    ifconfig_outputs = sn_remote_cmds(remote_ssh, [
+        "docker exec -i " + str(container_id_list[node - 1]) +
         " ip addr | grep -B 2 9." + str(address_16_23) + "." +
-        str(address_8_15) +
-        ".50 | head -n 1 | awk -F: '{ print $2 }' | tr -d [:blank:]")
-    target_interface = str(ifconfig_output[0]).split("@")[0]
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[i - 1]) +
-        " ip link set dev " + target_interface + " down")
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[i - 1]) +
-        " ip link set dev " + target_interface + " name " + "B" +
-        str(i - 1 + 1) + "-eth" + str(j))
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[i - 1]) +
-        " ip link set dev B" + str(i - 1 + 1) + "-eth" + str(j) + " up")
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[i - 1]) +
-        " tc qdisc add dev B" + str(i - 1 + 1) + "-eth" + str(j) +
-        " root netem delay " + str(delay) + "ms")
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[i - 1]) +
-        " tc qdisc add dev B" + str(i - 1 + 1) + "-eth" + str(j) +
-        " root netem loss " + str(loss) + "%")
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[i - 1]) +
-        " tc qdisc add dev B" + str(i - 1 + 1) + "-eth" + str(j) +
-        " root netem rate " + str(bw) + "Gbps")
+        str(address_8_15) + host +
+        " | head -n 1 | awk -F: '{ print $2 }' | tr -d [:blank:]"
+        for node, peer, host in ends
+    ])
+    steps = []
+    for (node, peer, host), ifconfig_output in zip(ends, ifconfig_outputs):
+        target_interface = str(ifconfig_output[0]).split("@")[0]
+        exec_cmd = "docker exec -d " + str(container_id_list[node - 1])
+        interface = "B" + str(node) + "-eth" + str(peer)
+        steps.append([
+            exec_cmd + " ip link set dev " + target_interface + " down",
+            exec_cmd + " ip link set dev " + target_interface + " name " +
+            interface, exec_cmd + " ip link set dev " + interface + " up",
+            exec_cmd + " tc qdisc add dev " + interface +
+            " root netem delay " + str(delay) + "ms",
+            exec_cmd + " tc qdisc add dev " + interface +
+            " root netem loss " + str(loss) + "%",
+            exec_cmd + " tc qdisc add dev " + interface + " root netem rate " +
+            str(bw) + "Gbps"
+        ])
+    for cmds in zip(*steps):
+        sn_remote_cmds(remote_ssh, list(cmds))
     print('[Add current node:]' + 'docker network connect ' + GSL_name + " " +
           str(container_id_list[i - 1]) + " --ip 10." + str(address_16_23) +
           "." + str(address_8_15) + ".50")
-    sn_remote_cmd(
-        remote_ssh, 'docker network connect ' + GSL_name + " " +
-        str(container_id_list[j - 1]) + " --ip 9." + str(address_16_23) + "." +
-        str(address_8_15) + ".60")
-    ifconfig_output = sn_remote_cmd(
-        remote_ssh, "docker exec -it " + str(container_id_list[j - 1]) +
-        " ip addr | grep -B 2 9." + str(address_16_23) + "." +
-        str(address_8_15) +
-        ".60 | head -n 1 | awk -F: '{ print $2 }' | tr -d [:blank:]")
-    target_interface = str(ifconfig_output[0]).split("@")[0]
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[j - 1]) +
-        " ip link set dev " + target_interface + " down")
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[j - 1]) +
-        " ip link set dev " + target_interface + " name " + "B" + str(j) +
-        "-eth" + str(i - 1 + 1))
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[j - 1]) +
-        " ip link set dev B" + str(j) + "-eth" + str(i - 1 + 1) + " up")
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[j - 1]) +
-        " tc qdisc add dev B" + str(j) + "-eth" + str(i - 1 + 1) +
-        " root netem delay " + str(delay) + "ms")
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[j - 1]) +
-        " tc qdisc add dev B" + str(j) + "-eth" + str(i - 1 + 1) +
-        " root netem loss " + str(loss) + "%")
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " + str(container_id_list[j - 1]) +
-        " tc qdisc add dev B" + str(j) + "-eth" + str(i - 1 + 1) +
-        " root netem rate " + str(bw) + "Gbps")
     print('[Add right node:]' + 'docker network connect ' + GSL_name + " " +
           str(container_id_list[j - 1]) + " --ip 10." + str(address_16_23) +
           "." + str(address_8_15) + ".60")
 
 
 def sn_del_link(first_index, second_index, container_id_list, remote_ssh):
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " +
-        str(container_id_list[second_index - 1]) + " ip link set dev B" +
-        str(second_index) + "-eth" + str(first_index) + " down")
-    sn_remote_cmd(
-        remote_ssh, "docker exec -d " +
-        str(container_id_list[first_index - 1]) + " ip link set dev B" +
-        str(first_index) + "-eth" + str(second_index) + " down")
+    orchestrator = sn_orchestrator(remote_ssh)
+    if orchestrator is not None:
+        orchestrator.request('del_link', a=first_index, b=second_index)
+        return
+    sn_remote_cmds(remote_ssh, [
+        "docker exec -d " + str(container_id_list[second_index - 1]) +
+        " ip link set dev B" + str(second_index) + "-eth" +
+        str(first_index) + " down",
+        "docker exec -d " + str(container_id_list[first_index - 1]) +
+        " ip link set dev B" + str(first_index) + "-eth" +
+        str(second_index) + " down"
+    ])
     GSL_name = "GSL_" + str(first_index) + "-" + str(second_index)
-    sn_remote_cmd(
-        remote_ssh, 'docker network disconnect ' + GSL_name + " " +
-        str(container_id_list[first_index - 1]))
-    sn_remote_cmd(
-        remote_ssh, 'docker network disconnect ' + GSL_name + " " +
-        str(container_id_list[second_index - 1]))
+    sn_remote_cmds(remote_ssh, [
+        'docker network disconnect ' + GSL_name + " " +
+        str(container_id_list[first_index - 1]),
+        'docker network disconnect ' + GSL_name + " " +
+        str(container_id_list[second_index - 1])
+    ])
     sn_remote_cmd(remote_ssh, 'docker network rm ' + GSL_name)
 
 
+def sn_set_ISL_state(first_index, second_index, up, delay, bw, loss,
+                     container_id_list, remote_ssh):
+    orchestrator = sn_orchestrator(remote_ssh)
+    if orchestrator is not None:
+        orchestrator.request('set_isl',
+                             a=first_index,
+                             b=second_index,
+                             up=bool(up),
+                             delay=float(delay),
+                             bw=bw,
+                             loss=loss)
+        return
+    # both directions side by side
+    steps = []
+    for i, j in ((first_index, second_index), (second_index, first_index)):
+        if up:
+            steps.append([
+                "docker exec -d " + str(container_id_list[i - 1]) +
+                " ip link set dev B" + str(i) + "-eth" + str(j) + " up",
+                "docker exec -d " + str(container_id_list[i - 1]) +
+                " tc qdisc change dev B" + str(i) + "-eth" + str(j) +
+                " root netem delay " + str(delay) + "ms loss " + str(loss) +
+                "% rate " + str(bw) + "Gbit"
+            ])
+        else:
+            steps.append([
+                "docker exec -d " + str(container_id_list[i - 1]) +
+                " ip link set dev B" + str(i) + "-eth" + str(j) + " down"
+            ])
+    for cmds in zip(*steps):
+        sn_remote_cmds(remote_ssh, list(cmds))
+
+
 # A thread designed for stopping the emulation.
 class sn_Emulation_Stop_Thread(threading.Thread):
 
@@ -917,8 +1058,11 @@ class sn_Emulation_Stop_Thread(threading.Thread):
 
     def run(self):
         print("Deleting all native bridges and containers...")
-        self.remote_ftp.put(
-            os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"),
-            self.file_path + "/sn_orchestrater.py")
-        sn_remote_cmd(self.remote_ssh,
-                      "python3 " + self.file_path + "/sn_orchestrater.py")
+        if sn_stop_orchestrator(self.remote_ssh) is None:
+            sn_remote_put(
+                self.remote_ssh, self.remote_ftp,
+                os.path.join(os.getcwd(), "starrynet/sn_orchestrater.py"),
+                self.file_path + "/sn_orchestrater.py")
+            sn_remote_cmd(self.remote_ssh,
+                          "python3 " + self.file_path + "/sn_orchestrater.py")
+        print(sn_remote_files(self.remote_ssh, self.remote_ftp).report())
@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starrynet.sn_observer import Observer
+from starrynet.sn_timeline import sn_timeline_path
+
+GS_LAT_LONG = [[50.110924, 8.682127], [46.635700, 14.311817]]
+
+
+def sn_test_observer(path, **kwargs):
+    # A small Walker shell (6 x 8) over two European GSs, precomputed into
+    # path/run. Its GSLs hand over a few times in the 30 timesteps.
+    params = dict(inclination=53,
+                  satellite_altitude=550,
+                  orbit_number=6,
+                  sat_number=8,
+                  orbit_start_long=0,
+                  orbit_spacing=60,
+                  duration=30,
+                  resolution=60,
+                  antenna_number=1,
+                  GS_lat_long=GS_LAT_LONG,
+                  antenna_inclination=25,
+                  intra_routing="OSPF",
+                  hello_interval=1)
+    params.update(kwargs)
+    node_num = params['orbit_number'] * params['sat_number'] + len(
+        params['GS_lat_long'])
+    params['AS'] = [[1, node_num]]
+    os.makedirs(str(path), exist_ok=True)
+    observer = Observer("run", str(path), **params)
+    observer.calculate_delay()
+    return sn_timeline_path(str(path) + "/run")
+
+
+@pytest.fixture(scope="session")
+def dense_timeline(tmp_path_factory):
+    return sn_test_observer(tmp_path_factory.mktemp("dense"),
+                            topology_layout="dense")
+
+
+@pytest.fixture(scope="session")
+def sparse_timeline(tmp_path_factory):
+    return sn_test_observer(tmp_path_factory.mktemp("sparse"),
+                            topology_layout="sparse")
@@ -0,0 +1,69 @@
+import os
+import time
+
+from starrynet.sn_cache import *
+
+
+def make_run(path, size):
+    # artifact files of a run, size bytes in total
+    os.makedirs(path, exist_ok=True)
+    files = sn_artifact_files(path)
+    for num, file in enumerate(files):
+        with open(file, 'wb') as f:
+            f.write(b'x' * (size // len(files) + (num == 0) *
+                            (size % len(files))))
+    return path
+
+
+def entries(cache_dir):
+    return sorted(os.listdir(cache_dir))
+
+
+def test_store_and_fetch(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+    run = make_run(str(tmp_path / "run"), 400)
+    assert sn_cache_store(cache_dir, "a", run, 1000)
+    other = str(tmp_path / "other")
+    os.makedirs(other)
+    assert sn_cache_fetch(cache_dir, "a", other)
+    assert not sn_cache_fetch(cache_dir, "b", other)
+    assert sn_cache_size(other) == 400
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+    run = make_run(str(tmp_path / "run"), 400)
+    for key in ("a", "b"):
+        sn_cache_store(cache_dir, key, run, 1000)
+        os.utime(os.path.join(cache_dir, key), (time.time() - 100, ) * 2)
+    sn_cache_fetch(cache_dir, "a", str(tmp_path / "run"))  # a is used
+    sn_cache_store(cache_dir, "c", run, 1000)
+    assert entries(cache_dir) == ["a", "c"]
+
+
+def test_oversized_run_not_stored(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+    sn_cache_store(cache_dir, "a", make_run(str(tmp_path / "small"), 400),
+                   1000)
+    # nothing is copied and the other entries stay
+    assert not sn_cache_store(cache_dir, "b",
+                              make_run(str(tmp_path / "big"), 1200), 1000)
+    assert entries(cache_dir) == ["a"]
+
+
+def test_evict_keeps_stores_in_progress(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache_dir)
+    run = make_run(str(tmp_path / "run"), 400)
+    sn_cache_store(cache_dir, "a", run, 1000)
+    # another process copying its artifacts, and one that died long ago
+    for name, age in (("b.tmp123", 0), ("c.tmp456", 2 * CACHE_STALE_TMP)):
+        os.makedirs(os.path.join(cache_dir, name))
+        with open(os.path.join(cache_dir, name, "topology.bin"), 'wb') as f:
+            f.write(b'x' * 900)
+        os.utime(os.path.join(cache_dir, name), (time.time() - age, ) * 2)
+    sn_cache_evict(cache_dir, 1000)
+    assert entries(cache_dir) == ["a", "b.tmp123"]
@@ -0,0 +1,51 @@
+import copy
+
+import pytest
+
+from conftest import GS_LAT_LONG, sn_test_observer
+from starrynet.sn_cache import sn_artifact_key
+from starrynet.sn_observer import Observer
+from starrynet.sn_propagator import sn_position_path
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("layout", ["dense", "sparse"])
+def test_workers_same_output(tmp_path, layout):
+    outputs = []
+    for workers in (1, 3):
+        timeline_path = sn_test_observer(tmp_path / str(workers),
+                                         topology_layout=layout,
+                                         workers=workers)
+        path = str(tmp_path / str(workers) / "run")
+        outputs.append((read(timeline_path), read(sn_position_path(path))))
+    assert outputs[0] == outputs[1]
+
+
+def test_time_chunks():
+    observer = Observer("run", ".", 53, 550, 6, 8, 0, 60, 30, 60, 1,
+                        GS_LAT_LONG, 25, "OSPF", 1, [[1, 50]], workers=3)
+    chunks = observer.time_chunks()
+    assert len(chunks) == 3
+    assert chunks[0][0] == 0 and chunks[-1][1] == 30
+    assert all(end == start for (_, end), (start, _) in zip(chunks, chunks[1:]))
+
+
+def test_artifact_key_stable():
+    observer = Observer("run", ".", 53, 550, 6, 8, 0, 60, 30, 60, 1,
+                        GS_LAT_LONG, 25, "OSPF", 1, [[1, 50]])
+    params = observer.artifact_params()
+    key = sn_artifact_key(params)
+    assert len(key) == 64
+    assert sn_artifact_key(copy.deepcopy(params)) == key
+    # key order does not matter
+    assert sn_artifact_key(dict(reversed(list(params.items())))) == key
+    # nor settings the artifacts do not depend on
+    other = Observer("other", "/tmp", 53, 550, 6, 8, 0, 60, 30, 60, 1,
+                     GS_LAT_LONG, 25, "OSPF", 5, [[1, 50]], workers=4)
+    assert sn_artifact_key(other.artifact_params()) == key
+    changed = dict(params, duration=31)
+    assert sn_artifact_key(changed) != key
@@ -0,0 +1,240 @@
+import json
+import os
+import socket
+import stat
+import subprocess
+import threading
+import time
+
+from starrynet import sn_orchestrater
+from starrynet.sn_orchestrater import sn_full_neighbors, sn_route_count
+
+# birdc output captured from the containers (bird 2.0.7)
+BIRDC_NEIGHBORS = """BIRD 2.0.7 ready.
+ospf1:
+Router ID       Pri          State      DTime   Interface  Router IP
+10.0.0.2          1     Full/PtP        34.871  B1-eth2    10.0.0.10
+10.0.0.6          1     Full/PtP        35.102  B1-eth6    10.0.0.30
+10.0.0.26         1     Init/PtP        39.990  B1-eth26   10.0.0.20
+10.0.0.5          1     Full/PtP        31.457  B1-eth5    10.0.0.40
+"""
+
+# the same reply on the control socket, with reply codes
+SOCKET_NEIGHBORS = """1013-ospf1:
+ Router ID   \tPri\t     State     \tDTime\tInterface  Router IP
+ 10.0.0.2 \t  1\tFull/PtP  \t34.871\tB1-eth2   10.0.0.10
+ 10.0.0.6 \t  1\tExStart/PtP\t35.102\tB1-eth6   10.0.0.30
+ 10.0.0.5 \t  1\tFull/DR   \t31.457\tB1-eth5   10.0.0.40
+0000
+"""
+
+BIRDC_ROUTES = """BIRD 2.0.7 ready.
+54 of 54 routes for 54 networks in table master4
+"""
+
+BIRDC_ROUTES_TABLES = """BIRD 2.0.8 ready.
+54 of 56 routes for 54 networks in table master4
+0 of 0 routes for 0 networks in table master6
+Total: 54 of 56 routes for 54 networks in 2 tables
+"""
+
+SOCKET_ROUTES_BIRD1 = """0014 12 of 12 routes for 12 networks
+"""
+
+
+def test_full_neighbors():
+    assert sn_full_neighbors(BIRDC_NEIGHBORS) == 3
+    assert sn_full_neighbors(SOCKET_NEIGHBORS) == 2
+    assert sn_full_neighbors("BIRD 2.0.7 ready.\nospf1:\n") == 0
+
+
+def test_route_count():
+    assert sn_route_count(BIRDC_ROUTES) == 54
+    assert sn_route_count(BIRDC_ROUTES_TABLES) == 54
+    assert sn_route_count(SOCKET_ROUTES_BIRD1) == 12
+    assert sn_route_count("") == 0
+
+
+def test_wait_routing_timeout(monkeypatch, capsys):
+    states = {'a': (2, 10), 'b': (1, 7), 'c': None}
+    monkeypatch.setattr(sn_orchestrater, "sn_expected_ospf",
+                        lambda ids, path: [(2, 10), (2, 10), (1, 4)])
+    monkeypatch.setattr(sn_orchestrater, "sn_ospf_state",
+                        lambda container_id: states[container_id])
+    assert sn_orchestrater.sn_wait_routing(['a', 'b', 'c'], "", 0) is None
+    out = capsys.readouterr().out
+    assert "2 nodes pending" in out
+    assert "B2: 1/2 neighbors, 7/10 routes" in out
+    assert "B3: unreachable/1 neighbors, -/4 routes" in out
+    assert "B1:" not in out
+
+
+def test_wait_routing_converged(monkeypatch):
+    monkeypatch.setattr(sn_orchestrater, "sn_expected_ospf",
+                        lambda ids, path: [(1, 3)] * len(ids))
+    monkeypatch.setattr(sn_orchestrater, "sn_ospf_state",
+                        lambda container_id: (1, 4))
+    assert sn_orchestrater.sn_wait_routing(['a', 'b'], "", 10) is not None
+
+
+def test_expected_ospf(tmp_path, monkeypatch):
+    # B1 - B2 - B3 in a line, B4 configured but unreachable
+    addresses = {
+        'c1': {"B1-eth2": "10.0.0.1/30", "lo": "127.0.0.1/8"},
+        'c2': {"B2-eth1": "10.0.0.2/30", "B2-eth3": "10.0.0.5/30"},
+        'c3': {"B3-eth2": "10.0.0.6/30", "B3-eth4": "10.0.0.9/30"},
+    }
+    threads = set()
+
+    def fetch(container_id):
+        threads.add(threading.current_thread().name)
+        return addresses[container_id]
+
+    monkeypatch.setattr(sn_orchestrater.sn_link_engine, "addresses", fetch)
+    for node, names in [(1, ["B1-eth2"]), (2, ["B2-eth1", "B2-eth3"]),
+                        (3, ["B3-eth2", "B3-eth4"]), (4, ["B4-eth3"])]:
+        (tmp_path / ("B" + str(node) + ".conf")).write_text("".join(
+            'interface "' + name + '" {\n};\n' for name in names))
+    assert sn_orchestrater.sn_expected_ospf(
+        ['c1', 'c2', 'c3', 'c4'], str(tmp_path)) == [(1, 3), (2, 3), (1, 3),
+                                                     (0, 0)]
+    assert threading.current_thread().name not in threads
+
+
+def test_update_delay_keeps_loss_and_rate(monkeypatch):
+    # only the delay moved, but tc qdisc change would reset loss and rate
+    batches = {}
+    monkeypatch.setattr(sn_orchestrater, "sn_apply_batches", batches.update)
+    links = {0: {1: 12.5, 4: 3.25}, 1: {0: 12.5}, 4: {0: 3.25}}
+    sn_orchestrater.sn_update_delay(links, ['c1', 'c2', 'c3', 'c4', 'c5'], 4,
+                                    (5, 0.1), (2.5, 1), damaged={1})
+    assert batches == {
+        'c1': [('netem', "B1-eth2", 12.5, 0.1, 5),
+               ('netem', "B1-eth5", 3.25, 1, 2.5)],
+        'c2': [('netem', "B2-eth1", 12.5, 100, 5)],
+        'c5': [('netem', "B5-eth1", 3.25, 1, 2.5)]
+    }
+    engine = sn_orchestrater.sn_Link_Engine()
+    assert engine.netem_args(*batches['c1'][0][2:]) == (
+        " root handle 1: netem delay 12.5ms loss 0.1% rate 5Gbit")
+    params = engine.netem_params(*batches['c1'][1][2:])
+    assert (params['delay'], params['loss'], params['rate']) == (3250, 1.0,
+                                                                 312500000)
+
+
+def test_daemon_requires_token(tmp_path, monkeypatch):
+    monkeypatch.setattr(sn_orchestrater, "sn_get_container_info", list)
+    monkeypatch.setattr(sn_orchestrater, "sn_stop_emulation", lambda: None)
+    port_file = str(tmp_path / "orchestrater.port")
+    daemon = threading.Thread(target=sn_orchestrater.sn_run_daemon,
+                              args=(0, "run1", port_file))
+    daemon.start()
+    for _ in range(100):
+        if os.path.exists(port_file):
+            break
+        time.sleep(0.05)
+    assert stat.S_IMODE(os.stat(port_file).st_mode) == 0o600
+    with open(port_file) as f:
+        port, run_id, token = f.read().split()
+    assert run_id == "run1"
+
+    def session(*requests):
+        with socket.create_connection(("127.0.0.1", int(port))) as conn:
+            reader = conn.makefile('r')
+            replies = []
+            for request in requests:
+                conn.sendall((json.dumps(request) + "\n").encode())
+                line = reader.readline()
+                replies.append(json.loads(line) if line else None)
+            return replies
+
+    # without the token the request is refused and the connection closed
+    assert [r and r['ok'] for r in session({'cmd': 'stop'},
+                                           {'cmd': 'hello'})] == [False, None]
+    assert session({'cmd': 'stop', 'token': 'guess'})[0]['error'] == (
+        "unauthorized request")
+    assert daemon.is_alive()
+    hello, stop = session({'cmd': 'hello', 'token': token},
+                          {'cmd': 'stop', 'token': token})
+    assert hello['ok'] and hello['run_id'] == "run1" and stop['ok']
+    daemon.join(5)
+    assert not daemon.is_alive()
+    assert not os.path.exists(port_file)
+
+
+def test_pyroute2_version():
+    assert sn_orchestrater.sn_pyroute2_supported("0.9.6")
+    assert sn_orchestrater.sn_pyroute2_supported("0.10.1")
+    assert not sn_orchestrater.sn_pyroute2_supported("0.7.12")
+    assert not sn_orchestrater.sn_pyroute2_supported("0.5.19.post2")
+
+
+class FakeIPRoute():
+
+    def __init__(self, interfaces):
+        self.interfaces = interfaces
+        self.calls = []
+
+    def link_lookup(self, ifname):
+        return [self.interfaces[ifname]] if ifname in self.interfaces else []
+
+    def link(self, *args, **kwargs):
+        self.calls.append(('link', ) + args + (kwargs, ))
+
+    def tc(self, *args, **kwargs):
+        self.calls.append(('tc', ) + args + (kwargs, ))
+
+
+def test_batch_netlink():
+    engine = sn_orchestrater.sn_Link_Engine()
+    ipr = FakeIPRoute({"B1-eth2": 5, "B1-eth3": 6})
+    engine.sockets['c1'], engine.locks['c1'] = ipr, threading.Lock()
+    failed = engine.batch('c1', [('netem', "B1-eth2", 12.5, 0.1, 5),
+                                 ('state', "B1-eth3", False),
+                                 ('netem', "B1-eth9", 1, None, None)])
+    assert failed == 1  # no B1-eth9
+    assert ipr.calls == [
+        ('tc', 'change', 'netem', 5, {
+            'handle': sn_orchestrater.TC_NETEM_HANDLE,
+            'parent': sn_orchestrater.TC_H_ROOT,
+            'delay': 12500,
+            'loss': 0.1,
+            'rate': 625000000
+        }),
+        ('link', 'set', {'index': 6, 'state': 'down'}),
+    ]
+
+
+def test_nsenter_fallback(monkeypatch):
+    runs = []
+
+    def run(args, input=None, capture_output=False, text=False):
+        runs.append((args, input))
+        failed = args[-3:] == ["-force", "-batch", "-"] and args[2] == "tc"
+        return subprocess.CompletedProcess(
+            args, 1 if failed else 0, "",
+            "Command failed -:2\n" if failed else "")
+
+    monkeypatch.setattr(sn_orchestrater, "NetNS", None)
+    monkeypatch.setattr(sn_orchestrater.subprocess, "run", run)
+    engine = sn_orchestrater.sn_Link_Engine()
+    engine.pids['c1'] = 42
+    failed = engine.batch('c1', [('netem', "B1-eth2", 12.5, 0.1, 5),
+                                 ('state', "B1-eth3", True),
+                                 ('netem', "B1-eth4", None, 100, None)])
+    assert failed == 1
+    assert runs == [
+        (["nsenter", "--net=/proc/42/ns/net", "ip", "-force", "-batch", "-"],
+         "link set dev B1-eth3 up\n"),
+        (["nsenter", "--net=/proc/42/ns/net", "tc", "-force", "-batch", "-"],
+         "qdisc change dev B1-eth2 root handle 1: netem delay 12.5ms "
+         "loss 0.1% rate 5Gbit\n"
+         "qdisc change dev B1-eth4 root handle 1: netem loss 100%\n"),
+    ]
+    runs.clear()
+    engine.attach('c1', "9.1.1.50", "B1-eth50", 3.25, 1, 2.5)
+    args, _ = runs[0]
+    assert args[:4] == ["nsenter", "--net=/proc/42/ns/net", "sh", "-c"]
+    assert args[4].endswith("ip link set dev B1-eth50 up && tc qdisc add "
+                            "dev B1-eth50 root handle 1: netem delay 3.25ms "
+                            "loss 1% rate 2.5Gbit")
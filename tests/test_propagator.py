@@ -0,0 +1,174 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from sgp4 import exporter
+from skyfield.api import load, wgs84, EarthSatellite
+
+from starrynet.sn_propagator import *
+
+
+def skyfield_lla(satrecs, duration, resolution, start):
+    # LLA of the satellites as the Observer computed them before the
+    # SatrecArray grid: one skyfield EarthSatellite at a time
+    ts = load.timescale()
+    times = ts.utc(*start.timetuple()[:5],
+                   start.second + np.arange(duration) * resolution)
+    lla = np.empty((duration, len(satrecs), 3))
+    for k, satrec in enumerate(satrecs):
+        subpoint = wgs84.subpoint(
+            EarthSatellite.from_satrec(satrec, ts).at(times))
+        lla[:, k] = np.stack((subpoint.latitude.degrees,
+                              subpoint.longitude.degrees,
+                              subpoint.elevation.km),
+                             axis=-1)
+    return lla
+
+
+@pytest.mark.parametrize("start", [EMULATION_START,
+                                   datetime(2022, 1, 1, 1, 0, 30)])
+def test_time_grid_matches_skyfield(start):
+    satrecs = sn_walker_satrecs(53, 550, 3, 4, 0, 60)
+    _, ecef, lla = sn_propagate(satrecs, 20, 30, start=start)
+    old = skyfield_lla(satrecs, 20, 30, start)
+    np.testing.assert_allclose(lla[..., 0], old[..., 0], atol=1e-6)
+    np.testing.assert_allclose((lla[..., 1] - old[..., 1] + 180) % 360 - 180,
+                               0,
+                               atol=1e-6)
+    np.testing.assert_allclose(lla[..., 2], old[..., 2], atol=1e-6)
+    old_ecef = sn_geodetic_to_ecef(old.reshape(-1, 3)).reshape(old.shape)
+    assert np.linalg.norm(ecef - old_ecef, axis=-1).max() < 1e-4  # km
+
+
+def test_time_grid_first():
+    # a chunk starting at sample first is the same part of the whole grid
+    whole = sn_time_grid(50, 7)
+    chunk = sn_time_grid(20, 7, first=30)
+    for a, b in zip(whole, chunk):
+        np.testing.assert_allclose(a[30:] + 0.0, b)
+    jd, fr, _ = whole
+    assert np.all((fr >= 0) & (fr < 1))
+    np.testing.assert_allclose((np.diff(jd) + np.diff(fr)) * 86400, 7, atol=1e-5)
+
+
+@pytest.mark.parametrize("resolution", [10, 60])
+def test_position_interpolation(tmp_path, resolution):
+    # 6-point Lagrange interpolation between the samples stays within 1 m
+    # of SGP4 run at the same instant, the first and last intervals too
+    satrecs = sn_walker_satrecs(53, 550, 3, 4, 0, 60)
+    duration = 12
+    _, ecef, _ = sn_propagate(satrecs, duration, resolution)
+    sn_create_positions(str(tmp_path), duration, len(satrecs))
+    sn_store_positions(str(tmp_path), 0, ecef)
+    store = PositionStore(sn_position_path(str(tmp_path)))
+    assert store.order == 6
+    for sample in (0, 5, duration - 1):
+        np.testing.assert_array_equal(store.ecef_at(sample), ecef[sample])
+    for time_index in (0.1, 0.5, 1.5, 5.3, 9.5, 10.5, duration - 1.1):
+        second = int(round(time_index * resolution))
+        _, direct, lla = sn_propagate(satrecs, 1, 1, first=second)
+        error = np.linalg.norm(store.ecef_at(time_index) - direct[0], axis=-1)
+        assert error.max() < 1e-3  # km
+        np.testing.assert_allclose(store.position(3, time_index),
+                                   lla[0, 2],
+                                   atol=1e-4)
+    with pytest.raises(IndexError):
+        store.ecef_at(duration - 0.5)
+    with pytest.raises(IndexError):
+        store.ecef_at(-0.5)
+
+
+WALKER = (53, 550, 6, 8, 0, 60)
+
+
+def test_j2_matches_sgp4_shapes():
+    satrecs = sn_walker_satrecs(*WALKER, EMULATION_START)
+    for first in (0, 7):
+        sgp4 = sn_propagate(satrecs, 10, 60, first)
+        j2 = sn_j2_propagate(*WALKER, 10, 60, first)
+        for a, b in zip(sgp4, j2):
+            assert a.shape == b.shape == (10, 48, 3)
+            assert a.dtype == b.dtype
+        # same shell at the same altitude
+        assert np.abs(j2[2][..., 2] - 550).max() < 10
+
+
+@pytest.mark.parametrize("duration", [10, 1440])
+def test_j2_error(duration):
+    # the deviation documented for the J2 backend: under 20 km over 10 min
+    # and over a day, and what sn_j2_error reports
+    error = sn_j2_error(*WALKER, duration, 60)
+    assert 0 < error < 20
+    satrecs = sn_walker_satrecs(*WALKER, EMULATION_START)
+    first = np.unique(np.linspace(0, duration - 1, 16).astype(int))
+    direct = max(
+        np.linalg.norm(
+            sn_propagate(satrecs, 1, 60, t)[0] -
+            sn_j2_propagate(*WALKER, 1, 60, t)[0],
+            axis=-1).max() for t in first.tolist())
+    assert error == pytest.approx(direct)
+    if duration == 10:
+        # every sample of a short run is checked
+        full = np.linalg.norm(
+            sn_propagate(satrecs, duration, 60)[0] -
+            sn_j2_propagate(*WALKER, duration, 60)[0],
+            axis=-1).max()
+        assert error == pytest.approx(full)
+
+
+def tle_lines(satrec, satnum, name):
+    line1, line2 = exporter.export_tle(satrec)
+    return [
+        name, line1[:2] + "%05d" % satnum + line1[7:],
+        line2[:2] + "%05d" % satnum + line2[7:]
+    ]
+
+
+@pytest.fixture
+def two_shells(tmp_path):
+    # two partial Walker shells, a 53 deg 4 x 10 (satnums 100 + index) and a
+    # 97.6 deg 3 x 9 (200 + index), then a record cut after its first line
+    lines = []
+    for num, satrec in enumerate(sn_walker_satrecs(53, 550, 4, 10, 0, 20)):
+        lines += tle_lines(satrec, 100 + num, "SHELL-A " + str(num))
+    for num, satrec in enumerate(sn_walker_satrecs(97.6, 560, 3, 9, 0, 15)):
+        lines += tle_lines(satrec, 200 + num, "SHELL-B " + str(num))
+    lines += ["", "BROKEN", "1 99999U 20001A   garbage", "not a TLE line"]
+    path = str(tmp_path / "shells.tle")
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def test_read_tle(two_shells):
+    tles = sn_read_tle(two_shells)
+    assert len(tles) == 40 + 27
+    assert tles[0][0] == "SHELL-A 0" and tles[-1][0] == "SHELL-B 26"
+    assert all(line1.startswith("1 ") and line2.startswith("2 ")
+               for _, line1, line2 in tles)
+
+
+@pytest.mark.parametrize("shell", [(53, 550, 4, 10, 100), (97.6, 560, 3, 9, 200)])
+def test_tle_shells(two_shells, shell):
+    inclination, altitude, orbit_number, sat_number, base = shell
+    satrecs, start = sn_tle_satrecs(two_shells, inclination, altitude,
+                                    orbit_number, sat_number)
+    assert start == WALKER_EPOCH
+    index = np.array([s.satnum for s in satrecs]) - base
+    # only the requested shell, every satellite once
+    assert sorted(index.tolist()) == list(range(orbit_number * sat_number))
+    orbit, slot = np.divmod(index.reshape(orbit_number, sat_number),
+                            sat_number)
+    # a grid orbit is a Walker plane, next to the previous one
+    assert np.all(orbit == orbit[:, :1])
+    assert np.all(np.diff(orbit[:, 0]) % orbit_number == 1)
+    # in phase order within each plane
+    assert np.all(np.diff(slot, axis=1) % sat_number == 1)
+
+
+def test_tle_errors(two_shells):
+    with pytest.raises(ValueError, match="No satellite"):
+        sn_tle_satrecs(two_shells, 70, 550, 4, 10)
+    # more planes than the shell has: the error names the grids that fit
+    with pytest.raises(ValueError, match="has 4 planes .* fits a 4x10 or 5x"):
+        sn_tle_satrecs(two_shells, 53, 550, 5, 10)
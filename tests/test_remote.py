@@ -0,0 +1,187 @@
+import os
+import shlex
+import shutil
+import socket
+import subprocess
+import threading
+
+import pytest
+
+from starrynet import sn_orchestrater
+from starrynet.sn_remote import *
+
+
+class FakeTransport():
+    # direct-tcpip channels become local TCP connections
+
+    def open_channel(self, kind, dest_addr, src_addr):
+        assert kind == 'direct-tcpip'
+        return socket.create_connection(dest_addr)
+
+
+class FakeDaemonExecutor():
+    # runs the commands of RemoteOrchestrator.start locally, the daemon in a
+    # thread of the test
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.transport = FakeTransport()
+        self.threads = []
+
+    def run(self, cmd):
+        if "nohup" in cmd:
+            args = shlex.split(cmd.split("nohup ")[1].split(" >")[0])
+            thread = threading.Thread(
+                target=sn_orchestrater.sn_run_daemon,
+                args=(int(args[3]), args[5],
+                      self.file_path + "/orchestrater.port"))
+            thread.start()
+            self.threads.append(thread)
+            return RemoteResult(cmd, 0, [], "", 0)
+        path = cmd.split("cat ")[1]
+        if not os.path.exists(path):
+            return RemoteResult(cmd, 1, [], "No such file", 0)
+        with open(path) as f:
+            return RemoteResult(cmd, 0, f.readlines(), "", 0)
+
+
+class FakeUploads():
+
+    def put(self, local_file, remote_file):
+        pass
+
+
+def test_orchestrator_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(sn_orchestrater, "sn_get_container_info", list)
+    monkeypatch.setattr(sn_orchestrater, "sn_stop_emulation", lambda: None)
+    executor = FakeDaemonExecutor(str(tmp_path))
+    orchestrator = RemoteOrchestrator(executor, FakeUploads(), str(tmp_path))
+    orchestrator.start("sn_orchestrater.py", interval=0.05)
+    assert orchestrator.request('containers')['containers'] == 0
+    with pytest.raises(RuntimeError):
+        orchestrator.request('no such command')
+    # another client without the token is refused and disconnected
+    intruder = RemoteOrchestrator(executor, FakeUploads(), str(tmp_path))
+    intruder.channel = executor.transport.open_channel(
+        'direct-tcpip', ('127.0.0.1', orchestrator.port), ('127.0.0.1', 0))
+    intruder.reader = intruder.channel.makefile('r')
+    intruder.token = "guess"
+    with pytest.raises(RuntimeError):
+        intruder.request('stop')
+    with pytest.raises(ConnectionError):
+        intruder.request('hello')
+    intruder.close()
+    assert orchestrator.request('hello')['run_id'] == orchestrator.run_id
+    orchestrator.request('stop')
+    orchestrator.close()
+    executor.threads[0].join(5)
+    assert not executor.threads[0].is_alive()
+
+
+class FakeSFTP():
+    # the remote machine is a local directory
+
+    def __init__(self, home):
+        self.home = home
+        self.puts = []
+
+    def put(self, local_file, remote_file):
+        self.puts.append(remote_file)
+        shutil.copyfile(local_file, remote_file)
+
+    def putfo(self, fileobj, remote_file):
+        self.puts.append(remote_file)
+        with open(os.path.join(self.home, remote_file), 'wb') as f:
+            shutil.copyfileobj(fileobj, f)
+
+
+class FakeShellExecutor():
+    # runs the commands locally, from the home of FakeSFTP
+
+    def __init__(self, home):
+        self.home = home
+
+    def run(self, cmd):
+        result = subprocess.run(cmd, shell=True, cwd=self.home,
+                                capture_output=True, text=True)
+        return RemoteResult(cmd, result.returncode,
+                            result.stdout.splitlines(True), result.stderr, 0)
+
+    def run_all(self, cmds):
+        return [self.run(cmd) for cmd in cmds]
+
+
+@pytest.fixture
+def remote_files(tmp_path):
+    local, remote = tmp_path / "local", tmp_path / "remote"
+    local.mkdir()
+    remote.mkdir()
+    for name, content in [("a", b"alpha"), ("b", b"beta"), ("c", b"gamma")]:
+        (local / name).write_bytes(content * 100)
+    files = RemoteFiles(FakeSFTP(str(remote)), FakeShellExecutor(str(remote)))
+    return files, str(local), str(remote)
+
+
+def test_plan(remote_files):
+    files, local, remote = remote_files
+    uploads = [(local + "/a", remote + "/a"), (local + "/b", remote + "/b")]
+    send, copies = files.plan(uploads)
+    assert send == [(local + "/a", remote + "/a", 500),
+                    (local + "/b", remote + "/b", 400)]
+    assert copies == []
+    # unchanged files are skipped, known content elsewhere is copied
+    send, copies = files.plan(uploads + [(local + "/a", remote + "/a2")])
+    assert send == [] and files.files_skipped == 2
+    assert copies == [(remote + "/a", remote + "/a2", local + "/a", 500,
+                       sn_file_hash(local + "/a"))]
+    # the remote file is never looked at, only forget() sends it again
+    files.forget(remote + "/b")
+    send, copies = files.plan(uploads)
+    assert send == [(local + "/b", remote + "/b", 400)]
+    assert files.files_skipped == 3
+
+
+def test_copy_stale_source(remote_files):
+    files, local, remote = remote_files
+    files.put_all([(local + "/a", remote + "/a"),
+                   (local + "/b", remote + "/b")])
+    with open(remote + "/b", 'wb') as f:
+        f.write(b"changed remotely")
+    send, copies = files.plan([(local + "/a", remote + "/a2"),
+                               (local + "/b", remote + "/b2")])
+    assert send == [] and len(copies) == 2
+    assert files.copy(copies) == [(local + "/b", remote + "/b2", 400)]
+    with open(remote + "/a2", 'rb') as f:
+        assert f.read() == b"alpha" * 100
+    assert not os.path.exists(remote + "/b2")
+    # the changed source is no longer offered for copies
+    assert remote + "/b" not in files.hashes
+    assert remote + "/a" in files.hashes
+
+
+def test_put_all_counters(remote_files):
+    files, local, remote = remote_files
+    # several files go in one archive, removed once extracted
+    files.put_all([(local + "/a", remote + "/a"),
+                   (local + "/b", remote + "/b")])
+    assert files.remote_ftp.puts[0].startswith("sn_upload_")
+    assert sorted(os.listdir(remote)) == ["a", "b"]
+    assert (files.files_sent, files.files_copied, files.files_skipped) == (2, 0,
+                                                                          0)
+    assert files.bytes_sent + files.bytes_saved == 900
+    with open(remote + "/b", 'wb') as f:
+        f.write(b"changed remotely")
+    sent, saved = files.bytes_sent, files.bytes_saved
+    files.put_all([(local + "/a", remote + "/a"),
+                   (local + "/a", remote + "/a2"),
+                   (local + "/b", remote + "/b2"),
+                   (local + "/c", remote + "/c")])
+    # a skipped, a2 copied, c sent, b2 sent after its source went stale
+    assert (files.files_sent, files.files_copied, files.files_skipped) == (4, 1,
+                                                                          1)
+    assert files.remote_ftp.puts[1:] == [remote + "/c", remote + "/b2"]
+    assert (files.bytes_sent - sent, files.bytes_saved - saved) == (900, 1000)
+    for name, content in [("a2", b"alpha"), ("b2", b"beta"), ("c", b"gamma")]:
+        with open(remote + "/" + name, 'rb') as f:
+            assert f.read() == content * 100
+    assert "4 files" in files.report() and "1 copied" in files.report()
@@ -0,0 +1,384 @@
+import os
+import shutil
+import struct
+
+import numpy as np
+import pytest
+
+from conftest import sn_test_observer
+from starrynet.sn_timeline import *
+
+
+def link_set(timeline, time_index):
+    a, b, delay = timeline.links(time_index)
+    return dict(zip(zip(a.tolist(), b.tolist()), delay.tolist()))
+
+
+def test_header_size():
+    assert TIMELINE_FRAMES_OFFSET + TIMELINE_FRAMES.size <= TIMELINE_HEADER_SIZE
+    assert TIMELINE_HEADER_SIZE == 64
+
+
+def test_dense_header_round_trip(tmp_path):
+    path = str(tmp_path / "topology.bin")
+    matrices = sn_create_timeline(path, 7, 5, 30)
+    del matrices
+    with open(path, 'rb') as f:
+        header = f.read(TIMELINE_HEADER_SIZE)
+    assert header[:4] == TIMELINE_MAGIC
+    timeline = Timeline(path)
+    assert (timeline.layout, timeline.node_num, timeline.duration,
+            timeline.resolution, timeline.keyframes) == (LAYOUT_DENSE, 7, 5,
+                                                         30, 0)
+    assert timeline.matrices.shape == (5, 7, 7)
+    assert timeline.matrices.offset == TIMELINE_HEADER_SIZE
+
+
+@pytest.mark.parametrize("isl_period", [0, 3])
+def test_sparse_header_round_trip(tmp_path, isl_period):
+    path = str(tmp_path / "topology.bin")
+    sn_create_sparse_timeline(path, 3, 4, 2, 1, 6, 10, isl_period)
+    timeline = Timeline(path)
+    assert (timeline.layout, timeline.node_num, timeline.duration,
+            timeline.resolution) == (LAYOUT_SPARSE, 14, 6, 10)
+    assert (timeline.orbit_number, timeline.sat_number, timeline.fac_num,
+            timeline.antenna_num) == (3, 4, 2, 1)
+    assert timeline.isl_period == (isl_period if isl_period else 6)
+    with open(path, 'rb') as f:
+        header = f.read(TIMELINE_HEADER_SIZE)
+    assert TIMELINE_GRID.unpack_from(header, TIMELINE_HEADER.size) == (
+        3, 4, 2, 1, isl_period)
+    # rewriting the fields gives back the same bytes
+    rebuilt = TIMELINE_HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION,
+                                   LAYOUT_SPARSE, 14, 6, 10)
+    rebuilt += TIMELINE_GRID.pack(3, 4, 2, 1, isl_period)
+    rebuilt += TIMELINE_FRAMES.pack(0)
+    assert header == rebuilt.ljust(TIMELINE_HEADER_SIZE, b'\0')
+
+
+def test_bad_magic(tmp_path):
+    path = str(tmp_path / "topology.bin")
+    with open(path, 'wb') as f:
+        f.write(b'\0' * TIMELINE_HEADER_SIZE)
+    with pytest.raises(ValueError):
+        Timeline(path)
+
+
+def test_dense_sparse_links(dense_timeline, sparse_timeline):
+    dense, sparse = Timeline(dense_timeline), Timeline(sparse_timeline)
+    assert dense.node_num == sparse.node_num
+    for time_index in range(1, dense.duration + 1):
+        assert link_set(dense, time_index) == pytest.approx(
+            link_set(sparse, time_index), abs=0.011)
+        np.testing.assert_allclose(dense.matrix(time_index),
+                                   sparse.matrix(time_index),
+                                   atol=0.011)
+
+
+def test_isl_cycle(tmp_path):
+    # 191 x 30 s is 2.6 s off the nodal period of the shell, so the reused
+    # ISLs drift by a few hundredths of a millisecond
+    params = dict(topology_layout="sparse", resolution=30, duration=200)
+    full_path = sn_test_observer(tmp_path / "full", **params)
+    cycle_path = sn_test_observer(tmp_path / "cycle", cycle=5730, **params)
+    assert os.path.getsize(cycle_path) < os.path.getsize(full_path)
+    full, cycle = Timeline(full_path), Timeline(cycle_path)
+    assert (full.isl_period, cycle.isl_period) == (200, 191)
+    for time_index in range(1, full.duration + 1):
+        np.testing.assert_array_equal(full.link_mask(time_index),
+                                      cycle.link_mask(time_index))
+        if time_index <= cycle.isl_period:
+            np.testing.assert_array_equal(full.link_delays(time_index),
+                                          cycle.link_delays(time_index))
+        else:
+            np.testing.assert_allclose(full.link_delays(time_index),
+                                       cycle.link_delays(time_index),
+                                       atol=0.1)
+
+
+@pytest.mark.parametrize("orbit_number,sat_number", [(2, 3), (3, 2), (1, 4)])
+def test_link_mask_matches_links(tmp_path, orbit_number, sat_number):
+    # small grids repeat ISL edges or turn them into self-loops
+    paths = [
+        sn_test_observer(tmp_path / layout,
+                         orbit_number=orbit_number,
+                         sat_number=sat_number,
+                         duration=4,
+                         topology_layout=layout)
+        for layout in ("dense", "sparse")
+    ]
+    for timeline in map(Timeline, paths):
+        for time_index in range(1, timeline.duration + 1):
+            mask = timeline.link_mask(time_index)
+            a, b = timeline.mask_links(np.nonzero(mask)[0])
+            links = link_set(timeline, time_index)
+            assert sorted(zip(a.tolist(), b.tolist())) == sorted(links)
+            delays = timeline.link_delays(time_index)
+            assert np.count_nonzero(delays) == len(links)
+            assert sorted(delays[mask].tolist()) == pytest.approx(
+                sorted(links.values()))
+
+
+@pytest.mark.parametrize("layout", ["dense", "sparse"])
+def test_compaction(tmp_path, dense_timeline, sparse_timeline, layout):
+    full_path = dense_timeline if layout == "dense" else sparse_timeline
+    path = str(tmp_path / "topology.bin")
+    shutil.copyfile(full_path, path)
+    epsilon = 2
+    keyframes = sn_compact_timeline(path, epsilon)
+    full, compact = Timeline(full_path), Timeline(path)
+    assert 1 < keyframes < full.duration
+    assert compact.keyframes == keyframes
+    assert compact.keyframe(1) == 1
+    # compacting again keeps the file
+    assert sn_compact_timeline(path, epsilon) == keyframes
+    for time_index in range(1, full.duration + 1):
+        keyframe = compact.keyframe(time_index)
+        assert keyframe <= time_index
+        # a timestep repeats its keyframe ...
+        assert link_set(compact, time_index) == link_set(full, keyframe)
+        # ... within epsilon of its own delays, with the same links
+        now = link_set(full, time_index)
+        repeated = link_set(compact, time_index)
+        assert sorted(now) == sorted(repeated)
+        assert max(abs(now[k] - repeated[k]) for k in now) <= epsilon + 0.01
+
+
+def test_tracker_threshold():
+    tracker = LinkDelayTracker(10, threshold=1)
+    a, b = np.array([0, 1]), np.array([1, 2])
+    tracker.seed(a, b, np.array([10.0, 20.0]))
+    send = tracker.select(a, b, np.array([10.5, 21.5]))
+    assert send.tolist() == [False, True]
+    # drift is measured from the delay applied, not the last one seen
+    send = tracker.select(a, b, np.array([11.2, 21.6]))
+    assert send.tolist() == [True, False]
+    assert (tracker.applied, tracker.suppressed) == (2, 2)
+
+
+def test_tracker_ratio():
+    tracker = LinkDelayTracker(10, ratio=0.1)
+    a, b = np.array([0, 3]), np.array([1, 4])
+    tracker.seed(a, b, np.array([10.0, 100.0]))
+    send = tracker.select(a, b, np.array([10.5, 111.0]))
+    assert send.tolist() == [False, True]
+
+
+def test_tracker_links_come_and_go():
+    tracker = LinkDelayTracker(10, threshold=5)
+    tracker.seed(np.array([0, 1]), np.array([1, 2]), np.array([10.0, 20.0]))
+    # link 1-2 disappears, 2-3 is new
+    send = tracker.select(np.array([0, 2]), np.array([1, 3]),
+                          np.array([11.0, 30.0]))
+    assert send.tolist() == [False, True]
+    # link 1-2 comes back and is sent in full
+    send = tracker.select(np.array([0, 1, 2]), np.array([1, 2, 3]),
+                          np.array([11.0, 20.0, 30.0]))
+    assert send.tolist() == [False, True, False]
+    tracker.forget(1, 0)
+    send = tracker.select(np.array([0]), np.array([1]), np.array([10.0]))
+    assert send.tolist() == [True]
+    tracker.reset()
+    assert len(tracker.keys) == 0
+
+
+def test_tracker_zero_threshold_sends_changes():
+    tracker = LinkDelayTracker(10)
+    tracker.seed(np.array([0]), np.array([1]), np.array([10.0]))
+    assert tracker.select(np.array([0]), np.array([1]),
+                          np.array([10.0])).tolist() == [False]
+    assert tracker.select(np.array([0]), np.array([1]),
+                          np.array([10.01])).tolist() == [True]
+
+
+def test_save_links(tmp_path, sparse_timeline):
+    timeline = Timeline(sparse_timeline)
+    npy_path = str(tmp_path / "1.npy")
+    count = timeline.save_links(1, npy_path)
+    saved = np.load(npy_path)
+    assert count == len(saved) == len(timeline.links(1)[0])
+    tracker = LinkDelayTracker(timeline.node_num, threshold=1000)
+    tracker.seed(*timeline.links(1))
+    assert timeline.save_links(2, npy_path, tracker) == 0
+
+
+@pytest.mark.parametrize("layout", ["dense", "sparse"])
+def test_topology_cache(dense_timeline, sparse_timeline, layout):
+    timeline = Timeline(dense_timeline if layout ==
+                        "dense" else sparse_timeline)
+    cache = TopologyCache(timeline)
+    for time_index in range(1, timeline.duration + 1):
+        matrix = np.round(np.asarray(timeline.matrix(time_index),
+                                     dtype=np.float64), 2)
+        indptr, peers, delay = cache.adjacency(time_index)
+        rebuilt = np.zeros_like(matrix)
+        rows = np.repeat(np.arange(timeline.node_num), np.diff(indptr))
+        rebuilt[rows, peers] = delay
+        np.testing.assert_allclose(rebuilt, matrix, atol=1e-6)
+        for node in (1, timeline.node_num):
+            assert cache.neighbors(node, time_index).tolist() == (
+                timeline.neighbors(node, time_index).tolist())
+            for peer in cache.neighbors(node, time_index).tolist():
+                assert cache.delay(node, peer, time_index) == timeline.delay(
+                    node, peer, time_index)
+    assert cache.stats()['misses'] == timeline.duration
+    cache.adjacency(1)
+    assert cache.stats()['hits'] > 0
+
+
+def test_topology_cache_budget(sparse_timeline):
+    timeline = Timeline(sparse_timeline)
+    cache = TopologyCache(timeline, memory_budget=1)
+    for time_index in range(1, 6):
+        cache.adjacency(time_index)
+    # the newest snapshot is kept even over budget
+    assert list(cache.snapshots) == [5]
+
+
+class FakeWindow():
+    generated = 3
+    discarded = 1
+
+    def require(self, first, last):
+        if first <= self.discarded:
+            raise ValueError("discarded")
+        if last > self.generated:
+            raise ValueError("not generated")
+
+
+def test_window_reads(sparse_timeline):
+    timeline = Timeline(sparse_timeline, window=FakeWindow())
+    cache = TopologyCache(timeline)
+    assert len(cache.adjacency(2)[1])
+    for time_index in (1, 4):
+        with pytest.raises(ValueError):
+            cache.adjacency(time_index)
+        with pytest.raises(ValueError):
+            timeline.links(time_index)
+    assert list(cache.snapshots) == [2]
+
+
+def test_compaction_chunks(tmp_path, monkeypatch, sparse_timeline):
+    # copying one record at a time writes the same file
+    paths = [str(tmp_path / name) for name in ("whole.bin", "chunked.bin")]
+    for path in paths:
+        shutil.copyfile(sparse_timeline, path)
+    sn_compact_timeline(paths[0], 2)
+    monkeypatch.setattr("starrynet.sn_timeline.COMPACT_CHUNK", 1)
+    sn_compact_timeline(paths[1], 2)
+    with open(paths[0], 'rb') as whole, open(paths[1], 'rb') as chunked:
+        assert whole.read() == chunked.read()
+
+
+@pytest.mark.parametrize("layout", ["dense", "sparse"])
+def test_series_match_single_queries(dense_timeline, sparse_timeline, layout):
+    # the batch APIs agree with the per-step get_distance / get_neighbors /
+    # get_GSes lookups they replace
+    timeline = Timeline(dense_timeline if layout ==
+                        "dense" else sparse_timeline)
+    cache = TopologyCache(timeline)
+    sat_num = 6 * 8
+    times = [5, 1, 30, 5, 17]
+    nodes = list(range(1, timeline.node_num + 1))
+    pairs = [(a, b) for a in (1, 8, 9, 48, 49, 50) for b in nodes]
+    delay = timeline.delay_series([a for a, _ in pairs],
+                                  [b for _, b in pairs], times)
+    assert delay.shape == (len(times), len(pairs))
+    assert np.count_nonzero(delay)
+    gsl = timeline.gsl_series(sat_num, times)
+    assert gsl.shape == (len(times), sat_num, 2)
+    assert gsl.any()
+    for row, time_index in enumerate(times):
+        assert delay[row].tolist() == [
+            cache.delay(a, b, time_index) for a, b in pairs
+        ]
+        for node in (1, 9, 49, 50):
+            series = timeline.neighbor_series(node, times)[row]
+            assert (np.nonzero(series)[0] + 1).tolist() == (cache.neighbors(
+                node, time_index).tolist())
+        for sat in range(1, sat_num + 1):
+            GSes = cache.neighbors(sat, time_index)
+            assert (np.nonzero(gsl[row, sat - 1])[0] + sat_num + 1).tolist() == (
+                GSes[GSes > sat_num].tolist())
+    assert timeline.delay_series([1], [1], times).tolist() == [[0]] * len(times)
+
+
+def test_event_log_round_trip(tmp_path):
+    path = str(tmp_path)
+    events = TopologyEventWriter(path, resolution=10)
+    events.write(2, [(1, 2, 5.0, 5, 0)], [(3, 9, 7.123, 2.5, 1)])
+    events.flush()
+    assert sn_read_events(sn_events_path(path), 0, 1)[0]["node_b"] == 2
+    # a handover refined to second 47, between timesteps 4 and 5
+    events.write(5, [], [(4, 9, 6.0, 2.5, 1)], second=47)
+    events.write(5, [(3, 9, 8.0, 2.5, 1)], [])
+    events.close(12)
+    log = TopologyEvents(path, resolution=10)
+    assert log.times.tolist() == [2, 5, 5]
+    assert log.index['count'].tolist() == [2, 1, 1]
+    assert log.seconds.tolist() == [20, 47, 50]
+    assert log.durations.tolist() == [3, 0, 7]
+    with open(sn_events_path(path), 'rb') as f:
+        lines = f.readlines()
+    assert log.index['offset'].tolist() == [
+        0, len(lines[0]) + len(lines[1]),
+        len(lines[0]) + len(lines[1]) + len(lines[2])
+    ]
+    assert log.read(0) == [{
+        "time": 2, "kind": "del", "node_a": 1, "node_b": 2, "delay": 5.0,
+        "bw": 5, "loss": 0
+    }, {
+        "time": 2, "kind": "add", "node_a": 3, "node_b": 9, "delay": 7.12,
+        "bw": 2.5, "loss": 1
+    }]
+    assert [(e["kind"], e["node_a"]) for e in log.changes(5)] == [("add", 4),
+                                                                  ("del", 3)]
+    assert log.changes(3) == []
+    assert [(t, len(changes)) for t, changes in log] == [(2, 2), (5, 2)]
+    assert [(t, s, len(e)) for t, s, e in log.change_sets()] == [(2, 20, 2),
+                                                                 (5, 47, 1),
+                                                                 (5, 50, 1)]
+
+
+def test_event_log_without_seconds(tmp_path):
+    # an index written before handovers were refined
+    path = str(tmp_path)
+    events = TopologyEventWriter(path)
+    events.write(3, [], [(1, 2, 5.0, 5, 0)])
+    events.close(10)
+    index = np.load(sn_events_index_path(path))
+    np.save(sn_events_index_path(path),
+            index[['time', 'offset', 'count', 'duration']])
+    log = TopologyEvents(path, resolution=30)
+    assert log.seconds.tolist() == [90]
+    assert log.read(0)[0]["node_b"] == 2
+
+
+@pytest.mark.parametrize("layout", ["dense", "sparse"])
+def test_observer_event_log(dense_timeline, sparse_timeline, layout):
+    timeline_path = dense_timeline if layout == "dense" else sparse_timeline
+    timeline = Timeline(timeline_path)
+    log = TopologyEvents(os.path.dirname(timeline_path), timeline.resolution)
+    assert len(log.times)
+    # the last change lasts until the end of the emulation, not a fixed 60
+    assert log.durations[-1] == timeline.duration - log.times[-1]
+    assert log.durations.sum() == timeline.duration - log.times[0]
+    assert np.all(log.seconds == log.times * timeline.resolution)
+    # every change-set is the link diff of its timestep; the emulation ends
+    # when the last timestep starts, its changes are never applied
+    changes = dict(iter(log))
+    assert max(changes) < timeline.duration
+    for time_index in range(2, timeline.duration):
+        before = link_set(timeline, time_index - 1)
+        now = link_set(timeline, time_index)
+        events = changes.get(time_index, [])
+        dels = {(e["node_a"] - 1, e["node_b"] - 1)
+                for e in events if e["kind"] == "del"}
+        adds = {(e["node_a"] - 1, e["node_b"] - 1): e["delay"]
+                for e in events if e["kind"] == "add"}
+        assert dels == set(before) - set(now)
+        assert sorted(adds) == sorted(set(now) - set(before))
+        for link, delay in adds.items():
+            assert delay == pytest.approx(now[link], abs=0.006)
+        kinds = [e["kind"] for e in events]
+        assert kinds == sorted(kinds, key=["del", "add"].index)
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: UTF-8 -*-
+"""
+Benchmark of the vectorized GSL/ISL delay kernel of sn_observer against the
+original per-second Python loop of Observer.access_P_L_shortest.
+
+    python3 tools/bench_access.py [duration]  (timesteps, 60 by default)
+
+For each shell the delay matrices of both implementations are compared
+element by element before the timings are reported.
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from starrynet.sn_observer import *
+
+SHELLS = [(5, 5), (72, 22), (76, 58)]  # 25, 1584 and 4408 satellites
+GS_LAT_LONG = [[50.110924, 8.682127], [46.635700, 14.311817],
+               [40.416775, -3.703790], [35.689487, 139.691711],
+               [-33.868820, 151.209290], [39.904202, 116.407394]]
+ANTENNA_NUMBER = 2
+
+
+def legacy_access(sat_cbf, fac_cbf, fac_num, sat_num, num_orbits,
+                  num_sats_per_orbit, duration, fac_ll, sat_lla, bound_dis,
+                  alpha, antenna_num, sink):
+    # Observer.access_P_L_shortest before vectorization, writing to sink
+    # instead of np.savetxt.
+    delay_matrix = np.zeros((fac_num + sat_num, fac_num + sat_num))
+    for cur_time in range(duration):
+        for i in range(0, fac_num):
+            access_list = {}
+            fac_lat = float(fac_ll[i][0])
+            up_lat = fac_lat + alpha
+            down_lat = fac_lat - alpha
+            x2 = fac_cbf[i][0]
+            y2 = fac_cbf[i][1]
+            z2 = fac_cbf[i][2]
+            for j in range(0, sat_num):
+                if sat_lla[cur_time][j][0] >= down_lat and sat_lla[
+                        cur_time][j][0] <= up_lat:
+                    x1 = sat_cbf[cur_time][j][0]
+                    y1 = sat_cbf[cur_time][j][1]
+                    z1 = sat_cbf[cur_time][j][2]
+                    dist = math.sqrt(
+                        np.square(x1 - x2) + np.square(y1 - y2) +
+                        np.square(z1 - z2))
+                    if dist < bound_dis:
+                        access_list.update({j: dist})
+            if len(access_list) > antenna_num:
+                sorted_access_list = dict(
+                    sorted(access_list.items(), key=lambda item: item[1]))
+                cnt = 0
+                for key, value in sorted_access_list.items():
+                    cnt = cnt + 1
+                    if cnt > antenna_num:
+                        break
+                    delay_time = value / (17.31 / 29.5 * 299792.458) * 1000
+                    delay_matrix[sat_num + i][key] = delay_time
+                    delay_matrix[key][sat_num + i] = delay_time
+            elif len(access_list) != 0:
+                for key, value in access_list.items():
+                    delay_time = value / (17.31 / 29.5 * 299792.458) * 1000
+                    delay_matrix[sat_num + i][key] = delay_time
+                    delay_matrix[key][sat_num + i] = delay_time
+        for i in range(num_orbits):
+            for j in range(num_sats_per_orbit):
+                num_sat1 = i * num_sats_per_orbit + j
+                x1 = sat_cbf[cur_time][num_sat1][0]
+                y1 = sat_cbf[cur_time][num_sat1][1]
+                z1 = sat_cbf[cur_time][num_sat1][2]
+                num_sat2 = i * num_sats_per_orbit + (j +
+                                                     1) % num_sats_per_orbit
+                x2 = sat_cbf[cur_time][num_sat2][0]
+                y2 = sat_cbf[cur_time][num_sat2][1]
+                z2 = sat_cbf[cur_time][num_sat2][2]
+                num_sat3 = ((i + 1) % num_orbits) * num_sats_per_orbit + j
+                x3 = sat_cbf[cur_time][num_sat3][0]
+                y3 = sat_cbf[cur_time][num_sat3][1]
+                z3 = sat_cbf[cur_time][num_sat3][2]
+                delay1 = math.sqrt(
+                    np.square(x1 - x2) + np.square(y1 - y2) +
+                    np.square(z1 - z2)) / (17.31 / 29.5 * 299792.458) * 1000
+                delay2 = math.sqrt(
+                    np.square(x1 - x3) + np.square(y1 - y3) +
+                    np.square(z1 - z3)) / (17.31 / 29.5 * 299792.458) * 1000
+                delay_matrix[num_sat1][num_sat2] = delay1
+                delay_matrix[num_sat2][num_sat1] = delay1
+                delay_matrix[num_sat1][num_sat3] = delay2
+                delay_matrix[num_sat3][num_sat1] = delay2
+        sink(cur_time, delay_matrix)
+        for i in range(len(delay_matrix)):
+            delay_matrix[i, ...] = 0
+
+
+def bench(orbit_number, sat_number, duration):
+    sat_num = orbit_number * sat_number
+    fac_num = len(GS_LAT_LONG)
+    satrecs = sn_walker_satrecs(53, 550, orbit_number, sat_number, 180, 15)
+    sat_teme, sat_cbf, sat_lla = sn_propagate(satrecs, duration, 1)
+    fac_cbf = sn_geodetic_to_ecef(GS_LAT_LONG)
+    observer = Observer('', '', 53, 550, orbit_number, sat_number, 180, 15,
+                        duration, 1, ANTENNA_NUMBER, GS_LAT_LONG, 25, 'OSPF',
+                        10, [])
+    bound_dis = observer.calculate_bound(25, 550) * 29.5 / 17.31
+    inclination = np.radians(53)
+    alpha = np.degrees(
+        np.arccos(6371 / (6371 + 550) *
+                  np.cos(np.radians(inclination)))) - inclination
+    # Plain lists, as the original code received them.
+    cbf_list = sat_cbf.tolist()
+    lla_list = sat_lla.tolist()
+    fac_list = fac_cbf.tolist()
+
+    start = time.time()
+    legacy_access(cbf_list, fac_list, fac_num, sat_num, orbit_number,
+                  sat_number, duration, GS_LAT_LONG, lla_list, bound_dis,
+                  alpha, ANTENNA_NUMBER, lambda t, m: None)
+    legacy_time = time.time() - start
+
+    start = time.time()
+    gsl_sat, gsl_delay = sn_gsl_delays(sat_cbf, sat_lla, fac_cbf, GS_LAT_LONG,
+                                       bound_dis, alpha, ANTENNA_NUMBER)
+    isl_delay = sn_isl_delays(sat_cbf, orbit_number, sat_number)
+    kernel_time = time.time() - start
+
+    mismatches = []
+
+    def check(t, matrix):
+        dense = sn_delay_matrix(gsl_sat[t], gsl_delay[t], isl_delay[t],
+                                fac_num, sat_num, orbit_number, sat_number)
+        if not np.array_equal(dense, matrix):
+            mismatches.append(t)
+
+    legacy_access(cbf_list, fac_list, fac_num, sat_num, orbit_number,
+                  sat_number, duration, GS_LAT_LONG, lla_list, bound_dis,
+                  alpha, ANTENNA_NUMBER, check)
+    print("%5d satellites x %d s: legacy %.3f s, kernel %.4f s, "
+          "speedup %.0fx, identical: %s" %
+          (sat_num, duration, legacy_time, kernel_time,
+           legacy_time / kernel_time, not mismatches))
+
+
+if __name__ == '__main__':
+    duration = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    for orbit_number, sat_number in SHELLS:
+        bench(orbit_number, sat_number, duration)